@@ -3,6 +3,9 @@ from . import group
 from . import tag
 from . import profile
 from . import utils
+from . import properties
+from . import sampling
+from . import registry
 from . import attribute
 from . import quality
 from . import ellipse
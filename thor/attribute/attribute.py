@@ -1,111 +1,66 @@
 """Functions for getting object attributes."""
 
 from thor.attribute import core, group, profile, utils, quality, tag, ellipse
+from thor.attribute import registry
 from thor.log import setup_logger
 
 logger = setup_logger(__name__)
 
-record_dispatcher = {
-    "core": core.record,
-    "group": group.record,
-    "profile": profile.record,
-    "quality": quality.record,
-    "tag": tag.record,
-    "ellipse": ellipse.record,
-}
-
-
-def get_record_arguments(
-    attributes_type,
-    input_records,
-    attributes,
-    object_tracks,
-    object_options,
-    attribute_options,
-    grid_options,
-    member_object=None,
-):
-    """Get the arguments for the specific record functions."""
-    core_arguments = [attributes, object_tracks, attribute_options, grid_options]
-    core_arguments += [member_object]
-    group_arguments = [attributes, object_tracks, attribute_options, member_object]
-    profile_arguments = [input_records, attributes, object_tracks, attribute_options]
-    profile_arguments += [grid_options, member_object]
-    quality_arguments = [input_records, attributes, object_tracks, object_options]
-    quality_arguments += [attribute_options, member_object]
-    tag_arguments = [input_records, attributes, object_tracks, attribute_options]
-    tag_arguments += [member_object]
-    ellipse_arguments = [attributes, object_tracks, attribute_options, grid_options]
-    ellipse_arguments += [member_object]
-    argument_dispatcher = {
-        "core": core_arguments,
-        "group": group_arguments,
-        "profile": profile_arguments,
-        "quality": quality_arguments,
-        "tag": tag_arguments,
-        "ellipse": ellipse_arguments,
-    }
-    return argument_dispatcher[attributes_type]
-
-
-# @memory_profile
+# Register the built in attribute types. Types reading core attributes through
+# attribute_from_core depend on core.
+core_inputs = ["attributes", "object_tracks", "attribute_options", "grid_options"]
+core_inputs += ["member_object"]
+registry.register("core", core.record, core_inputs)
+group_inputs = ["attributes", "object_tracks", "attribute_options", "grid_options"]
+group_inputs += ["member_object"]
+registry.register("group", group.record, group_inputs, depends=["core"])
+profile_inputs = ["input_records", "attributes", "object_tracks", "attribute_options"]
+profile_inputs += ["grid_options", "member_object"]
+registry.register("profile", profile.record, profile_inputs, depends=["core"])
+quality_inputs = ["input_records", "attributes", "object_tracks", "object_options"]
+quality_inputs += ["attribute_options", "member_object"]
+registry.register("quality", quality.record, quality_inputs, depends=["core"])
+tag_inputs = ["input_records", "attributes", "object_tracks", "attribute_options"]
+tag_inputs += ["member_object"]
+registry.register("tag", tag.record, tag_inputs, depends=["core"])
+ellipse_inputs = ["attributes", "object_tracks", "attribute_options", "grid_options"]
+ellipse_inputs += ["member_object"]
+registry.register("ellipse", ellipse.record, ellipse_inputs, depends=["core"])
+
+
 def record_detected(time, input_records, object_tracks, object_options, grid_options):
     """Get detected object attributes."""
-    all_attribute_options = object_options["attributes"]
     # Get the object attributes of each type, e.g. core, tag, profile
-    for attributes_type in all_attribute_options.keys():
-        attribute_options = all_attribute_options[attributes_type]
-        attributes = object_tracks["current_attributes"][attributes_type]
-        record_func = record_dispatcher[attributes_type]
-        args = [input_records, attributes, object_tracks, object_options]
-        args += [attribute_options, grid_options]
-        args = get_record_arguments(attributes_type, *args)
-        record_func(*args)
+    registry.record_object(input_records, object_tracks, object_options, grid_options)
 
 
-# @memory_profile
 # But what if a member object is also a grouped object?
 def record_grouped(time, input_records, object_tracks, object_options, grid_options):
     """Get object attributes."""
+    args = [input_records, object_tracks, object_options, grid_options]
     # First get the attributes of each member object
-    member_options = object_options["attributes"]["member_objects"]
     member_attributes = object_tracks["current_attributes"]["member_objects"]
     for obj in member_attributes.keys():
-        obj_attributes = member_attributes[obj]
-        for attributes_type in obj_attributes.keys():
-            attribute_options = member_options[obj][attributes_type]
-            attributes = obj_attributes[attributes_type]
-            record_func = record_dispatcher[attributes_type]
-            args = [input_records, attributes, object_tracks, object_options]
-            args += [attribute_options, grid_options, obj]
-            args = get_record_arguments(attributes_type, *args)
-            record_func(*args)
+        registry.record_object(*args, obj)
     # Now get attributes of the grouped object
     obj = list(object_options["attributes"].keys() - {"member_objects"})[0]
-    obj_attributes = object_tracks["current_attributes"][obj]
-    for attributes_type in obj_attributes.keys():
-        attribute_options = object_options["attributes"][obj][attributes_type]
-        attributes = obj_attributes[attributes_type]
-        record_func = record_dispatcher[attributes_type]
-        args = [input_records, attributes, object_tracks, object_options]
-        args += [attribute_options, grid_options, obj]
-        args = get_record_arguments(attributes_type, *args)
-        record_func(*args)
+    registry.record_object(*args, obj)
 
 
 def append_attribute_type(current_attributes, attributes, attributes_type):
     """
-    Append current_attributes dictionary to attributes dictionary for a given
-    attribute type.
+    Append current_attributes dictionary to the columns of the attributes dictionary
+    for a given attribute type.
     """
     for attr in current_attributes[attributes_type].keys():
         if attributes_type == "profile" or attributes_type == "tag":
             for dataset in current_attributes[attributes_type][attr].keys():
-                attr_list = attributes[attributes_type][attr][dataset]
-                attr_list += current_attributes[attributes_type][attr][dataset]
+                column = attributes[attributes_type][attr][dataset]
+                values = current_attributes[attributes_type][attr][dataset]
+                utils.append_column(column, values)
         else:
-            attr_list = attributes[attributes_type][attr]
-            attr_list += current_attributes[attributes_type][attr]
+            column = attributes[attributes_type][attr]
+            utils.append_column(column, current_attributes[attributes_type][attr])
 
 
 def append_detected(object_tracks):
@@ -150,7 +105,7 @@ def record(time, input_records, object_tracks, object_options, grid_options):
     # objects previously identified in the "previous" grid. The iteration corresponding
     # to time then records the attributes of the objects identified in the "previous"
     # grid. The name "current_attributes" is thus perhaps misleading.
-    object_tracks["current_attributes"] = utils.initialize_attributes(object_options)
+    utils.reset_attributes(object_tracks["current_attributes"])
 
     if "detection" in object_options:
         record_func = record_detected
@@ -11,9 +11,8 @@ import numpy as np
 import xarray as xr
 from thor.log import setup_logger
 import thor.grid as grid
-from thor.object.object import get_object_center
-import thor.grid as grid
 import thor.attribute.utils as utils
+import thor.attribute.properties as properties
 
 logger = setup_logger(__name__)
 
@@ -87,6 +86,32 @@ def coordinate(name, method=None, description=None, tracked=True):
     return utils.get_attribute_dict(*args)
 
 
+def weighted_coordinate(name, method=None, description=None, tracked=True):
+    """
+    Options for field weighted coordinate attributes, i.e. the position of the gridcell
+    area and field weighted centroid of the object mask, e.g. the reflectivity weighted
+    center of a cell. These are taken from the mask for tracked and untracked objects.
+    """
+    data_type = float
+    precision = 4
+    if name == "weighted_latitude":
+        units = "degrees_north"
+    elif name == "weighted_longitude":
+        units = "degrees_east"
+    else:
+        message = "Weighted coordinate must be 'weighted_latitude' or "
+        message += "'weighted_longitude'."
+        raise ValueError(message)
+    if method is None:
+        method = {"function": "weighted_coordinates_from_mask"}
+    if description is None:
+        description = f"{name} position of the gridcell area and field weighted "
+        description += "centroid of the object mask, weighted by the grid the object "
+        description += "was detected in."
+    args = [name, method, data_type, precision, description, units]
+    return utils.get_attribute_dict(*args)
+
+
 def velocity(name, method=None, description=None, tracked=True):
     """
     Options for velocity attributes. Velocities only defined for tracked objects.
@@ -144,6 +169,8 @@ attribute_dispatcher = {
     "universal_id": identity,
     "latitude": coordinate,
     "longitude": coordinate,
+    "weighted_latitude": weighted_coordinate,
+    "weighted_longitude": weighted_coordinate,
     "u_flow": velocity,
     "v_flow": velocity,
     "u_displacement": velocity,
@@ -154,7 +181,6 @@ attribute_dispatcher = {
 
 
 # Functions for obtaining and recording core attributes
-# @memory_profile
 def coordinates_from_object_record(object_tracks, grid_options):
     """
     Get coordinate from object record created by the matching process to avoid
@@ -174,7 +200,6 @@ def coordinates_from_object_record(object_tracks, grid_options):
     return latitudes, longitudes
 
 
-# @memory_profile
 def areas_from_object_record(object_tracks, attribute_options):
     """
     Get area from object record created by the matching process to avoid redundant
@@ -213,69 +238,59 @@ def velocities_from_object_record(name, object_tracks, attribute_options, grid_o
     return v_list, u_list
 
 
-# @memory_profile
 def coordinates_from_mask(
     object_tracks, attribute_options, grid_options, member_object
 ):
     """Get object coordinate from mask."""
-    mask = utils.get_previous_mask(attribute_options, object_tracks)
-    # If examining just a member of a grouped object, get masks for that object
-    if member_object is not None and isinstance(mask, xr.Dataset):
-        mask = mask[f"{member_object}_mask"]
-    gridcell_area = object_tracks["gridcell_area"]
+    args = [attribute_options, object_tracks, member_object]
+    inventory = utils.get_previous_inventory(*args)
     ids = ids_from_mask(object_tracks, attribute_options, member_object)
+    lats, lons = properties.get_coordinates(inventory, ids, grid_options)
+    lats = lats.astype(attribute_options["latitude"]["data_type"])
+    lons = lons.astype(attribute_options["longitude"]["data_type"])
+    return lats, lons
 
-    lats, lons = [], []
-    for obj_id in ids:
-        row, col = get_object_center(obj_id, mask, grid_options, gridcell_area)[:2]
-        if grid_options["name"] == "geographic":
-            lats.append(grid_options["latitude"][row])
-            lons.append(grid_options["longitude"][col])
-        elif grid_options["name"] == "cartesian":
-            lats.append(grid_options["latitude"][row, col])
-            lons.append(grid_options["longitude"][row, col])
 
-    lats = np.array(lats).astype(attribute_options["latitude"]["data_type"])
-    lons = np.array(lons).astype(attribute_options["longitude"]["data_type"])
+def weighted_coordinates_from_mask(
+    object_tracks, attribute_options, grid_options, member_object, ids
+):
+    """
+    Get the coordinates of the field weighted centroids of objects ids from the mask,
+    weighting by the processed grid the mask was obtained from.
+    """
+    args = [attribute_options, object_tracks, member_object]
+    inventory = utils.get_previous_inventory(*args)
+    grid = object_tracks["previous_grids"][-1]
+    if member_object is not None:
+        grid = grid[f"{member_object}_grid"]
+    args = [inventory, ids, grid, grid.name, grid_options]
+    lats, lons = properties.get_weighted_coordinates(*args)
+    lats = lats.astype(attribute_options["weighted_latitude"]["data_type"])
+    lons = lons.astype(attribute_options["weighted_longitude"]["data_type"])
     return lats, lons
 
 
-# @memory_profile
 def areas_from_mask(object_tracks, attribute_options, grid_options, member_object):
     """Get object area from mask."""
-    mask = utils.get_previous_mask(attribute_options, object_tracks)
-    # If examining just a member of a grouped object, get masks for that object
-    if member_object is not None and isinstance(mask, xr.Dataset):
-        mask = mask[f"{member_object}_mask"]
-
-    gridcell_area = object_tracks["gridcell_area"]
+    args = [attribute_options, object_tracks, member_object]
+    inventory = utils.get_previous_inventory(*args)
     ids = ids_from_mask(object_tracks, attribute_options, member_object)
-
-    areas = []
-    for obj_id in ids:
-        area = get_object_center(obj_id, mask, grid_options, gridcell_area)[2]
-        areas.append(area)
-
-    areas = np.array(areas).astype(attribute_options["area"]["data_type"])
-    return areas
+    areas = properties.get_areas(inventory, ids)
+    return areas.astype(attribute_options["area"]["data_type"])
 
 
 def ids_from_mask(object_tracks, attribute_options, member_object):
     """Get object ids from a labelled mask."""
-    previous_mask = utils.get_previous_mask(attribute_options, object_tracks)
-    if previous_mask is None:
+    inventory = utils.get_previous_inventory(attribute_options, object_tracks)
+    if inventory is None:
         return None
     if member_object is not None:
-        previous_mask = previous_mask[f"{member_object}_mask"]
-    if isinstance(previous_mask, xr.Dataset):
-        ids = []
-        for variable in list(previous_mask.data_vars):
-            ids += np.unique(previous_mask[variable].values).tolist()
-        ids = np.unique(ids)
-        ids = sorted(ids[ids != 0])
-    elif isinstance(previous_mask, xr.DataArray):
-        ids = np.unique(previous_mask)
-        ids = sorted(list(ids[ids != 0]))
+        inventory = inventory[f"{member_object}_mask"]
+    if isinstance(inventory, dict):
+        ids = np.unique([obj for inv in inventory.values() for obj in inv.ids])
+        ids = sorted(ids)
+    else:
+        ids = sorted(list(inventory.ids))
     return ids
 
 
@@ -290,6 +305,7 @@ def ids_from_object_record(name, object_tracks):
 get_attributes_dispatcher = {
     "coordinates_from_object_record": coordinates_from_object_record,
     "coordinates_from_mask": coordinates_from_mask,
+    "weighted_coordinates_from_mask": weighted_coordinates_from_mask,
     "areas_from_object_record": areas_from_object_record,
     "areas_from_mask": areas_from_mask,
     "velocities_from_object_record": velocities_from_object_record,
@@ -326,6 +342,29 @@ def record_coordinates(
     attributes["longitude"] += list(lons)
 
 
+def record_weighted_coordinates(
+    attributes, attribute_options, object_tracks, grid_options, member_object, ids
+):
+    """Record the coordinates of the field weighted centroids of objects."""
+    keys = attributes.keys()
+    if not "weighted_latitude" in keys or not "weighted_longitude" in keys:
+        message = "Both weighted_latitude and weighted_longitude must be specified."
+        raise ValueError(message)
+    func = attribute_options["weighted_latitude"]["method"]["function"]
+    lon_func = attribute_options["weighted_longitude"]["method"]["function"]
+    if func != lon_func:
+        message = "Functions for acquiring weighted coordinates must be the same."
+        raise ValueError(message)
+    get = get_attributes_dispatcher.get(func)
+    if get is None:
+        message = f"Function {func} for obtaining weighted coordinates not recognised."
+        raise ValueError(message)
+    args = [object_tracks, attribute_options, grid_options, member_object, ids]
+    lats, lons = get(*args)
+    attributes["weighted_latitude"] += list(lats)
+    attributes["weighted_longitude"] += list(lons)
+
+
 def record_velocities(
     attributes, attribute_options, object_tracks, grid_options, velocity_type
 ):
@@ -381,7 +420,6 @@ def get_ids(object_tracks, attribute_options, member_object):
 
 
 # Record core attributes
-# @memory_profile
 def record(
     attributes,
     object_tracks,
@@ -408,6 +446,10 @@ def record(
         args = [attributes, attribute_options, object_tracks, grid_options]
         args += [member_object]
         record_coordinates(*args)
+    if "weighted_latitude" in keys or "weighted_longitude" in keys:
+        args = [attributes, attribute_options, object_tracks, grid_options]
+        args += [member_object, ids]
+        record_weighted_coordinates(*args)
     if "u_flow" in keys and "v_flow" in keys:
         args = [attributes, attribute_options, object_tracks, grid_options, "flow"]
         record_velocities(*args)
@@ -424,6 +466,7 @@ def record(
         "areas_from_mask": areas_args,
     }
     processed_attributes = ["time", id_type, "latitude", "longitude"]
+    processed_attributes += ["weighted_latitude", "weighted_longitude"]
     processed_attributes += ["u_flow", "v_flow", "u_displacement", "v_displacement"]
     remaining_attributes = [attr for attr in keys if attr not in processed_attributes]
     for name in remaining_attributes:
@@ -10,6 +10,7 @@ from thor.log import setup_logger
 from thor.attribute import core
 import thor.grid as grid
 import thor.attribute.utils as utils
+import thor.attribute.properties as properties
 
 logger = setup_logger(__name__)
 # Set the number of cv2 threads to 0 to avoid crashes.
@@ -30,7 +31,7 @@ def coordinate(name, method=None, description=None):
     else:
         raise ValueError(f"Coordinate must be 'latitude' or 'longitude'.")
     if method is None:
-        method = {"function": "from_mask"}
+        method = {"function": "from_mask", "args": {"engine": "moments"}}
     if description is None:
         description = f"{name} coordinate of the center of the ellipse fit. "
     args = [name, method, data_type, precision, description, units]
@@ -45,7 +46,7 @@ def axis(name="major", method=None, description=None):
     precision = 1
     units = "km"
     if method is None:
-        method = {"function": "from_mask"}
+        method = {"function": "from_mask", "args": {"engine": "moments"}}
     if description is None:
         description = f"{name} axis from ellipse fitted to object mask."
     args = [name, method, data_type, precision, description, units]
@@ -61,7 +62,7 @@ def orientation(method=None, description=None):
     precision = 4
     units = "radians"
     if method is None:
-        method = {"function": "from_mask"}
+        method = {"function": "from_mask", "args": {"engine": "moments"}}
     if description is None:
         description = f"The orientation of the ellipse fit to the object mask."
     args = [name, method, data_type, precision, description, units]
@@ -77,7 +78,7 @@ def eccentricity(method=None, description=None):
     precision = 4
     units = None
     if method is None:
-        method = {"function": "from_mask"}
+        method = {"function": "from_mask", "args": {"engine": "moments"}}
     if description is None:
         description = f"The eccentricity of the ellipse fit to the object mask."
     args = [name, method, data_type, precision, description, units]
@@ -127,14 +128,127 @@ def geographic_pixel_to_distance(latitude, longitude, spacing, axis, orientation
     lat_distance = axis * np.sin(orientation) * spacing[0]
     new_latitude = latitude + lat_distance
     new_longitude = longitude + lon_distance
-    distance = grid.geodesic_distance(longitude, latitude, new_longitude, new_latitude)
+    # Geod.inv operates on whole arrays, so call it directly
+    distance = grid.geod.inv(longitude, latitude, new_longitude, new_latitude)[2]
     return distance / 1e3
 
 
-def cv2_ellipse(mask, id, grid_options):
+def pixel_to_distance(latitude, longitude, axis, orientation, grid_options):
+    """Convert ellipse axis lengths in pixels to km for either grid type."""
+    if grid_options["name"] == "cartesian":
+        spacing = grid_options["cartesian_spacing"]
+        return cartesian_pixel_to_distance(spacing, axis, orientation)
+    elif grid_options["name"] == "geographic":
+        spacing = grid_options["geographic_spacing"]
+        args = [latitude, longitude, spacing, axis, orientation]
+        return geographic_pixel_to_distance(*args)
+    else:
+        raise ValueError("Grid must be 'cartesian' or 'geographic'.")
+
+
+def interpolate_coordinates(rows, cols, grid_options):
+    """
+    Linearly interpolate latitude and longitude at fractional pixel coordinates.
+    """
+    lats = np.asarray(grid_options["latitude"])
+    lons = np.asarray(grid_options["longitude"])
+    if grid_options["name"] == "geographic":
+        latitude = np.interp(rows, np.arange(len(lats)), lats)
+        longitude = np.interp(cols, np.arange(len(lons)), lons)
+        return latitude, longitude
+    elif grid_options["name"] != "cartesian":
+        raise ValueError("Grid must be 'cartesian' or 'geographic'.")
+    # Bilinear interpolation of the two dimensional coordinate arrays
+    row_0 = np.clip(np.floor(rows).astype(int), 0, lats.shape[0] - 2)
+    col_0 = np.clip(np.floor(cols).astype(int), 0, lats.shape[1] - 2)
+    row_weight, col_weight = rows - row_0, cols - col_0
+    coordinates = []
+    for coordinate in [lats, lons]:
+        top = coordinate[row_0, col_0] * (1 - col_weight)
+        top += coordinate[row_0, col_0 + 1] * col_weight
+        bottom = coordinate[row_0 + 1, col_0] * (1 - col_weight)
+        bottom += coordinate[row_0 + 1, col_0 + 1] * col_weight
+        coordinates.append(top * (1 - row_weight) + bottom * row_weight)
+    return tuple(coordinates)
+
+
+def moment_ellipses(inventory, ids, grid_options):
+    """
+    Get the ellipses of objects ids from the second order moments of their pixels. The
+    ellipse with the same moments as an object has axis lengths four times the square
+    roots of the eigenvalues of the object's covariance matrix. All objects are
+    processed at once; properties of objects absent from the mask are NaN.
+    """
+    ids = np.asarray(ids, dtype=int)
+    moments = properties.get_moments(inventory)
+    present = (ids > 0) & (ids <= inventory.max_id)
+    indices = np.where(present, ids, 0)
+    present &= moments["count"][indices] > 0
+    row, col = moments["row"][indices], moments["col"][indices]
+    row_row, col_col = moments["row_row"][indices], moments["col_col"][indices]
+    row_col = moments["row_col"][indices]
+
+    mean = (row_row + col_col) / 2
+    radius = np.sqrt(((col_col - row_row) / 2) ** 2 + row_col**2)
+    axis_1 = 4 * np.sqrt(mean + radius)
+    axis_2 = 4 * np.sqrt(np.maximum(mean - radius, 0))
+    # Orientation of the first axis, measured from the column axis towards the row axis
+    orientation = 0.5 * np.arctan2(2 * row_col, col_col - row_row)
+
+    latitude, longitude = interpolate_coordinates(row, col, grid_options)
+    args = [latitude, longitude, axis_1, orientation, grid_options]
+    axis_1 = pixel_to_distance(*args)
+    args[2:4] = [axis_2, orientation + np.pi / 2]
+    axis_2 = pixel_to_distance(*args)
+
+    # For unequal row and column spacings the first axis may not be the longest
+    major = np.maximum(axis_1, axis_2)
+    minor = np.minimum(axis_1, axis_2)
+    orientation = np.where(axis_1 >= axis_2, orientation, orientation - np.pi / 2)
+    orientation = orientation % np.pi
+    with np.errstate(invalid="ignore", divide="ignore"):
+        eccentricity = np.sqrt(1 - (minor / major) ** 2)
+    ellipse_properties = [latitude, longitude, major, minor, orientation, eccentricity]
+    return [np.where(present, prop, np.nan) for prop in ellipse_properties]
+
+
+def cv2_ellipses(inventory, ids, grid_options):
+    """
+    Get the ellipses of objects ids by fitting ellipses to the convex hulls of each
+    object using cv2. Slower than moment_ellipses, but fits the object outline.
+    """
+    mask = inventory.values
+    all_properties = []
+    for id in ids:
+        # Pad the bounding box so the hull contour does not touch its edges
+        roi = inventory.get_roi(id, margin=1)
+        if roi is None:
+            all_properties.append([np.nan] * 6)
+        else:
+            all_properties.append(cv2_ellipse(mask, id, grid_options, roi=roi))
+    return [
+        [object_properties[i] for object_properties in all_properties] for i in range(6)
+    ]
+
+
+ellipse_engine_dispatcher = {"moments": moment_ellipses, "cv2": cv2_ellipses}
+
+
+def cv2_ellipse(mask, id, grid_options, roi=None):
+    """
+    Fit an ellipse to the convex hull of object id. If roi is provided, the hull and
+    contour are calculated only within the object's region of interest.
+    """
     lats, lons = grid_options["latitude"], grid_options["longitude"]
-    hull = convex_hull_image(mask == id).astype(np.uint8)
-    contours = cv2.findContours(hull, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[0]
+    if roi is None:
+        roi = (slice(None), slice(None))
+    obj_mask = np.asarray(mask)[roi] == id
+    hull = convex_hull_image(obj_mask).astype(np.uint8)
+    # Offset the contour so it is expressed in the pixel coordinates of the full mask
+    offset = (roi[1].start or 0, roi[0].start or 0)
+    contours = cv2.findContours(
+        hull, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE, offset=offset
+    )[0]
 
     # Check if small object, and pad if necessary
     if len(contours[0]) > 6:
@@ -188,14 +302,19 @@ def from_mask(
     object_tracks,
     grid_options,
     member_object=None,
+    engine="moments",
 ):
     """
-    Get ellipse properties from object mask.
+    Get ellipse properties from object mask. The engine is either "moments", which
+    obtains the ellipses of all objects at once from their second order moments, or
+    "cv2", which fits an ellipse to the convex hull of each object.
     """
-    mask = utils.get_previous_mask(attribute_options, object_tracks)
-    # If examining just a member of a grouped object, get masks for that object
-    if member_object is not None and isinstance(mask, xr.Dataset):
-        mask = mask[f"{member_object}_mask"]
+    get_ellipses = ellipse_engine_dispatcher.get(engine)
+    if get_ellipses is None:
+        engines = list(ellipse_engine_dispatcher.keys())
+        raise ValueError(f"Ellipse engine must be one of {engines}.")
+    args = [attribute_options, object_tracks, member_object]
+    inventory = utils.get_previous_inventory(*args)
 
     if "universal_id" in attribute_options:
         id_type = "universal_id"
@@ -206,14 +325,10 @@ def from_mask(
 
     all_names = ["latitude", "longitude", "major", "minor", "orientation"]
     all_names += ["eccentricity"]
-    all_attributes = {name: [] for name in all_names}
-
-    for id in ids:
-        ellipse_properties = cv2_ellipse(mask, id, grid_options)
-        for i, name in enumerate(all_names):
-            all_attributes[name].append(ellipse_properties[i])
-
-    ellipse_attributes = {key: all_attributes[key] for key in all_attributes.keys()}
+    ellipse_properties = get_ellipses(inventory, ids, grid_options)
+    ellipse_attributes = {}
+    for i, name in enumerate(all_names):
+        ellipse_attributes[name] = list(ellipse_properties[i])
     return ellipse_attributes
 
 
@@ -240,7 +355,7 @@ def record_ellipse(
         message += "not recognised."
         raise ValueError(message)
     from_mask_args = [attributes, attribute_options, object_tracks, grid_options]
-    from_mask_args += [member_object]
+    from_mask_args += [member_object, method.get("args", {}).get("engine", "moments")]
     args_dispatcher = {"from_mask": from_mask_args}
     args = args_dispatcher[method["function"]]
     ellipse = get_ellipse(*args)
@@ -11,6 +11,7 @@ import thor.attribute.core as core
 import numpy as np
 import thor.grid as grid
 import thor.attribute.utils as utils
+import thor.attribute.properties as properties
 
 logger = setup_logger(__name__)
 
@@ -58,9 +59,8 @@ def default(names=None, matched=True):
 
 
 # Functions for obtaining and recording attributes
-def offset_from_centers(name, object_tracks, attribute_options):
+def offset_from_centers(name, object_tracks, attribute_options, grid_options):
     """Calculate offset between object centers."""
-    member_attributes = object_tracks["current_attributes"]["member_objects"]
     objects = attribute_options[name]["method"]["args"]["objects"]
     grouped_object = object_tracks["name"]
     if len(objects) != 2:
@@ -71,20 +71,13 @@ def offset_from_centers(name, object_tracks, attribute_options):
     else:
         id_type = "id"
     ids = np.array(core_attributes[id_type])
-    ids_1 = np.array(member_attributes[objects[0]]["core"][id_type])
-    ids_2 = np.array(member_attributes[objects[1]]["core"][id_type])
-    lats1 = np.array(member_attributes[objects[0]]["core"]["latitude"])
-    lons1 = np.array(member_attributes[objects[0]]["core"]["longitude"])
-    lats2 = np.array(member_attributes[objects[1]]["core"]["latitude"])
-    lons2 = np.array(member_attributes[objects[1]]["core"]["longitude"])
-
-    lats3, lons3, lats4, lons4 = [], [], [], []
-    # Re-order the arrays so that the ids match
-    for i in range(len(ids)):
-        lats3.append(lats1[ids_1 == ids[i]][0])
-        lons3.append(lons1[ids_1 == ids[i]][0])
-        lats4.append(lats2[ids_2 == ids[i]][0])
-        lons4.append(lons2[ids_2 == ids[i]][0])
+    # Get the member object centers from the region properties of the member masks
+    coordinates = []
+    for obj in objects:
+        args = [attribute_options, object_tracks, obj]
+        inventory = utils.get_previous_inventory(*args)
+        coordinates += properties.get_coordinates(inventory, ids, grid_options)
+    lats3, lons3, lats4, lons4 = coordinates
 
     args = [lats3, lons3, lats4, lons4]
     y_offsets, x_offsets = grid.geographic_to_cartesian_displacement(*args)
@@ -99,7 +92,7 @@ get_attributes_dispatcher = {
 }
 
 
-def record_offsets(attributes, attribute_options, object_tracks):
+def record_offsets(attributes, attribute_options, object_tracks, grid_options):
     """Record offset."""
     keys = attributes.keys()
     if "x_offset" not in keys or "y_offset" not in keys:
@@ -115,7 +108,7 @@ def record_offsets(attributes, attribute_options, object_tracks):
         message = f"Function {get_offsets_function} for obtaining x_offset and y_offset not recognised."
         raise ValueError(message)
 
-    offset_args = ["y_offset", object_tracks, attribute_options]
+    offset_args = ["y_offset", object_tracks, attribute_options, grid_options]
     args_dispatcher = {"offset_from_centers": offset_args}
     args = args_dispatcher[get_offsets_function]
     y_offsets, x_offsets = get_offsets(*args)
@@ -127,6 +120,7 @@ def record(
     attributes,
     object_tracks,
     attribute_options,
+    grid_options,
     member_object=None,
 ):
     """Get group object attributes."""
@@ -150,4 +144,5 @@ def record(
 
     # Get non-core attributes
     if "x_offset" in keys and "y_offset" in keys:
-        record_offsets(attributes, attribute_options, object_tracks)
+        args = [attributes, attribute_options, object_tracks, grid_options]
+        record_offsets(*args)
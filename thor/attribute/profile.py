@@ -7,7 +7,7 @@ from itertools import chain
 from thor.log import setup_logger
 import thor.attribute.core as core
 import thor.attribute.utils as utils
-import xarray as xr
+import thor.attribute.sampling as sampling
 
 logger = setup_logger(__name__)
 
@@ -111,37 +111,68 @@ def default(datasets, names=None, matched=True):
     return attributes
 
 
-def from_pressure_levels(names, previous_time, lats, lons, ds, grid_options):
+def from_pressure_levels(names, previous_time, lats, lons, sampler, grid_options):
     """Get vertical profiles from data on pressure levels."""
 
+    ds = sampler["dataset"]
     if "pressure" not in ds.coords or "geopotential" not in ds.data_vars:
         raise ValueError("Dataset must contain pressure levels or geopotential.")
 
     logger.debug(f"Interpolating from pressure levels to altitude using geopotential.")
-    ds["longitude"] = ds["longitude"] % 360
-    profiles = ds[names + ["geopotential"]]
-
-    lats_da = xr.DataArray(lats, dims="points")
-    lons_da = xr.DataArray(lons, dims="points")
-    lons_da = lons_da % 360
-    args_dict = {"latitude": lats_da, "longitude": lons_da}
-    args_dict.update({"time": previous_time.astype("datetime64[ns]")})
-    args_dict.update({"method": "linear"})
-    profiles = profiles.interp(**args_dict)
-
-    profiles["altitude"] = profiles["geopotential"] / 9.80665
+    args = [sampler, names + ["geopotential"], previous_time, lats, lons]
+    profiles = sampling.sample(*args)
+
+    # Interpolate all profiles from pressure levels to altitude at once
+    altitudes = profiles["geopotential"] / 9.80665
     new_altitudes = np.array(grid_options["altitude"])
-    profile_dict = {name: [] for name in names}
-    for i in range(len(profiles.points)):
-        profile = profiles.isel(points=i)
-        profile = profile.swap_dims({"pressure": "altitude"})
-        profile = profile.drop_vars(["geopotential"])
-        profile = profile.interp(altitude=new_altitudes)
-        for name in names:
-            profile_dict[name] += list(profile[name].values)
+    profile_dict = {}
+    for name in names:
+        args = [altitudes, profiles[name], new_altitudes]
+        profile_dict[name] = list(interpolate_columns(*args).ravel())
     return profile_dict
 
 
+def interpolate_columns(x, y, new_x):
+    """
+    Linearly interpolate each row of y, given at the coordinates in the corresponding
+    row of x, to the coordinates new_x. Rows of x need not be sorted, but each must be
+    monotonic once sorted. Values outside the range of a row, and rows containing
+    non-finite coordinates, are NaN.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Array of shape (points, levels) giving the coordinates of each profile.
+    y : np.ndarray
+        Array of shape (points, levels) giving the values of each profile.
+    new_x : np.ndarray
+        One dimensional array of the coordinates to interpolate to.
+
+    Returns
+    -------
+    new_y : np.ndarray
+        Array of shape (points, len(new_x)) of the interpolated profiles.
+    """
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    new_x = np.asarray(new_x, dtype=float)
+    order = np.argsort(x, axis=1)
+    x = np.take_along_axis(x, order, axis=1)
+    y = np.take_along_axis(y, order, axis=1)
+    # Find the lower bracketing level of each new coordinate in each row
+    lower = (x[:, None, :] <= new_x[None, :, None]).sum(axis=2) - 1
+    lower = np.clip(lower, 0, x.shape[1] - 2)
+    x_0 = np.take_along_axis(x, lower, axis=1)
+    x_1 = np.take_along_axis(x, lower + 1, axis=1)
+    y_0 = np.take_along_axis(y, lower, axis=1)
+    y_1 = np.take_along_axis(y, lower + 1, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(x_1 > x_0, (new_x - x_0) / (x_1 - x_0), 0)
+    new_y = y_0 + weight * (y_1 - y_0)
+    outside = (new_x < x[:, :1]) | (new_x > x[:, -1:])
+    outside |= ~np.all(np.isfinite(x), axis=1, keepdims=True)
+    return np.where(outside, np.nan, new_y)
+
+
 interpolate_dispatcher = {
     "era5_pl": from_pressure_levels,
 }
@@ -164,9 +195,9 @@ def from_centers(names, input_records, attributes, object_tracks, method, grid_o
     previous_time = object_tracks["previous_times"][-1]
     lats = attributes["latitude"]
     lons = attributes["longitude"]
-    ds = tag_input_records[method["dataset"]]["dataset"]
+    sampler = sampling.get_sampler(tag_input_records[method["dataset"]])
     interp = interpolate_dispatcher.get(method["dataset"])
-    profiles = interp(names, previous_time, lats, lons, ds, grid_options)
+    profiles = interp(names, previous_time, lats, lons, sampler, grid_options)
     return profiles
 
 
@@ -0,0 +1,178 @@
+"""
+Region properties of labelled object masks. In the spirit of skimage's regionprops, the
+pixel counts, areas, centroids and bounding boxes of all objects in a mask are obtained
+together from labelled reductions over the mask, rather than by scanning the mask once
+per object. The properties are stored with the mask inventory, so the core, group,
+ellipse and quality attributes share them.
+"""
+
+import numpy as np
+import thor.object.label as label
+from thor.log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def calculate_properties(inventory):
+    """Calculate the region properties of all objects in the inventory."""
+    properties = {"count": inventory.counts, "area": inventory.areas}
+    properties["centroid"] = inventory.centroids
+    properties["center"] = inventory.centers
+    properties["bounding_box"] = inventory.slices
+    return properties
+
+
+def get_properties(inventory):
+    """
+    Get the region properties of all objects in a mask inventory.
+
+    Parameters
+    ----------
+    inventory : thor.object.label.LabeledMask
+        Inventory of the labelled mask.
+
+    Returns
+    -------
+    properties : dict
+        Dictionary of region properties. The "count", "area", "centroid" and "center"
+        entries are indexed by object id, with index 0 corresponding to the background.
+        Centroids are the unrounded gridcell area weighted (row, col) centers, and
+        centers the centroids rounded to the nearest gridcell. Entry i of
+        "bounding_box" gives the bounding slices of object i + 1.
+    """
+    return inventory.get_cached("properties", calculate_properties)
+
+
+def calculate_weighted_centroids(inventory, grid):
+    """
+    Calculate the gridcell area and field weighted centroids of all objects. NaN field
+    values are given zero weight.
+    """
+    areas = np.asarray(inventory.gridcell_area)
+    weights = np.nan_to_num(np.asarray(grid, dtype=float)) * areas
+    args = [inventory.values, weights, inventory.max_id + 1]
+    totals, row_sums, col_sums = label.get_weighted_sums(*args)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroid_rows = np.where(totals != 0, row_sums / totals, np.nan)
+        centroid_cols = np.where(totals != 0, col_sums / totals, np.nan)
+    return centroid_rows, centroid_cols
+
+
+def get_weighted_centroids(inventory, grid, field):
+    """
+    Get the gridcell area and field weighted centroids of all objects in a mask
+    inventory, indexed by object id. The result is stored with the inventory under the
+    name of the field, e.g. "reflectivity", so centroids weighted by different fields
+    of the same time step are stored separately.
+    """
+
+    def calculate(inventory):
+        return calculate_weighted_centroids(inventory, grid)
+
+    return inventory.get_cached(f"weighted_centroids_{field}", calculate)
+
+
+def get_boundary_areas(inventory, boundary_mask):
+    """
+    Get the area of each object lying on the domain boundary, indexed by object id,
+    from a single weighted bincount over the boundary pixels.
+    """
+    labels = inventory.values
+    boundary_mask = np.asarray(boundary_mask).astype(bool)
+    areas = np.broadcast_to(np.asarray(inventory.gridcell_area), labels.shape)
+    weights = areas[boundary_mask]
+    minlength = inventory.max_id + 1
+    return np.bincount(labels[boundary_mask], weights=weights, minlength=minlength)
+
+
+def calculate_moments(inventory):
+    """
+    Calculate the pixel centroids and second order central moments of all objects from
+    weighted bincounts over the mask. Each pixel is treated as a unit square, so a
+    variance of 1/12 is added to the row and column moments.
+    """
+    shape = inventory.values.shape
+    labels = inventory.values.ravel()
+    minlength = inventory.max_id + 1
+    rows, cols = np.divmod(np.arange(labels.size), shape[1])
+    counts = np.bincount(labels, minlength=minlength)
+    sums = {}
+    weights = {"row": rows, "col": cols, "row_row": rows * rows}
+    weights.update({"col_col": cols * cols, "row_col": rows * cols})
+    for key, weight in weights.items():
+        sums[key] = np.bincount(labels, weights=weight, minlength=minlength)
+    denominator = np.where(counts > 0, counts, 1)
+    moments = {"count": counts}
+    moments["row"] = sums["row"] / denominator
+    moments["col"] = sums["col"] / denominator
+    moments["row_row"] = sums["row_row"] / denominator - moments["row"] ** 2 + 1 / 12
+    moments["col_col"] = sums["col_col"] / denominator - moments["col"] ** 2 + 1 / 12
+    moments["row_col"] = sums["row_col"] / denominator
+    moments["row_col"] -= moments["row"] * moments["col"]
+    return moments
+
+
+def get_moments(inventory):
+    """
+    Get the pixel centroids and second order central moments of all objects in a mask
+    inventory. The returned dictionary contains the "count", "row", "col", "row_row",
+    "col_col" and "row_col" arrays, indexed by object id.
+    """
+    return inventory.get_cached("moments", calculate_moments)
+
+
+def get_coordinates(inventory, ids, grid_options):
+    """
+    Get the latitudes and longitudes of the gridcell area weighted centers of objects
+    ids. Coordinates of objects absent from the mask are NaN.
+    """
+    ids = np.asarray(ids, dtype=int)
+    properties = get_properties(inventory)
+    present = (ids > 0) & (ids <= inventory.max_id)
+    indices = np.where(present, ids, 0)
+    present &= properties["count"][indices] > 0
+    rows = properties["center"][0][indices]
+    cols = properties["center"][1][indices]
+    return get_pixel_coordinates(rows, cols, present, grid_options)
+
+
+def get_weighted_coordinates(inventory, ids, grid, field, grid_options):
+    """
+    Get the latitudes and longitudes of the gridcell area and field weighted centroids
+    of objects ids, rounded to the nearest gridcell; see get_weighted_centroids.
+    Coordinates of objects absent from the mask, or with no weight, are NaN.
+    """
+    ids = np.asarray(ids, dtype=int)
+    centroid_rows, centroid_cols = get_weighted_centroids(inventory, grid, field)
+    present = (ids > 0) & (ids <= inventory.max_id)
+    indices = np.where(present, ids, 0)
+    present &= ~np.isnan(centroid_rows[indices])
+    rows = np.round(np.where(present, centroid_rows[indices], 0)).astype(int)
+    cols = np.round(np.where(present, centroid_cols[indices], 0)).astype(int)
+    return get_pixel_coordinates(rows, cols, present, grid_options)
+
+
+def get_pixel_coordinates(rows, cols, present, grid_options):
+    """
+    Get the latitudes and longitudes of the gridcells (rows, cols), which are NaN where
+    present is False.
+    """
+    latitude = np.asarray(grid_options["latitude"])
+    longitude = np.asarray(grid_options["longitude"])
+    if grid_options["name"] == "geographic":
+        lats, lons = latitude[rows], longitude[cols]
+    elif grid_options["name"] == "cartesian":
+        lats, lons = latitude[rows, cols], longitude[rows, cols]
+    else:
+        raise ValueError("Grid must be 'cartesian' or 'geographic'.")
+    lats = np.where(present, lats, np.nan)
+    lons = np.where(present, lons, np.nan)
+    return lats, lons
+
+
+def get_areas(inventory, ids):
+    """Get the areas of objects ids, which are zero for objects absent from the mask."""
+    ids = np.asarray(ids, dtype=int)
+    areas = get_properties(inventory)["area"]
+    present = (ids > 0) & (ids < len(areas))
+    return np.where(present, areas[np.where(present, ids, 0)], 0)
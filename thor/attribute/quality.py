@@ -1,9 +1,10 @@
 """Functions for working with attributes related to quality control."""
 
+import numpy as np
 from thor.log import setup_logger
 import thor.attribute.core as core
 import thor.attribute.utils as utils
-import xarray as xr
+import thor.attribute.properties as properties
 
 logger = setup_logger(__name__)
 
@@ -73,22 +74,19 @@ def record_boundary_overlaps(
     input_record = input_records["track"][object_dataset]
     boundary_mask = input_record["previous_boundary_masks"][-1]
 
-    mask = utils.get_previous_mask(attribute_options, object_tracks)
-    # If examining just a member of a grouped object, get masks for that object
-    if member_object is not None and isinstance(mask, xr.Dataset):
-        mask = mask[f"{member_object}_mask"]
-
-    areas = object_tracks["gridcell_area"]
-
-    overlaps = []
-    for obj_id in ids:
-        if boundary_mask is None:
-            overlaps.append(0)
-        else:
-            obj_mask = mask == obj_id
-            overlap = (obj_mask * boundary_mask) == True
-            area_fraction = areas.where(overlap).sum() / areas.where(obj_mask).sum()
-            overlaps.append(float(area_fraction.values))
+    args = [attribute_options, object_tracks, member_object]
+    inventory = utils.get_previous_inventory(*args)
+    object_areas = properties.get_areas(inventory, ids)
+
+    if boundary_mask is None:
+        overlaps = [0] * len(ids)
+    else:
+        boundary_areas = properties.get_boundary_areas(inventory, boundary_mask)
+        indices = np.asarray(ids, dtype=int)
+        present = (indices > 0) & (indices < len(boundary_areas)) & (object_areas > 0)
+        boundary_areas = boundary_areas[np.where(present, indices, 0)]
+        denominator = np.where(present, object_areas, 1)
+        overlaps = np.where(present, boundary_areas / denominator, np.nan).tolist()
 
     boundary_overlaps = {"boundary_overlap": overlaps}
     attributes.update(boundary_overlaps)
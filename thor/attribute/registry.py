@@ -0,0 +1,145 @@
+"""
+Registry of attribute types. Each attribute type registers its record function, the
+inputs the function takes, and the attribute types it depends on. The attributes of
+each object are then recorded by running the attribute types in dependency order, with
+shared inputs like the mask inventory calculated at most once per object. Custom
+attribute types can be registered with register, then requested in the object options
+like the built in types.
+"""
+
+from thor.log import setup_logger
+import thor.attribute.utils as utils
+import thor.attribute.properties as properties
+import thor.instrument as instrument
+
+logger = setup_logger(__name__)
+
+
+def get_inventory(context):
+    """Get the inventory of the previous mask of the object being recorded."""
+    args = [context["attribute_options"], context["object_tracks"]]
+    args += [context["member_object"]]
+    return utils.get_previous_inventory(*args)
+
+
+def get_properties(context):
+    """Get the region properties of the previous mask of the object being recorded."""
+    return properties.get_properties(get_input("inventory", context))
+
+
+# Inputs calculated from the basic inputs when first requested
+derived_input_dispatcher = {"inventory": get_inventory, "properties": get_properties}
+basic_inputs = ["input_records", "attributes", "object_tracks", "object_options"]
+basic_inputs += ["attribute_options", "grid_options", "member_object"]
+
+registry = {}
+
+
+def register(name, function, inputs, depends=None):
+    """
+    Register an attribute type.
+
+    Parameters
+    ----------
+    name : str
+        Name of the attribute type, as used in the object attribute options.
+    function : callable
+        Function recording the attributes, called as function(*inputs).
+    inputs : list of str
+        Names of the inputs of function. Available inputs are "input_records",
+        "attributes", "object_tracks", "object_options", "attribute_options",
+        "grid_options", "member_object", "inventory" and "properties".
+    depends : list of str, optional
+        Attribute types whose attributes must be recorded before this type's.
+    """
+    available_inputs = basic_inputs + list(derived_input_dispatcher.keys())
+    unknown_inputs = [arg for arg in inputs if arg not in available_inputs]
+    if len(unknown_inputs) > 0:
+        message = f"Inputs {unknown_inputs} not recognised. Available inputs are "
+        message += f"{available_inputs}."
+        raise ValueError(message)
+    if depends is None:
+        depends = []
+    registry[name] = {"function": function, "inputs": inputs, "depends": depends}
+
+
+def get_entry(name):
+    """Get the registry entry of an attribute type."""
+    entry = registry.get(name)
+    if entry is None:
+        message = f"Attribute type {name} not registered. Registered types are "
+        message += f"{list(registry.keys())}."
+        raise ValueError(message)
+    return entry
+
+
+def get_schedule(attribute_types):
+    """
+    Order attribute types so each type follows the types it depends on. Dependencies
+    on types not in attribute_types are ignored, and types are otherwise kept in their
+    original order.
+    """
+    attribute_types = list(attribute_types)
+    remaining = {}
+    for name in attribute_types:
+        depends = get_entry(name)["depends"]
+        remaining[name] = [dep for dep in depends if dep in attribute_types]
+    schedule = []
+    while len(remaining) > 0:
+        ready = [name for name in remaining.keys() if len(remaining[name]) == 0]
+        if len(ready) == 0:
+            message = f"Attribute types {list(remaining.keys())} have circular "
+            message += "dependencies."
+            raise ValueError(message)
+        schedule.append(ready[0])
+        remaining.pop(ready[0])
+        for depends in remaining.values():
+            if ready[0] in depends:
+                depends.remove(ready[0])
+    return schedule
+
+
+def get_input(name, context):
+    """
+    Get an input from the context. Derived inputs are calculated on first request,
+    then stored in context["derived"], which is shared by all the attribute types of
+    an object. As attribute types may describe either the matched or unmatched mask,
+    derived inputs are stored separately for each.
+    """
+    if name not in derived_input_dispatcher.keys():
+        return context[name]
+    key = (name, "universal_id" in context["attribute_options"].keys())
+    if key not in context["derived"]:
+        context["derived"][key] = derived_input_dispatcher[name](context)
+    return context["derived"][key]
+
+
+def record(name, context):
+    """Record the attributes of type name, getting the function inputs from context."""
+    entry = get_entry(name)
+    with instrument.stage(name):
+        args = [get_input(input_name, context) for input_name in entry["inputs"]]
+        entry["function"](*args)
+
+
+def record_object(input_records, object_tracks, object_options, grid_options, obj=None):
+    """
+    Record the attributes of an object, or of member object obj of a grouped object,
+    running the attribute types in dependency order.
+    """
+    if obj is None:
+        all_attribute_options = object_options["attributes"]
+        all_attributes = object_tracks["current_attributes"]
+    elif obj in object_options["attributes"].get("member_objects", {}).keys():
+        all_attribute_options = object_options["attributes"]["member_objects"][obj]
+        all_attributes = object_tracks["current_attributes"]["member_objects"][obj]
+    else:
+        all_attribute_options = object_options["attributes"][obj]
+        all_attributes = object_tracks["current_attributes"][obj]
+    context = {"input_records": input_records, "object_tracks": object_tracks}
+    context.update({"object_options": object_options, "grid_options": grid_options})
+    context.update({"member_object": obj, "derived": {}})
+    for name in get_schedule(all_attributes.keys()):
+        context["attributes"] = all_attributes[name]
+        context["attribute_options"] = all_attribute_options[name]
+        record(name, context)
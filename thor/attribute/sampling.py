@@ -0,0 +1,150 @@
+"""
+Sampling of tag datasets at object centers. A sampler is stored in each tag input
+record, and caches the dataset coordinates, and the requested fields linearly
+interpolated to the current time, so that the tag and profile attributes of every
+object type can be sampled with a single bilinear gather. A sampler remains valid while
+the tag input record's dataset, i.e. the current hour window, is unchanged.
+"""
+
+import numpy as np
+from thor.log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def initialise_sampler(dataset):
+    """Initialise the sampler for a tag dataset."""
+    sampler = {"dataset": dataset}
+    sampler["latitude"] = np.asarray(dataset["latitude"].values, dtype=float)
+    sampler["longitude"] = np.asarray(dataset["longitude"].values, dtype=float)
+    sampler["times"] = dataset["time"].values.astype("datetime64[ns]")
+    # Fields interpolated to the current time, keyed by the tuple of field names
+    sampler["time"] = None
+    sampler["slabs"] = {}
+    return sampler
+
+
+def get_sampler(input_record):
+    """
+    Get the sampler of a tag input record, creating a new sampler if the record's
+    dataset has been updated since the sampler was created.
+    """
+    dataset = input_record["dataset"]
+    sampler = input_record.get("sampler")
+    if sampler is None or sampler["dataset"] is not dataset:
+        logger.debug("Initialising tag dataset sampler.")
+        sampler = initialise_sampler(dataset)
+        input_record["sampler"] = sampler
+    return sampler
+
+
+def get_time_weights(times, time):
+    """
+    Get the indices and weights of the times bracketing time. Returns None if time is
+    outside the range of times.
+    """
+    time = np.datetime64(time, "ns")
+    if time < times[0] or time > times[-1]:
+        return None
+    upper = int(np.searchsorted(times, time, side="left"))
+    if times[upper] == time:
+        return [upper], [1.0]
+    lower = upper - 1
+    weight = (time - times[lower]) / (times[upper] - times[lower])
+    return [lower, upper], [1 - weight, weight]
+
+
+def get_slab(sampler, names, time):
+    """
+    Get the fields names interpolated to time, stacked along a leading field axis, with
+    the latitude and longitude axes last. The fields must have the same dimensions.
+    The slab is cached until time changes.
+    """
+    if sampler["time"] != time:
+        sampler["time"] = time
+        sampler["slabs"] = {}
+    key = tuple(names)
+    if key in sampler["slabs"]:
+        return sampler["slabs"][key]
+    dataset = sampler["dataset"]
+    fields = []
+    for name in names:
+        field = dataset[name].transpose("time", ..., "latitude", "longitude")
+        fields.append(field.values)
+    fields = np.stack(fields, axis=1)
+    time_weights = get_time_weights(sampler["times"], time)
+    if time_weights is None:
+        slab = np.full(fields.shape[1:], np.nan)
+    else:
+        indices, weights = time_weights
+        slab = sum(weight * fields[index] for index, weight in zip(indices, weights))
+    sampler["slabs"][key] = slab
+    return slab
+
+
+def get_stencil(coordinate, points):
+    """
+    Get the lower neighbour indices and upper neighbour weights for linear interpolation
+    along a monotonic coordinate, and whether each point lies within the coordinate.
+    """
+    descending = coordinate[0] > coordinate[-1]
+    if descending:
+        coordinate = coordinate[::-1]
+    size = len(coordinate)
+    lower = np.searchsorted(coordinate, points, side="right") - 1
+    lower = np.clip(lower, 0, size - 2)
+    spacing = coordinate[lower + 1] - coordinate[lower]
+    weight = (points - coordinate[lower]) / spacing
+    valid = (points >= coordinate[0]) & (points <= coordinate[-1])
+    if descending:
+        lower = size - 2 - lower
+        weight = 1 - weight
+    return lower, weight, valid
+
+
+def sample(sampler, names, time, lats, lons):
+    """
+    Sample the fields names of the sampler's dataset at time and the points (lats,
+    lons) using linear interpolation in time, latitude and longitude. Points outside the
+    dataset are NaN.
+
+    Parameters
+    ----------
+    sampler : dict
+        The tag dataset sampler.
+    names : list of str
+        Names of the fields to sample.
+    time : np.datetime64
+        Time to sample at.
+    lats, lons : array_like
+        Coordinates of the points to sample at.
+
+    Returns
+    -------
+    samples : dict
+        Dictionary of arrays keyed by field name. The first axis of each array
+        corresponds to the points, and any remaining axes to the field's other
+        dimensions, e.g. pressure.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    if sampler["longitude"].min() >= 0:
+        lons = lons % 360
+    row, row_weight, row_valid = get_stencil(sampler["latitude"], lats)
+    col, col_weight, col_valid = get_stencil(sampler["longitude"], lons)
+    valid = row_valid & col_valid
+    # Fields with the same dimensions are stacked, so they can be gathered together
+    groups = {}
+    for name in names:
+        groups.setdefault(sampler["dataset"][name].dims, []).append(name)
+    samples = {}
+    for group_names in groups.values():
+        slab = get_slab(sampler, group_names, time)
+        # Gather the four neighbours of every point for all fields at once
+        values = slab[..., row, col] * (1 - row_weight) * (1 - col_weight)
+        values += slab[..., row + 1, col] * row_weight * (1 - col_weight)
+        values += slab[..., row, col + 1] * (1 - row_weight) * col_weight
+        values += slab[..., row + 1, col + 1] * row_weight * col_weight
+        values = np.moveaxis(np.where(valid, values, np.nan), -1, 1)
+        samples.update({name: values[i] for i, name in enumerate(group_names)})
+    return samples
@@ -1,7 +1,7 @@
 from thor.log import setup_logger
 import thor.attribute.core as core
 import thor.attribute.utils as utils
-import xarray as xr
+import thor.attribute.sampling as sampling
 
 logger = setup_logger(__name__)
 
@@ -69,19 +69,11 @@ def from_centers(names, input_records, attributes, object_tracks, method):
     previous_time = object_tracks["previous_times"][-1]
     lats = attributes["latitude"]
     lons = attributes["longitude"]
-    ds = tag_input_records[method["dataset"]]["dataset"]
-
-    tags = ds[names]
-    lats_da = xr.DataArray(lats, dims="points")
-    lons_da = xr.DataArray(lons, dims="points")
-    args_dict = {"latitude": lats_da, "longitude": lons_da}
-    args_dict.update({"time": previous_time.astype("datetime64[ns]")})
-    args_dict.update({"method": "linear"})
-    tags = tags.interp(**args_dict)
-
-    tag_dict = {name: [] for name in names}
-    for name in names:
-        tag_dict[name] += list(tags[name].values)
+    sampler = sampling.get_sampler(tag_input_records[method["dataset"]])
+    args = [sampler, names, previous_time, lats, lons]
+    tags = sampling.sample(*args)
+
+    tag_dict = {name: list(tags[name]) for name in names}
     return tag_dict
 
 
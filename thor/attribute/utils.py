@@ -6,6 +6,7 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 from thor.log import setup_logger
+import thor.object.label as label
 
 logger = setup_logger(__name__)
 
@@ -41,6 +42,34 @@ def get_previous_mask(attribute_options, object_tracks):
     return mask
 
 
+def get_previous_inventory(attribute_options, object_tracks, member_object=None):
+    """
+    Get the inventory of the appropriate previous mask, reusing the cached inventory
+    where available. If member_object is specified and the mask is grouped, get the
+    inventory of that member object's mask.
+    """
+    mask = get_previous_mask(attribute_options, object_tracks)
+    gridcell_area = object_tracks.get("gridcell_area")
+    if "universal_id" in attribute_options.keys():
+        # Matched masks have no recorded inventory, so store the inventory here so it
+        # is shared by the different attribute types
+        cached = object_tracks.get("previous_matched_inventory")
+        if cached is not None and cached[0] is mask:
+            inventory = cached[1]
+        else:
+            inventory = label.get_inventory(mask, gridcell_area)
+            object_tracks["previous_matched_inventory"] = (mask, inventory)
+    else:
+        inventory = None
+        if "previous_mask_inventories" in object_tracks.keys():
+            inventory = object_tracks["previous_mask_inventories"][-1]
+        if inventory is None:
+            inventory = label.get_inventory(mask, gridcell_area)
+    if member_object is not None and isinstance(inventory, dict):
+        inventory = inventory[f"{member_object}_mask"]
+    return inventory
+
+
 def dict_to_tuple(d):
     """Recursively convert a dictionary to a tuple of key-value pairs."""
     return tuple(
@@ -68,7 +97,7 @@ def attribute_from_core(name, object_tracks, member_object):
     # Check if grouped object
     object_name = object_tracks["name"]
     if object_name in object_tracks["current_attributes"]:
-        if member_object is not None and member_object is not object_name:
+        if member_object is not None and member_object != object_name:
             member_attr = object_tracks["current_attributes"]["member_objects"]
             attr = member_attr[member_object]["core"][name]
         else:
@@ -78,7 +107,71 @@ def attribute_from_core(name, object_tracks, member_object):
     return attr
 
 
-def initialize_attributes_detected(object_options):
+def get_dtype(data_type):
+    """Get the numpy dtype used to store attributes of the given data type."""
+    if data_type == str:
+        return np.dtype(object)
+    return np.dtype(data_type)
+
+
+def initialize_column(data_type, capacity=1024):
+    """
+    Initialize a growable column for attributes of the given data type. The column
+    stores its values in a preallocated array, of which the first "size" entries are
+    in use.
+    """
+    data = np.empty(capacity, dtype=get_dtype(data_type))
+    return {"data": data, "size": 0}
+
+
+def append_column(column, values):
+    """Append values to a column, doubling the column capacity when it is full."""
+    size = column["size"]
+    new_size = size + len(values)
+    if new_size > len(column["data"]):
+        capacity = max(2 * len(column["data"]), new_size)
+        data = np.empty(capacity, dtype=column["data"].dtype)
+        data[:size] = column["data"][:size]
+        column["data"] = data
+    column["data"][size:new_size] = values
+    column["size"] = new_size
+
+
+def get_column_values(column):
+    """Get a view of the values in use in a column."""
+    return column["data"][: column["size"]]
+
+
+def is_column(attribute):
+    """Check whether an attribute is stored in a column rather than a list."""
+    return isinstance(attribute, dict) and "data" in attribute and "size" in attribute
+
+
+def initialize_attribute_type(attribute_options, columnar=False):
+    """Initialize the lists or columns for a single attribute type."""
+    if not columnar:
+        return {attr: [] for attr in attribute_options.keys()}
+    attributes = {}
+    for attr in attribute_options.keys():
+        attributes[attr] = initialize_column(attribute_options[attr]["data_type"])
+    return attributes
+
+
+def reset_attributes(attributes):
+    """
+    Empty the lists and columns of an attributes dictionary in place, keeping the
+    allocated column capacities.
+    """
+    for key in attributes.keys():
+        if is_column(attributes[key]):
+            attributes[key]["size"] = 0
+        elif isinstance(attributes[key], dict):
+            reset_attributes(attributes[key])
+        else:
+            attributes[key] = []
+
+
+def initialize_attributes_detected(object_options, columnar=False):
     """Initialize attributes lists for detected objects."""
     attribute_types = object_options["attributes"].keys()
     attributes_dict = {t: {} for t in attribute_types}
@@ -89,16 +182,16 @@ def initialize_attributes_detected(object_options):
             for dataset in object_options["attributes"][attribute_type].keys():
                 all_options = object_options["attributes"][attribute_type]
                 attribute_options = all_options[dataset]
-                attributes = {attr: [] for attr in attribute_options.keys()}
+                attributes = initialize_attribute_type(attribute_options, columnar)
                 attributes_dict[attribute_type][dataset] = attributes
         else:
             attribute_options = object_options["attributes"][attribute_type]
-            attributes = {attr: [] for attr in attribute_options.keys()}
+            attributes = initialize_attribute_type(attribute_options, columnar)
             attributes_dict[attribute_type] = attributes
     return attributes_dict
 
 
-def initialize_attributes_grouped(object_options):
+def initialize_attributes_grouped(object_options, columnar=False):
     """Initialize attributes lists for grouped objects."""
     # First initialize attributes for member objects
     member_options = object_options["attributes"]["member_objects"]
@@ -114,11 +207,11 @@ def initialize_attributes_grouped(object_options):
                 member_attributes[obj][attribute_type] = {ds: {} for ds in datasets}
                 for dataset in datasets:
                     attribute_options = member_options[obj][attribute_type][dataset]
-                    attributes = {attr: [] for attr in attribute_options.keys()}
+                    attributes = initialize_attribute_type(attribute_options, columnar)
                     member_attributes[obj][attribute_type][dataset] = attributes
             else:
                 attribute_options = member_options[obj][attribute_type]
-                attributes = {attr: [] for attr in attribute_options.keys()}
+                attributes = initialize_attribute_type(attribute_options, columnar)
                 member_attributes[obj][attribute_type] = attributes
     # Now initialize attributes for grouped object
     obj = list(object_options["attributes"].keys() - {"member_objects"})[0]
@@ -129,17 +222,20 @@ def initialize_attributes_grouped(object_options):
             for dataset in datasets:
                 obj_attribute_options = object_options["attributes"][obj]
                 attribute_options = obj_attribute_options[attribute_type][dataset]
-                attributes = {attr: [] for attr in attribute_options.keys()}
+                attributes = initialize_attribute_type(attribute_options, columnar)
                 attributes_dict[obj][attribute_type][dataset] = attributes
         else:
             attribute_options = object_options["attributes"][obj][attribute_type]
-            attributes = {attr: [] for attr in attribute_options.keys()}
+            attributes = initialize_attribute_type(attribute_options, columnar)
             attributes_dict[obj][attribute_type] = attributes
     return attributes_dict
 
 
-def initialize_attributes(object_options):
-    """Initialize attributes lists for object tracks."""
+def initialize_attributes(object_options, columnar=False):
+    """
+    Initialize attributes for object tracks. If columnar is True, each attribute is
+    stored in a typed column, otherwise in a list.
+    """
     if "detection" in object_options:
         init_func = initialize_attributes_detected
     elif "grouping" in object_options:
@@ -148,13 +244,19 @@ def initialize_attributes(object_options):
         message = "Object indentification method must be specified, i.e. "
         message += "'detection' or 'grouping'."
         raise ValueError(message)
-    return init_func(object_options)
+    return init_func(object_options, columnar)
 
 
 def attributes_dataframe(attributes, options):
     """Create a pandas DataFrame from object attributes dictionary."""
     data_types = {name: options[name]["data_type"] for name in options.keys()}
-    df = pd.DataFrame(attributes).astype(data_types)
+    # Columns are passed as views, so typed columns are not copied
+    columns = {}
+    for name, attribute in attributes.items():
+        if is_column(attribute):
+            attribute = get_column_values(attribute)
+        columns[name] = attribute
+    df = pd.DataFrame(columns, copy=False).astype(data_types)
     if "universal_id" in attributes.keys():
         id_index = "universal_id"
     else:
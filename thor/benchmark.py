@@ -0,0 +1,305 @@
+"""
+Benchmarks of the tracking pipeline on synthetic data. Each benchmark case tracks
+synthetic objects moving across a grid, with the stages of the tracking loop timed by
+thor.instrument. Cases vary one parameter at a time from a base case, giving scaling
+curves for the grid size, number of objects, number of hierarchy levels, number of
+time steps, detection method and attribute set. Results are saved as JSON together
+with metadata describing the environment, and can be compared against a saved baseline
+to flag regressions. No data is downloaded, so benchmarks run offline.
+
+Run with ``python -m thor.benchmark``; see ``python -m thor.benchmark --help``.
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time as time_module
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import scipy
+import xarray as xr
+import thor
+from thor.log import setup_logger
+from thor.config import get_outputs_directory
+from thor.utils import now_str
+import thor.attribute as attribute
+import thor.data.synthetic as synthetic
+import thor.grid as grid
+import thor.option as option
+import thor.track as track
+
+logger = setup_logger(__name__)
+
+
+base_case = {"grid_size": 160, "objects": 4, "levels": 1, "timesteps": 6}
+base_case.update({"detection": "steiner", "attributes": "core"})
+
+sweeps = {
+    "grid_size": [80, 160, 320, 640],
+    "objects": [1, 4, 16, 64],
+    "levels": [1, 2],
+    "timesteps": [3, 6, 12, 24],
+    "detection": ["steiner", "threshold"],
+    "attributes": ["core", "all"],
+}
+
+quick_sweeps = {
+    "grid_size": [80, 160],
+    "objects": [1, 4],
+    "levels": [1, 2],
+    "timesteps": [3, 6],
+    "detection": ["steiner", "threshold"],
+    "attributes": ["core", "all"],
+}
+
+
+def get_cases(sweeps):
+    """
+    Get the benchmark cases, varying each parameter in sweeps in turn while holding the
+    others at their base case values. Duplicate cases are removed.
+    """
+    cases = []
+    for parameter, values in sweeps.items():
+        for value in values:
+            case = base_case.copy()
+            case[parameter] = value
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+
+def get_case_key(case):
+    """Get a string identifying a benchmark case."""
+    return ",".join(f"{key}={case[key]}" for key in base_case.keys())
+
+
+def get_environment():
+    """Get metadata describing the environment benchmarks are run in."""
+    environment = {"thor": thor.__version__, "python": platform.python_version()}
+    environment.update({"numpy": np.__version__, "scipy": scipy.__version__})
+    environment.update({"xarray": xr.__version__, "pandas": pd.__version__})
+    environment.update({"platform": platform.platform()})
+    environment.update({"processor": platform.processor()})
+    environment.update({"machine": platform.machine()})
+    environment.update({"time": now_str(filename_safe=False)})
+    return environment
+
+
+def get_grid_options(grid_size):
+    """Get geographic grid options with grid_size points along each side."""
+    spacing = 0.025
+    latitude = (-12 + spacing * (np.arange(grid_size) - grid_size / 2)).round(3)
+    longitude = (131 + spacing * (np.arange(grid_size) - grid_size / 2)).round(3)
+    args = {"latitude": latitude.tolist(), "longitude": longitude.tolist()}
+    grid_options = grid.create_options(name="geographic", **args)
+    grid.check_options(grid_options)
+    return grid_options
+
+
+def get_objects(number, start, grid_options, seed=0):
+    """
+    Get randomly placed synthetic objects. Objects are tall enough to be detected at
+    every hierarchy level.
+    """
+    rng = np.random.default_rng(seed)
+    latitude = np.array(grid_options["latitude"])
+    longitude = np.array(grid_options["longitude"])
+    # Keep objects away from the grid boundaries
+    margin = 0.25
+    lats = rng.uniform(latitude[0] + margin, latitude[-1] - margin, number)
+    lons = rng.uniform(longitude[0] + margin, longitude[-1] - margin, number)
+    objects = []
+    for i in range(number):
+        properties = {"time": start, "center_latitude": lats[i]}
+        properties.update({"center_longitude": lons[i]})
+        properties.update({"direction": rng.uniform(0, 2 * np.pi)})
+        properties.update({"speed": rng.uniform(5, 15)})
+        properties.update({"horizontal_radius": rng.uniform(10, 25)})
+        properties.update({"alt_center": 5e3, "alt_radius": 4e3})
+        properties.update({"orientation": rng.uniform(0, np.pi)})
+        objects.append(synthetic.create_object(**properties))
+    return objects
+
+
+def get_detected_attributes(attributes):
+    """Get the attribute options of detected objects."""
+    if attributes == "core":
+        return {"core": attribute.core.default()}
+    elif attributes == "all":
+        attribute_options = {"core": attribute.core.default()}
+        attribute_options["ellipse"] = attribute.ellipse.default()
+        attribute_options["quality"] = attribute.quality.default()
+        return attribute_options
+    raise ValueError("Attribute set must be 'core' or 'all'.")
+
+
+def get_grouped_attributes(attributes, member_objects, name="mcs"):
+    """
+    Get the attribute options of grouped objects. Profile and tag attributes are
+    excluded, as they require ERA5 data.
+    """
+    core_tracked = attribute.core.default(tracked=True, matched=True)
+    core_untracked = attribute.core.default(tracked=False, matched=True)
+    attribute_options = {"member_objects": {}, name: {"core": core_tracked}}
+    member_options = attribute_options["member_objects"]
+    for i, obj in enumerate(member_objects):
+        member_options[obj] = {"core": core_tracked if i == 0 else core_untracked}
+    if attributes == "all":
+        for obj in member_objects:
+            member_options[obj]["quality"] = attribute.quality.default()
+        member_options[member_objects[0]]["ellipse"] = attribute.ellipse.default()
+        attribute_options[name]["group"] = attribute.group.default()
+    elif attributes != "core":
+        raise ValueError("Attribute set must be 'core' or 'all'.")
+    return attribute_options
+
+
+def get_track_options(case):
+    """Get the track options of a benchmark case."""
+    threshold = 40 if case["detection"] == "threshold" else None
+    cell_args = {"dataset": "synthetic", "detection_method": case["detection"]}
+    cell_args.update({"threshold": threshold, "tracking_method": "mint"})
+    if case["levels"] == 1:
+        cell_args["attribute_options"] = get_detected_attributes(case["attributes"])
+        return [{"cell": option.cell_object(**cell_args)}]
+    elif case["levels"] == 2:
+        member_objects = ["cell", "middle_echo", "anvil"]
+        args = [case["attributes"], member_objects]
+        grouped_attributes = get_grouped_attributes(*args)
+        track_options = option.mcs("synthetic", attribute_options=grouped_attributes)
+        track_options[0]["cell"]["detection"]["method"] = case["detection"]
+        return track_options
+    raise ValueError("Benchmarks support 1 or 2 hierarchy levels.")
+
+
+def run_case(case, output_directory, instrument_mode="time"):
+    """
+    Run a benchmark case, returning the total wall time and a summary of the
+    instrumented stages.
+    """
+    start = np.datetime64("2005-11-13T00:00:00")
+    interval = np.timedelta64(10, "m")
+    times = start + interval * np.arange(case["timesteps"])
+    grid_options = get_grid_options(case["grid_size"])
+    objects = get_objects(case["objects"], str(start), grid_options)
+    end = str(times[-1])
+    data_args = {"start": str(start), "end": end, "starting_objects": objects}
+    data_options = option.consolidate_options(
+        [synthetic.synthetic_data_options(**data_args)]
+    )
+    track_options = get_track_options(case)
+
+    if output_directory.exists():
+        shutil.rmtree(output_directory)
+    wall_time = time_module.perf_counter()
+    args = [times, data_options, grid_options, track_options]
+    track.simultaneous_track(
+        *args, output_directory=output_directory, instrument_mode=instrument_mode
+    )
+    wall_time = time_module.perf_counter() - wall_time
+
+    records_filepath = output_directory / "records/instrumentation_summary.csv"
+    summary = pd.read_csv(records_filepath, index_col="stage")
+    summary = summary.replace({np.nan: None})
+    return {"wall_time": wall_time, "stages": summary.to_dict(orient="index")}
+
+
+def run(cases, instrument_mode="time"):
+    """Run the benchmark cases, returning the results with environment metadata."""
+    results = {"environment": get_environment(), "cases": {}}
+    directory = Path(tempfile.mkdtemp(prefix="thor_benchmark_"))
+    try:
+        for i, case in enumerate(cases):
+            key = get_case_key(case)
+            logger.info(f"Running benchmark case {i + 1} of {len(cases)}: {key}.")
+            output_directory = directory / f"case_{i}"
+            case_results = run_case(case, output_directory, instrument_mode)
+            results["cases"][key] = {"parameters": case, **case_results}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, min_time=0.01):
+    """
+    Compare benchmark results against a baseline. A regression is flagged when the wall
+    time of a case, or the total time of a stage, exceeds the baseline by more than the
+    fractional tolerance. Stages taking less than min_time seconds in the baseline are
+    ignored, as their timings are dominated by noise.
+
+    Returns
+    -------
+    regressions : list of dict
+        The case, stage, baseline time, new time and ratio of each regression.
+    """
+    regressions = []
+    for key, case_results in results["cases"].items():
+        baseline_results = baseline["cases"].get(key)
+        if baseline_results is None:
+            continue
+        timings = [("total", case_results["wall_time"])]
+        baseline_timings = {"total": baseline_results["wall_time"]}
+        for stage, summary in case_results["stages"].items():
+            timings.append((stage, summary["total_time"]))
+        for stage, summary in baseline_results["stages"].items():
+            baseline_timings[stage] = summary["total_time"]
+        for stage, new_time in timings:
+            baseline_time = baseline_timings.get(stage)
+            if baseline_time is None or baseline_time < min_time:
+                continue
+            ratio = new_time / baseline_time
+            if ratio > 1 + tolerance:
+                regression = {"case": key, "stage": stage, "ratio": ratio}
+                regression.update({"baseline": baseline_time, "new": new_time})
+                regressions.append(regression)
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmark suite from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m thor.benchmark", description=__doc__.strip().split("\n\n")[0]
+    )
+    parser.add_argument("--output", type=Path, help="Filepath of the results JSON.")
+    parser.add_argument("--baseline", type=Path, help="Baseline results JSON.")
+    message = "Fractional slowdown relative to the baseline flagged as a regression."
+    parser.add_argument("--tolerance", type=float, default=0.2, help=message)
+    message = "Sweep fewer, smaller cases."
+    parser.add_argument("--quick", action="store_true", help=message)
+    message = "Also record peak memory with tracemalloc, which slows the run."
+    parser.add_argument("--memory", action="store_true", help=message)
+    args = parser.parse_args(argv)
+
+    cases = get_cases(quick_sweeps if args.quick else sweeps)
+    instrument_mode = "memory" if args.memory else "time"
+    results = run(cases, instrument_mode)
+
+    output = args.output
+    if output is None:
+        output = get_outputs_directory() / f"benchmarks/{now_str()}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2, default=str)
+    logger.info(f"Saved benchmark results to {output}.")
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        message = f"Regression in {regression['case']}, {regression['stage']}: "
+        message += f"{regression['baseline']:.3f} s to {regression['new']:.3f} s."
+        logger.warning(message)
+    if len(regressions) > 0:
+        return 1
+    logger.info("No regressions relative to the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,6 @@
 """Process AURA data."""
 
 import inspect
-import copy
 from urllib.parse import urlparse
 import xarray as xr
 import xesmf as xe
@@ -10,9 +9,11 @@ import pandas as pd
 from thor.log import setup_logger
 from thor.data.odim import convert_odim
 import thor.data.utils as utils
+import thor.data.prefetch as prefetch
 from thor.utils import format_string_list
 import thor.data.option as option
 import thor.grid as grid
+import thor.state as state
 from thor.config import get_outputs_directory
 
 
@@ -34,6 +35,7 @@ def cpol_data_options(
     version="v2020",
     range=142.5,
     range_units="km",
+    prefetch_options=None,
 ):
     """
     Generate CPOL radar data options dictionary.
@@ -65,6 +67,9 @@ def cpol_data_options(
         The fields to include in the dataset; default is None.
     version : str, optional
         The version of the dataset; default is "v2020".
+    prefetch_options : dict, optional
+        Dictionary containing the prefetch options; default is None, i.e. files are
+        not prefetched.
     save_options : bool, optional
         Whether to save the data options; default is False.
     **kwargs
@@ -89,6 +94,7 @@ def cpol_data_options(
         converted_options,
         filepaths,
         use=use,
+        prefetch_options=prefetch_options,
     )
 
     options.update(
@@ -394,8 +400,9 @@ def setup_operational(data_options, grid_options, url, directory):
 
 def get_cpol(time, input_record, dataset_options, grid_options):
     """Update the CPOL input_record for tracking."""
-    filepath = dataset_options["filepaths"][input_record["current_file_index"]]
-    ds, boundary_coords = convert_cpol(time, filepath, dataset_options, grid_options)
+    args = [time, input_record, dataset_options, grid_options, convert_cpol]
+    converted = prefetch.get_converted(*args, [dataset_options])
+    ds, boundary_coords = converted
 
     # Set data outside instrument range to NaN
     keys = ["current_domain_mask", "current_boundary_coordinates"]
@@ -407,9 +414,10 @@ def get_cpol(time, input_record, dataset_options, grid_options):
         input_record["current_boundary_coordinates"] = boundary_coords
         input_record["current_boundary_mask"] = ds["boundary_mask"]
     else:
-        domain_mask = copy.deepcopy(input_record["current_domain_mask"])
-        boundary_mask = copy.deepcopy(input_record["current_boundary_mask"])
-        boundary_coords = copy.deepcopy(input_record["current_boundary_coordinates"])
+        # The current masks are unchanged, so are shared with the previous buffers
+        domain_mask = state.freeze(input_record["current_domain_mask"])
+        boundary_mask = state.freeze(input_record["current_boundary_mask"])
+        boundary_coords = input_record["current_boundary_coordinates"]
         input_record["previous_domain_masks"].append(domain_mask)
         input_record["previous_boundary_coordinates"].append(boundary_coords)
         input_record["previous_boundary_masks"].append(boundary_mask)
@@ -427,7 +435,8 @@ def convert_cpol(time, filepath, dataset_options, grid_options):
     utils.log_convert(logger, dataset_options["name"], filepath)
     cpol = xr.open_dataset(filepath)
 
-    if time not in cpol.time.values:
+    # Time is None when prefetching
+    if time is not None and time not in cpol.time.values:
         raise ValueError(f"{time} not in {filepath}")
 
     cpol = cpol[
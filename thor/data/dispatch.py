@@ -7,6 +7,7 @@ import thor.data.synthetic as synthetic
 import thor.data.gridrad as gridrad
 import thor.data.utils as utils
 import thor.write as write
+import thor.state as state
 from thor.log import setup_logger
 from thor.utils import time_in_dataset_range
 
@@ -43,6 +44,9 @@ grid_from_dataset_dispatcher = {
     "synthetic": grid_from_dataset_basic,
 }
 
+# Datasets whose files are converted through prefetch.get_converted
+prefetch_datasets = ["cpol", "gridrad"]
+
 
 generate_filepaths_dispatcher = {
     "cpol": aura.get_cpol_filepaths,
@@ -135,7 +139,8 @@ def update_track_input_records(
             time, input_record, track_options, data_options[name], grid_options
         )
         if input_record["current_grid"] is not None:
-            input_record["previous_grids"].append(input_record["current_grid"])
+            previous_grid = state.freeze(input_record["current_grid"])
+            input_record["previous_grids"].append(previous_grid)
         grid_from_dataset = grid_from_dataset_dispatcher.get(name)
         if len(data_options[name]["fields"]) > 1:
             raise ValueError("Only one field allowed for track datasets.")
@@ -1,4 +1,3 @@
-import copy
 from functools import reduce
 import numpy as np
 import pandas as pd
@@ -7,8 +6,10 @@ from skimage.morphology import remove_small_objects
 import thor.data.option as option
 from thor.config import get_outputs_directory
 import thor.data.utils as utils
+import thor.data.prefetch as prefetch
 from thor.log import setup_logger
 import thor.grid as grid
+import thor.state as state
 
 
 logger = setup_logger(__name__)
@@ -49,6 +50,7 @@ def gridrad_data_options(
     fields=None,
     version="v4_2",
     obs_thresh=2,
+    prefetch_options=None,
 ):
     """
     Generate gridrad radar data options dictionary.
@@ -67,6 +69,7 @@ def gridrad_data_options(
         converted_options,
         filepaths,
         use=use,
+        prefetch_options=prefetch_options,
     )
 
     options.update({"fields": fields, "version": version, "dataset_id": dataset_id})
@@ -326,11 +329,9 @@ def remove_clutter(ds, variables=None, low_level=True, below_anvil=False):
 
 
 def get_gridrad(time, input_record, track_options, dataset_options, grid_options):
-    filepath = dataset_options["filepaths"][input_record["current_file_index"]]
-    utils.log_convert(logger, dataset_options["name"], filepath)
-    ds, boundary_coords = convert_gridrad(
-        time, filepath, track_options, dataset_options, grid_options
-    )
+    args = [time, input_record, dataset_options, grid_options, convert_gridrad]
+    converted = prefetch.get_converted(*args, [track_options, dataset_options])
+    ds, boundary_coords = converted
     update_boundary_data(ds, boundary_coords, input_record)
     return ds
 
@@ -338,15 +339,15 @@ def get_gridrad(time, input_record, track_options, dataset_options, grid_options
 def convert_gridrad(time, filepath, track_options, dataset_options, grid_options):
     """Convert gridrad data to the standard format."""
 
-    logger.debug(f"Converting GridRad dataset at time {time}.")
+    utils.log_convert(logger, dataset_options["name"], filepath)
 
     # Open the dataset and perform preliminary filtering and decluttering
     ds = open_gridrad(filepath, dataset_options)
     ds = filter(ds, refl_thresh=-10)
     ds = remove_clutter(ds)
 
-    # Ensure the intended time is in the dataset
-    if time not in ds.time.values:
+    # Ensure the intended time is in the dataset. Time is None when prefetching.
+    if time is not None and time not in ds.time.values:
         raise ValueError(f"{time} not in {filepath}")
 
     # Restructure the dataset
@@ -427,19 +428,10 @@ def get_domain_mask(ds, track_options, dataset_options):
 
 
 def update_boundary_data(dataset, boundary_coords, input_record):
-    previous_domain_mask = copy.deepcopy(input_record["current_domain_mask"])
-    previous_boundary_coords = copy.deepcopy(
-        input_record["current_boundary_coordinates"]
-    )
-    previous_boundary_mask = copy.deepcopy(input_record["current_boundary_mask"])
-
-    input_record["previous_domain_masks"].append(previous_domain_mask)
-    input_record["previous_boundary_coordinates"].append(previous_boundary_coords)
-    input_record["previous_boundary_masks"].append(previous_boundary_mask)
-
-    input_record["current_domain_mask"] = dataset["domain_mask"]
-    input_record["current_boundary_coordinates"] = boundary_coords
-    input_record["current_boundary_mask"] = dataset["boundary_mask"]
+    state.rotate(input_record, "current_domain_mask", dataset["domain_mask"])
+    key, previous_key = "current_boundary_coordinates", "previous_boundary_coordinates"
+    state.rotate(input_record, key, boundary_coords, previous_key)
+    state.rotate(input_record, "current_boundary_mask", dataset["boundary_mask"])
 
 
 def update_dataset(time, input_record, track_options, dataset_options, grid_options):
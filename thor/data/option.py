@@ -21,6 +21,7 @@ def boilerplate_options(
     attempt_download=True,
     deque_length=2,
     use="track",
+    prefetch_options=None,
 ):
     """
     Generate dataset options dictionary.
@@ -51,6 +52,10 @@ def boilerplate_options(
         The length of the deque; default is 2.
     use : str, optional
         The use of the dataset; default is "track".
+    prefetch_options : dict, optional
+        Dictionary containing the options for converting upcoming files in the
+        background, see thor.data.prefetch.prefetch_options; default is None, i.e.
+        files are not prefetched.
 
     Returns
     -------
@@ -75,6 +80,7 @@ def boilerplate_options(
         "attempt_download": attempt_download,
         "deque_length": deque_length,
         "use": use,
+        "prefetch_options": prefetch_options,
     }
 
     return options
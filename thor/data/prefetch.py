@@ -0,0 +1,146 @@
+"""
+Background prefetching of input files. While the current time step is detected,
+matched and attributed, the next files in the dataset's filepaths list are converted in
+a worker thread or process. Objects may also be detected in the converted files by the
+worker; see detect.detect_ahead.
+"""
+
+import copy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from thor.log import setup_logger
+import thor.instrument as instrument
+
+logger = setup_logger(__name__)
+
+
+executor_dispatcher = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+def prefetch_options(depth=1, executor="thread", workers=1):
+    """
+    Generate prefetch options dictionary.
+
+    Parameters
+    ----------
+    depth : int, optional
+        The maximum number of files converted ahead of the current file; default is 1.
+    executor : str, optional
+        Whether to convert files in a worker "thread" or "process"; default is "thread".
+    workers : int, optional
+        The number of files converted at once; default is 1. Should be at most depth.
+
+    Returns
+    -------
+    options : dict
+        Dictionary containing the prefetch options.
+    """
+    options = {"depth": depth, "executor": executor, "workers": workers}
+    check_prefetch_options(options)
+    return options
+
+
+def check_prefetch_options(options):
+    """Check the prefetch options."""
+    if not isinstance(options["depth"], int) or options["depth"] < 1:
+        raise ValueError("Prefetch depth must be a positive integer.")
+    if options["executor"] not in executor_dispatcher.keys():
+        executors = list(executor_dispatcher.keys())
+        message = f"Prefetch executor must be one of {executors}."
+        raise ValueError(message)
+    workers = options.get("workers", 1)
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError("Prefetch workers must be a positive integer.")
+
+
+def initialise_prefetcher(dataset_options):
+    """
+    Initialise the prefetcher for a dataset. Returns None if prefetching is disabled.
+    """
+    options = dataset_options.get("prefetch_options")
+    if options is None:
+        return None
+    check_prefetch_options(options)
+    # Files are submitted in order, and retrieved in order from the queue
+    max_workers = options.get("workers", 1)
+    executor = executor_dispatcher[options["executor"]](max_workers=max_workers)
+    prefetcher = {"executor": executor, "depth": options["depth"]}
+    prefetcher["queue"] = deque()
+    # Optional function detect(dataset, grid_options), run on each converted file
+    prefetcher["detect"] = None
+    return prefetcher
+
+
+def convert_in_background(convert, filepath, args, grid_options, detect=None):
+    """
+    Convert filepath in a worker, returning the converted dataset, the grid options
+    as updated by the conversion, and if detect is provided, its output.
+    """
+    converted = convert(None, filepath, *args, grid_options)
+    detected = None
+    if detect is not None:
+        detected = detect(converted[0], grid_options)
+    return converted, grid_options, detected
+
+
+def get_converted(time, input_record, dataset_options, grid_options, convert, args):
+    """
+    Get the converted dataset for the current file index of input_record, then queue
+    the conversion of the following files. The convert function is called as
+    convert(time, filepath, *args, grid_options), and must return the converted
+    dataset as the first element of its output. Convert functions may update
+    grid_options, e.g. with the grid of the converted file, so prefetched files are
+    converted with copies of grid_options, and the updated copies applied to
+    grid_options once the files are required. Prefetched files are converted with time
+    None, so the time is checked here once the file is required.
+    """
+    index = input_record["current_file_index"]
+    filepaths = dataset_options["filepaths"]
+    prefetcher = input_record.get("prefetcher")
+    if prefetcher is None:
+        with instrument.stage("convert"):
+            return convert(time, filepaths[index], *args, grid_options)
+
+    queue = prefetcher["queue"]
+    # Discard conversions of files that will no longer be used
+    while len(queue) > 0 and queue[0][0] < index:
+        queue.popleft()[1].cancel()
+    if len(queue) > 0 and queue[0][0] == index:
+        logger.debug(f"Retrieving prefetched file {filepaths[index]}.")
+        # Only the time spent waiting on the prefetched conversion is recorded
+        with instrument.stage("convert"):
+            converted, updated_grid_options, detected = queue.popleft()[1].result()
+        if time not in converted[0].time.values:
+            raise ValueError(f"{time} not in {filepaths[index]}")
+        grid_options.update(updated_grid_options)
+        input_record["detections"] = None
+        if detected is not None:
+            input_record["detections"], records = detected
+            instrument.merge(records)
+    else:
+        with instrument.stage("convert"):
+            converted = convert(time, filepaths[index], *args, grid_options)
+        input_record["detections"] = None
+
+    # Top up the queue with the following files
+    next_index = queue[-1][0] + 1 if len(queue) > 0 else index + 1
+    while len(queue) < prefetcher["depth"] and next_index < len(filepaths):
+        filepath = filepaths[next_index]
+        # Copy the grid options on this thread, so workers never share them
+        worker_args = [convert, filepath, args, copy.deepcopy(grid_options)]
+        worker_args += [prefetcher["detect"]]
+        future = prefetcher["executor"].submit(convert_in_background, *worker_args)
+        queue.append((next_index, future))
+        next_index += 1
+    return converted
+
+
+def shutdown(input_records):
+    """Cancel outstanding conversions and shut down the prefetchers."""
+    for input_record in input_records.values():
+        prefetcher = input_record.get("prefetcher")
+        if prefetcher is None:
+            continue
+        while len(prefetcher["queue"]) > 0:
+            prefetcher["queue"].popleft()[1].cancel()
+        prefetcher["executor"].shutdown(wait=True)
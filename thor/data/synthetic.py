@@ -3,10 +3,10 @@ Module for generating synthetic reflectivity data for testing.
 """
 
 import numpy as np
-import copy
 import xarray as xr
 from pyproj import Geod
 import inspect
+from scipy.spatial import cKDTree
 from scipy.stats import vonmises
 from thor.log import setup_logger
 from thor.config import get_outputs_directory
@@ -27,6 +27,7 @@ def synthetic_data_options(
     deque_length=2,
     starting_objects=None,
     regeneration_options=None,
+    evolution_options=None,
 ):
     """
     Generate CPOL radar data options dictionary.
@@ -41,6 +42,10 @@ def synthetic_data_options(
         The end time of the dataset; default is "2005-11-14T00:00:00".
     save_options : bool, optional
         Whether to save the data options; default is False.
+    evolution_options : dict, optional
+        Options controlling the splitting and merging of objects, as created by
+        create_evolution_options; default is None, in which case objects neither split
+        nor merge.
     **kwargs
         Additional keyword arguments.
 
@@ -62,6 +67,7 @@ def synthetic_data_options(
         "use": use,
         "starting_objects": starting_objects,
         "regeneration_options": regeneration_options,
+        "evolution_options": evolution_options,
     }
 
     return options
@@ -97,6 +103,8 @@ def create_object(
     intensity=50,
     eccentricity=0.4,
     orientation=np.pi / 4,
+    lifetime=None,
+    age=0,
 ):
     """
     Create a dictionary containing the object properties.
@@ -115,6 +123,12 @@ def create_object(
         The speed the object is moving in metres per second.
     horizontal_radius : float, optional
         The horizontal radius of the object in km; default is 20.
+    lifetime : float, optional
+        The lifetime of the object in seconds. Over its lifetime the object's intensity
+        rises then decays, and the object is removed once its age exceeds its
+        lifetime. Default is None, in which case the object persists indefinitely.
+    age : float, optional
+        The age of the object in seconds at time; default is 0.
 
     Returns
     -------
@@ -134,10 +148,42 @@ def create_object(
         "orientation": orientation,
         "direction": direction,
         "speed": speed,
+        "lifetime": lifetime,
+        "age": age,
     }
     return object_dict
 
 
+def create_evolution_options(
+    split_probability=0, split_angle=np.pi / 8, merge_distance=None, seed=0
+):
+    """
+    Create a dictionary containing the object evolution options.
+
+    Parameters
+    ----------
+    split_probability : float, optional
+        The probability each object splits in two at each time step; default is 0.
+    split_angle : float, optional
+        The angle in radians by which the directions of the two objects produced by a
+        split diverge from the parent's direction; default is pi/8.
+    merge_distance : float, optional
+        Objects whose centers are within merge_distance km merge; default is None, in
+        which case objects do not merge.
+    seed : int, optional
+        Seed of the random number generator. Generators are seeded from both seed and
+        the time, so evolution is reproducible, including when resuming a run.
+
+    Returns
+    -------
+    options : dict
+        Dictionary containing the evolution options.
+    """
+    options = {"split_probability": split_probability, "split_angle": split_angle}
+    options.update({"merge_distance": merge_distance, "seed": seed})
+    return options
+
+
 def update_dataset(time, input_record, tracks, dataset_options, grid_options):
     """
     Update an aura dataset.
@@ -180,37 +226,163 @@ def update_dataset(time, input_record, tracks, dataset_options, grid_options):
     if "objects" not in input_record.keys():
         input_record["objects"] = dataset_options["starting_objects"]
 
-    updated_objects = copy.deepcopy(input_record["objects"])
-    for i in range(len(input_record["objects"])):
-        updated_objects[i] = update_object(time, input_record["objects"][i])
-    input_record["objects"] = updated_objects
+    objects = advect_objects(time, input_record["objects"])
+    evolution_options = dataset_options.get("evolution_options")
+    if evolution_options is not None:
+        objects = evolve_objects(time, objects, evolution_options)
+    input_record["objects"] = objects
 
     ds = create_dataset(time, grid_options)
-
-    for object in input_record["objects"]:
-        ds = add_reflectivity(ds, **object)
+    footprints = get_footprints(ds, objects)
+    for obj, footprint in zip(objects, footprints):
+        intensity = get_intensity(obj)
+        if footprint is None or intensity <= 0:
+            continue
+        ds = add_reflectivity(
+            ds, **{**obj, "intensity": intensity}, footprint=footprint
+        )
 
     input_record["dataset"] = ds
 
 
-def update_object(time, obj):
+def get_object_arrays(objects, properties):
+    """Get arrays of the given properties of the objects."""
+    return [
+        np.array([obj[prop] for obj in objects], dtype=float) for prop in properties
+    ]
+
+
+def advect_objects(time, objects):
     """
-    Update object based on the difference between time and the object time.
+    Advect the objects to time, based on the difference between time and each object's
+    time. All objects are advected in a single call to geod.fwd, and new object
+    dictionaries are returned, leaving the original objects unchanged. Objects whose
+    age exceeds their lifetime are removed.
     """
-    time_diff = np.datetime64(time) - np.datetime64(obj["time"])
+    if len(objects) == 0:
+        return []
+    object_times = np.array([obj["time"] for obj in objects], dtype="datetime64[s]")
+    time_diff = np.datetime64(time) - object_times
     time_diff = time_diff.astype("timedelta64[s]").astype(float)
-    distance = time_diff * obj["speed"]
-    new_lon, new_lat = geod.fwd(
-        obj["center_longitude"],
-        obj["center_latitude"],
-        np.rad2deg(obj["direction"]),
-        distance,
+    properties = ["center_latitude", "center_longitude", "direction", "speed"]
+    lats, lons, directions, speeds = get_object_arrays(objects, properties)
+    new_lons, new_lats = geod.fwd(
+        lons, lats, np.rad2deg(directions), time_diff * speeds
     )[0:2]
-    obj["center_latitude"] = new_lat
-    obj["center_longitude"] = new_lon
-    obj["time"] = time
-
-    return obj
+    advected_objects = []
+    for i, obj in enumerate(objects):
+        age = obj.get("age", 0) + time_diff[i]
+        lifetime = obj.get("lifetime")
+        if lifetime is not None and age > lifetime:
+            continue
+        advected_obj = {**obj, "time": time, "age": age}
+        advected_obj["center_latitude"] = new_lats[i]
+        advected_obj["center_longitude"] = new_lons[i]
+        advected_objects.append(advected_obj)
+    return advected_objects
+
+
+def get_intensity(obj):
+    """
+    Get the intensity of an object at its current age. Objects with a lifetime rise to
+    their peak intensity half way through their lifetime, then decay.
+    """
+    lifetime = obj.get("lifetime")
+    if lifetime is None:
+        return obj["intensity"]
+    return obj["intensity"] * np.sin(np.pi * np.clip(obj["age"] / lifetime, 0, 1))
+
+
+def evolve_objects(time, objects, evolution_options):
+    """Split and merge objects according to the evolution options."""
+    seed = np.datetime64(time, "s").astype(int)
+    rng = np.random.default_rng([evolution_options["seed"], seed])
+    split_probability = evolution_options["split_probability"]
+    if split_probability > 0 and len(objects) > 0:
+        splits = rng.random(len(objects)) < split_probability
+        objects = split_objects(objects, splits, evolution_options["split_angle"])
+    if evolution_options["merge_distance"] is not None and len(objects) > 1:
+        objects = merge_objects(objects, evolution_options["merge_distance"])
+    return objects
+
+
+def split_objects(objects, splits, split_angle):
+    """
+    Split each object where splits is True into two objects, offset either side of the
+    parent's direction of motion, each with half the parent's horizontal area.
+    """
+    if not np.any(splits):
+        return objects
+    parents = [obj for obj, split in zip(objects, splits) if split]
+    properties = ["center_latitude", "center_longitude", "direction"]
+    properties += ["horizontal_radius"]
+    lats, lons, directions, radii = get_object_arrays(parents, properties)
+    # Offset the children half a parent radius either side of the parent center
+    azimuths = np.rad2deg(
+        np.concatenate([directions - np.pi / 2, directions + np.pi / 2])
+    )
+    distances = np.tile(radii * 1e3 / 2, 2)
+    child_lons, child_lats = geod.fwd(
+        np.tile(lons, 2), np.tile(lats, 2), azimuths, distances
+    )[0:2]
+    signs = [-1, 1]
+    split_objects = [obj for obj, split in zip(objects, splits) if not split]
+    for i, parent in enumerate(parents):
+        for j, sign in enumerate(signs):
+            k = j * len(parents) + i
+            child = {**parent, "center_latitude": child_lats[k]}
+            child["center_longitude"] = child_lons[k]
+            child["direction"] = parent["direction"] + sign * split_angle
+            child["horizontal_radius"] = parent["horizontal_radius"] / np.sqrt(2)
+            split_objects.append(child)
+    return split_objects
+
+
+def merge_objects(objects, merge_distance):
+    """
+    Merge pairs of objects whose centers are within merge_distance km. Pairs are merged
+    closest first, with each object merging at most once per time step. The merged
+    object has the combined horizontal area of the pair, with its center and velocity
+    the area weighted means of the pair's, and its other properties those of the
+    larger object.
+    """
+    properties = ["center_latitude", "center_longitude", "horizontal_radius"]
+    properties += ["direction", "speed"]
+    lats, lons, radii, directions, speeds = get_object_arrays(objects, properties)
+    # Approximate distances in km using an equirectangular projection
+    scale = 111.32
+    points = np.stack([lats * scale, lons * scale * np.cos(np.deg2rad(lats))], axis=1)
+    pairs = cKDTree(points).query_pairs(merge_distance, output_type="ndarray")
+    if len(pairs) == 0:
+        return objects
+    separations = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    pairs = pairs[np.argsort(separations, kind="stable")]
+
+    merged = np.zeros(len(objects), dtype=bool)
+    merged_objects = []
+    for i, j in pairs:
+        if merged[i] or merged[j]:
+            continue
+        merged[i] = merged[j] = True
+        weights = radii[[i, j]] ** 2
+        larger = objects[i] if weights[0] >= weights[1] else objects[j]
+        merged_obj = {**larger}
+        merged_obj["horizontal_radius"] = np.sqrt(weights.sum())
+        merged_obj["center_latitude"] = np.average(lats[[i, j]], weights=weights)
+        merged_obj["center_longitude"] = np.average(lons[[i, j]], weights=weights)
+        u = np.average(speeds[[i, j]] * np.sin(directions[[i, j]]), weights=weights)
+        v = np.average(speeds[[i, j]] * np.cos(directions[[i, j]]), weights=weights)
+        merged_obj["speed"] = np.sqrt(u**2 + v**2)
+        merged_obj["direction"] = np.arctan2(u, v) % (2 * np.pi)
+        merged_obj["age"] = min(objects[i].get("age", 0), objects[j].get("age", 0))
+        lifetimes = [objects[i].get("lifetime"), objects[j].get("lifetime")]
+        if None in lifetimes:
+            merged_obj["lifetime"] = None
+        else:
+            merged_obj["lifetime"] = max(lifetimes)
+        merged_objects.append(merged_obj)
+    unmerged_objects = [obj for obj, m in zip(objects, merged) if not m]
+    return unmerged_objects + merged_objects
 
 
 def create_dataset(time, grid_options):
@@ -242,7 +414,7 @@ def create_dataset(time, grid_options):
     alt = np.array(grid_options["altitude"])
 
     # Create ds
-    ds_values = np.ones((1, len(alt), len(meridional_dim), len(zonal_dim))) * np.nan
+    ds_values = np.full((1, len(alt), len(meridional_dim), len(zonal_dim)), np.nan)
     coords = {"time": time, "altitude": alt}
     coords.update({dims[0]: meridional_dim, dims[1]: zonal_dim})
     variables_dict = {
@@ -261,6 +433,56 @@ def create_dataset(time, grid_options):
     return ds
 
 
+# Reflectivity is only added where the gaussian exceeds 5% of the intensity, i.e. where
+# the scaled distance from the object center is within sqrt(2 ln 20)
+footprint_distance = np.sqrt(2 * np.log(20)) * (1 + 1e-6)
+
+
+def get_footprints(ds, objects):
+    """
+    Get the footprint of each object, i.e. the slices of the altitude and horizontal
+    dimensions of ds bounding the region where the object's reflectivity is added. The
+    footprints are found from the extent of each row and column of the latitude and
+    longitude coordinates, so apply to both geographic and cartesian grids. Footprints
+    of objects entirely outside the grid are None.
+    """
+    if len(objects) == 0:
+        return []
+    latitude, longitude = ds.latitude.values, ds.longitude.values
+    altitude = ds.altitude.values
+    if latitude.ndim == 1:
+        row_min = row_max = latitude
+        column_min = column_max = longitude
+    else:
+        row_min, row_max = latitude.min(axis=1), latitude.max(axis=1)
+        column_min, column_max = longitude.min(axis=0), longitude.max(axis=0)
+    properties = ["center_latitude", "center_longitude", "horizontal_radius"]
+    properties += ["eccentricity", "alt_center", "alt_radius"]
+    lats, lons, radii, eccentricities, alts, alt_radii = get_object_arrays(
+        objects, properties
+    )
+    horizontal_extents = footprint_distance * radii / 111.32
+    horizontal_extents *= np.maximum(1, eccentricities)
+    alt_extents = footprint_distance * alt_radii
+
+    def get_slice(selected):
+        indices = np.flatnonzero(selected)
+        if len(indices) == 0:
+            return None
+        return slice(indices[0], indices[-1] + 1)
+
+    footprints = []
+    for i in range(len(objects)):
+        alt_slice = get_slice(np.abs(altitude - alts[i]) <= alt_extents[i])
+        rows = row_max >= lats[i] - horizontal_extents[i]
+        rows &= row_min <= lats[i] + horizontal_extents[i]
+        columns = column_max >= lons[i] - horizontal_extents[i]
+        columns &= column_min <= lons[i] + horizontal_extents[i]
+        footprint = (alt_slice, get_slice(rows), get_slice(columns))
+        footprints.append(None if None in footprint else footprint)
+    return footprints
+
+
 def add_reflectivity(
     ds,
     center_latitude,
@@ -271,6 +493,7 @@ def add_reflectivity(
     intensity,
     eccentricity,
     orientation,
+    footprint=None,
     **kwargs,
 ):
     """
@@ -287,17 +510,29 @@ def add_reflectivity(
     horizontal_radius : float
         The horizontal "radius" of the ellipse in km. Note this is only an approximate
         radius, as the object dimenensions are defined in geographic coordinates.
+    footprint : tuple of slice, optional
+        The altitude, meridional and zonal slices of ds containing the object, as
+        returned by get_footprints. Reflectivity is only calculated inside the
+        footprint. Default is None, in which case the entire grid is used.
     """
 
-    LON, LAT, ALT = xr.broadcast(ds.time, ds.longitude, ds.latitude, ds.altitude)[1:]
+    if footprint is None:
+        footprint = (slice(None), slice(None), slice(None))
+    alt_slice, row_slice, column_slice = footprint
 
-    # lon, lat, alt = xr.broadcast(ds.time, ds.longitude, ds.latitude, ds.altitude)[1:]
+    if ds.latitude.ndim == 1:
+        LAT = ds.latitude.values[row_slice][:, np.newaxis]
+        LON = ds.longitude.values[column_slice][np.newaxis, :]
+    else:
+        LAT = ds.latitude.values[row_slice, column_slice]
+        LON = ds.longitude.values[row_slice, column_slice]
+    ALT = ds.altitude.values[alt_slice][:, np.newaxis, np.newaxis]
 
     # Calculate the rotated coordinates
     lon_rotated = (LON - center_longitude) * np.cos(orientation)
-    lon_rotated += (LAT - center_latitude) * np.sin(orientation)
+    lon_rotated = lon_rotated + (LAT - center_latitude) * np.sin(orientation)
     lat_rotated = -(LON - center_longitude) * np.sin(orientation)
-    lat_rotated += (LAT - center_latitude) * np.cos(orientation)
+    lat_rotated = lat_rotated + (LAT - center_latitude) * np.cos(orientation)
 
     # Convert horizontal_radius to approximate lat/lon radius.
     horizontal_radius = horizontal_radius / 111.32
@@ -311,13 +546,11 @@ def add_reflectivity(
 
     # Apply a Gaussian function to create an elliptical pattern
     reflectivity = intensity * np.exp(-(distance**2) / 2)
-    reflectivity = reflectivity.where(reflectivity >= 0.05 * intensity, np.nan)
-    reflectivity = reflectivity.transpose(*ds.dims)
 
-    # Add the generated data to the ds DataArray
-    ds["reflectivity"].values = xr.where(
-        ~np.isnan(reflectivity), reflectivity, ds["reflectivity"]
-    )
+    # Add the generated data to the footprint of the reflectivity array in place
+    region = ds["reflectivity"].values[0, alt_slice, row_slice, column_slice]
+    in_object = reflectivity >= 0.05 * intensity
+    region[in_object] = reflectivity[in_object]
     return ds
 
 
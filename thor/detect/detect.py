@@ -1,13 +1,14 @@
 """Module for detecting objects in a grid."""
 
-import copy
-import numbers
 from scipy import ndimage
 import numpy as np
 import xarray as xr
 import thor.detect.preprocess as preprocess
+import thor.object.label as label
+import thor.state as state
+import thor.instrument as instrument
 from thor.log import setup_logger
-from thor.detect.steiner import steiner_scheme
+from thor.detect.steiner import steiner_scheme, steiner_scheme_fast
 from thor.utils import get_time_interval
 
 
@@ -24,7 +25,11 @@ def threshold(grid, object_options):
 
 
 def steiner(grid, object_options):
-    """Detect objects in the given grid using the Steiner et al. method."""
+    """
+    Detect objects in the given grid using the Steiner et al. method. The Steiner
+    implementation can be chosen using the "engine" key of the detection options,
+    either "fast" (default) or "reference".
+    """
     if object_options["detection"]["method"] != "steiner":
         raise ValueError("Detection method not set to steiner.")
 
@@ -59,7 +64,12 @@ def steiner(grid, object_options):
     else:
         raise ValueError("x and y must both be one or two dimensional.")
 
-    steiner_class = steiner_scheme(grid.values, X, Y, coordinates=coordinates)
+    engine = object_options["detection"].get("engine", "fast")
+    steiner_engine = steiner_engine_dispatcher.get(engine)
+    if steiner_engine is None:
+        engines = list(steiner_engine_dispatcher.keys())
+        raise ValueError(f"Steiner engine must be one of {engines}.")
+    steiner_class = steiner_engine(grid.values, X, Y, coordinates=coordinates)
     steiner_class = steiner_class.astype(int)
     steiner_class[steiner_class != 2] = 0
     binary_grid.data = steiner_class
@@ -67,6 +77,12 @@ def steiner(grid, object_options):
     return binary_grid
 
 
+steiner_engine_dispatcher = {
+    "fast": steiner_scheme_fast,
+    "reference": steiner_scheme,
+}
+
+
 detecter_dispatcher = {
     "threshold": threshold,
     "steiner": steiner,
@@ -106,6 +122,98 @@ def process_grid(grid, object_options):
     return processed_grid
 
 
+def get_mask(grid, object_options, gridcell_area):
+    """
+    Flatten the grid, then detect, label and clear small objects. This does not depend
+    on the tracking state, so can be run ahead of matching; see detect_ahead and
+    submit_detections.
+    """
+    with instrument.stage("flatten"):
+        processed_grid = process_grid(grid, object_options)
+
+    detecter = detecter_dispatcher.get(object_options["detection"]["method"])
+    if detecter is None:
+        raise ValueError("Invalid detection method.")
+    with instrument.stage("detection"):
+        binary_grid = detecter(processed_grid, object_options)
+    mask = xr.full_like(binary_grid, 0, dtype=int)
+    min_area = object_options["detection"]["min_area"]
+    with instrument.stage("label"):
+        labels = label.label_objects(binary_grid.values, min_area, gridcell_area)
+    mask.data = labels
+    mask.name = f"{object_options['name']}_mask"
+    return processed_grid, mask
+
+
+def get_detection_key(time, obj):
+    """Get the key of the detection of obj at time."""
+    return np.datetime64(time, "ns"), obj
+
+
+def detected_objects(track_options, dataset_name=None):
+    """Yield the level index, name and options of the detected objects."""
+    for level_index, level_options in enumerate(track_options):
+        for obj, object_options in level_options.items():
+            if object_options["method"] != "detect":
+                continue
+            if dataset_name is None or object_options["dataset"] == dataset_name:
+                yield level_index, obj, object_options
+
+
+def detect_ahead(
+    dataset,
+    grid_options,
+    dataset_name,
+    field,
+    grid_from_dataset,
+    track_options,
+    instrument_mode=None,
+):
+    """
+    Detect the objects of dataset_name at every time in a converted dataset. Called by
+    the dataset's prefetcher once an upcoming file is converted, so that detection runs
+    ahead of the tracking loop. Returns the detections, keyed by get_detection_key, and
+    the stages recorded in the worker; see prefetch.get_converted.
+    """
+    detections, records = {}, []
+    gridcell_area = dataset["gridcell_area"]
+    objects = list(detected_objects(track_options, dataset_name))
+    for time in dataset.time.values:
+        grid = grid_from_dataset(dataset, field, time)
+        for level_index, obj, object_options in objects:
+            context = {"time": time, "level": level_index, "object": obj}
+            args = [instrument_mode, context, "detect_worker", get_mask, grid]
+            args += [object_options, gridcell_area]
+            detection, new_records = instrument.record_worker(*args)
+            detections[get_detection_key(time, obj)] = detection
+            records += new_records
+    return detections, records
+
+
+def submit_detections(
+    time, executor, track_input_records, tracks, track_options, instrument_mode=None
+):
+    """
+    Submit the detection of all detected objects at the current time to executor, a
+    thread pool, so that detection proceeds while earlier objects and levels are
+    matched and attributed. Threads share the current grid, rather than pickling it to
+    a process pool. Objects already detected ahead by their dataset's prefetcher are
+    skipped. The results are retrieved in order by detect.
+    """
+    for level_index, obj, object_options in detected_objects(track_options):
+        input_record = track_input_records[object_options["dataset"]]
+        detections = input_record.get("detections")
+        if detections is not None and get_detection_key(time, obj) in detections:
+            continue
+        grid = input_record["current_grid"]
+        gridcell_area = input_record["dataset"]["gridcell_area"]
+        context = {"time": time, "level": level_index, "object": obj}
+        args = [instrument_mode, context, "detect_worker", get_mask, grid]
+        args += [object_options, gridcell_area]
+        future = executor.submit(instrument.record_worker, *args)
+        tracks[level_index][obj]["pending_detection"] = future
+
+
 def detect(
     track_input_records,
     tracks,
@@ -118,52 +226,40 @@ def detect(
     """Detect objects in the given grid."""
 
     object_tracks = tracks[level_index][obj]
-    previous_grid = copy.deepcopy(object_tracks["current_grid"])
-    object_tracks["previous_grids"].append(previous_grid)
+    previous_grid = object_tracks["current_grid"]
     input_record = track_input_records[object_options["dataset"]]
 
     grid = input_record["current_grid"]
-    object_tracks["previous_time_interval"] = copy.deepcopy(
-        object_tracks["current_time_interval"]
-    )
+    object_tracks["previous_time_interval"] = object_tracks["current_time_interval"]
     object_tracks["current_time_interval"] = get_time_interval(grid, previous_grid)
     dataset = input_record["dataset"]
-    if "gridcell_area" not in object_tracks.keys():
+    if "gridcell_area" not in object_tracks:
         object_tracks["gridcell_area"] = dataset["gridcell_area"]
 
-    processed_grid = process_grid(grid, object_options)
-
-    object_tracks["current_grid"] = processed_grid
-
-    detecter = detecter_dispatcher.get(object_options["detection"]["method"])
-    if detecter is None:
-        raise ValueError("Invalid detection method.")
-    binary_grid = detecter(processed_grid, object_options)
-    mask = xr.full_like(binary_grid, 0, dtype=int)
-    mask.data = ndimage.label(binary_grid)[0]
-    mask.name = f"{object_options['name']}_mask"
-
-    if object_options["detection"]["min_area"] is not None:
-        args = [mask, object_options["detection"]["min_area"], dataset["gridcell_area"]]
-        mask = clear_small_area_objects(*args)
+    # Use the result of detection run ahead of time if available
+    detections = input_record.get("detections")
+    key = get_detection_key(object_tracks["current_time"], obj)
+    pending_detection = object_tracks.pop("pending_detection", None)
+    if detections is not None and key in detections:
+        processed_grid, mask = detections.pop(key)
+    elif pending_detection is not None:
+        with instrument.stage("wait"):
+            (processed_grid, mask), records = pending_detection.result()
+        instrument.merge(records)
+    else:
+        args = [grid, object_options, dataset["gridcell_area"]]
+        processed_grid, mask = get_mask(*args)
 
-    current_mask = copy.deepcopy(object_tracks["current_mask"])
-    object_tracks["previous_masks"].append(current_mask)
-    object_tracks["current_mask"] = mask
+    state.rotate(object_tracks, "current_grid", processed_grid)
+    state.rotate(object_tracks, "current_mask", mask)
+    label.update_inventories(object_tracks, mask)
 
 
 def clear_small_area_objects(mask, min_area, gridcell_area):
     """Takes in labelled image and clears objects less than min_size."""
 
-    for obj in range(1, int(mask.max()) + 1):
-        if isinstance(gridcell_area, xr.DataArray) and len(gridcell_area.shape) == 2:
-            obj_area = gridcell_area.data[mask == obj].sum()
-        elif isinstance(gridcell_area, numbers.Real) and gridcell_area > 0:
-            obj_area = (mask == obj).sum() * gridcell_area
-        else:
-            raise ValueError("gridcell_area must be a positive number or a 2D array.")
-        if obj_area < min_area:
-            mask.data[mask == obj] = 0
+    lookup_table = label.get_area_filter(mask.values, min_area, gridcell_area)
+    cleared = np.where(lookup_table[mask.values] > 0, mask.values, 0)
     # Relabel the mask after clearing the small objects
-    mask.data = ndimage.label(mask)[0]
+    mask.data = ndimage.label(cleared)[0]
     return mask
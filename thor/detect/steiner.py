@@ -8,7 +8,7 @@ Note these radii are at most 11 km, so Haversine is accurate enough.
 
 import numpy as np
 from thor.log import setup_logger
-from numba import int32, float32, njit
+from numba import int32, float32, njit, prange
 from numba.typed import List
 from thor.utils import meshgrid_numba, numba_boolean_assign, equirectangular
 
@@ -214,3 +214,224 @@ def values_within_radius(
     radius_cond = radius_cond.flatten() & ~np.isnan(array_box.flatten())
 
     return array_box[radius_cond]
+
+
+def steiner_scheme_fast(
+    reflectivity,
+    X,
+    Y,
+    radius_option=1,
+    delta_Z_option=0,
+    background_radius=11e3,
+    dBZ_threshold=42,
+    use_dBZ_threshold=True,
+    coordinates="geographic",
+):
+    """
+    Fast implementation of steiner_scheme. The neighbourhoods of each point are
+    described by precomputed kernels, giving for each row the half width in columns of
+    the neighbourhood at each row offset. These depend only on the row, so geographic
+    grids use a separate kernel for each latitude. Background reflectivities are then
+    obtained by convolving the linear reflectivity with the background kernel, using
+    cumulative sums along rows, in parallel over rows. Convective cores are dilated
+    using the precomputed kernel for each convective radius, in the same order as
+    steiner_scheme so that the classifications agree. Requires columns to be evenly
+    spaced; steiner_scheme is used otherwise.
+    """
+    reflectivity = np.asarray(reflectivity, dtype=np.float32)
+    X = np.asarray(X, dtype=np.float32)
+    Y = np.asarray(Y, dtype=np.float32)
+    args = [reflectivity, X, Y, radius_option, delta_Z_option, background_radius]
+    args += [dBZ_threshold, use_dBZ_threshold, coordinates]
+    # Allow for the rounding of single precision coordinates
+    spacing = np.diff(X, axis=1)
+    if spacing.size == 0 or not np.allclose(spacing, spacing[0, 0], rtol=1e-3):
+        logger.warning("Columns not evenly spaced. Using reference Steiner scheme.")
+        return steiner_scheme(*args)
+    if coordinates == "geographic":
+        X = np.radians(X)
+        Y = np.radians(Y)
+    elif coordinates != "cartesian":
+        raise ValueError("Coordinates must be 'geographic' or 'cartesian'.")
+    geographic = coordinates == "geographic"
+
+    background_kernel = get_kernel(X, Y, background_radius, geographic)
+    convective_radii = np.arange(1e3, 5e3 + 1e3, 1e3)
+    radius_kernels = [get_kernel(X, Y, r, geographic) for r in convective_radii]
+    max_offset = max([kernel.shape[1] // 2 for kernel in radius_kernels])
+    # Pad each convective radius kernel to a common number of row offsets
+    convective_kernels = np.full(
+        (len(convective_radii), X.shape[0], 2 * max_offset + 1), -1, dtype=np.int32
+    )
+    for k, kernel in enumerate(radius_kernels):
+        offset = kernel.shape[1] // 2
+        convective_kernels[k, :, max_offset - offset : max_offset + offset + 1] = kernel
+
+    args = [reflectivity, background_kernel, radius_option, delta_Z_option]
+    args += [dBZ_threshold, use_dBZ_threshold]
+    cores, radius_indices = get_convective_cores(*args)
+    args = [reflectivity, cores, radius_indices, convective_kernels]
+    return dilate_convective_cores(*args)
+
+
+@njit
+def get_point(X, Y, j, i):
+    """
+    Get the coordinates of the point (j, i), linearly extrapolating along row j for
+    columns i beyond the grid. Columns are evenly spaced, so this is exact for columns
+    of regular grids.
+    """
+    nx = X.shape[1]
+    if i < nx:
+        return X[j, i], Y[j, i]
+    steps = i - (nx - 1)
+    x = X[j, nx - 1] + steps * (X[j, nx - 1] - X[j, nx - 2])
+    y = Y[j, nx - 1] + steps * (Y[j, nx - 1] - Y[j, nx - 2])
+    return x, y
+
+
+@njit
+def get_half_width(X, Y, j, jj, c, radius, geographic):
+    """
+    Get the number of columns either side of column c in row jj within radius of the
+    point (j, c), or -1 if there are none. As in values_within_radius, points must
+    also lie within the box defined by the row and column through (j, c). The scan is
+    bounded by the radius rather than the grid, so that kernels are not truncated on
+    grids narrower than the neighbourhood; columns beyond the grid are extrapolated.
+    """
+    if geographic:
+        y_distance = equirectangular(Y[j, c], X[j, c], Y[jj, c], X[j, c])
+    else:
+        y_distance = np.sqrt((Y[jj, c] - Y[j, c]) ** 2)
+    if y_distance > radius:
+        return -1
+    width = -1
+    di = 0
+    while True:
+        x = get_point(X, Y, j, c + di)[0]
+        xx, yy = get_point(X, Y, jj, c + di)
+        if geographic:
+            x_distance = equirectangular(Y[j, c], X[j, c], Y[j, c], x)
+            distance = equirectangular(yy, xx, Y[j, c], X[j, c])
+        else:
+            x_distance = np.sqrt((x - X[j, c]) ** 2)
+            distance = np.sqrt((yy - Y[j, c]) ** 2 + (xx - X[j, c]) ** 2)
+        if x_distance > radius or distance > radius:
+            break
+        width = di
+        di += 1
+    return width
+
+
+@njit
+def get_kernel(X, Y, radius, geographic):
+    """
+    Get the neighbourhood kernel for each row of the grid. Entry [j, m + offset] gives
+    the half width, in columns, of the neighbourhood of points in row j at row j + m,
+    or -1 if the neighbourhood does not extend to that row.
+    """
+    ny = X.shape[0]
+    # Evaluate kernels using the central column, as columns are evenly spaced
+    c = X.shape[1] // 2
+    max_offset = 0
+    for j in range(ny):
+        for jj in range(j + 1, ny):
+            if get_half_width(X, Y, j, jj, c, radius, geographic) < 0:
+                break
+            max_offset = max(max_offset, jj - j)
+        for jj in range(j - 1, -1, -1):
+            if get_half_width(X, Y, j, jj, c, radius, geographic) < 0:
+                break
+            max_offset = max(max_offset, j - jj)
+    kernel = np.full((ny, 2 * max_offset + 1), -1, dtype=np.int32)
+    for j in range(ny):
+        for m in range(-max_offset, max_offset + 1):
+            jj = j + m
+            if jj < 0 or jj >= ny:
+                continue
+            width = get_half_width(X, Y, j, jj, c, radius, geographic)
+            kernel[j, m + max_offset] = width
+    return kernel
+
+
+@njit(parallel=True)
+def get_convective_cores(
+    reflectivity,
+    background_kernel,
+    radius_option,
+    delta_Z_option,
+    dBZ_threshold,
+    use_dBZ_threshold,
+):
+    """
+    Get the convective cores, and the convective radius index of each point, from the
+    mean background reflectivity in linear units.
+    """
+    ny, nx = reflectivity.shape
+    max_offset = background_kernel.shape[1] // 2
+    # Cumulative sums along rows of linear reflectivity and number of valid points
+    linear_sums = np.zeros((ny, nx + 1))
+    counts = np.zeros((ny, nx + 1))
+    for j in prange(ny):
+        for i in range(nx):
+            value = reflectivity[j, i]
+            linear_sums[j, i + 1] = linear_sums[j, i]
+            counts[j, i + 1] = counts[j, i]
+            if not np.isnan(value):
+                linear_sums[j, i + 1] += 10.0 ** (value / 10)
+                counts[j, i + 1] += 1
+
+    cores = np.zeros((ny, nx), dtype=np.bool_)
+    radius_indices = np.zeros((ny, nx), dtype=np.int32)
+    for j in prange(ny):
+        for i in range(nx):
+            value = reflectivity[j, i]
+            if np.isnan(value):
+                continue
+            total = 0.0
+            count = 0.0
+            for m in range(-max_offset, max_offset + 1):
+                width = background_kernel[j, m + max_offset]
+                if width < 0:
+                    continue
+                start = max(i - width, 0)
+                end = min(i + width + 1, nx)
+                total += linear_sums[j + m, end] - linear_sums[j + m, start]
+                count += counts[j + m, end] - counts[j + m, start]
+            background = 10 * np.log10(total / count)
+            convective_radius = get_convective_radius(background, radius_option)
+            radius_indices[j, i] = int(np.round(convective_radius / 1e3)) - 1
+            delta_Z_threshold = get_delta_Z_threshold(background, delta_Z_option)
+            if use_dBZ_threshold and (value >= dBZ_threshold):
+                cores[j, i] = True
+            elif value - background >= delta_Z_threshold:
+                cores[j, i] = True
+    return cores, radius_indices
+
+
+@njit
+def dilate_convective_cores(reflectivity, cores, radius_indices, convective_kernels):
+    """
+    Classify points as convective (2) if within the convective radius of a core, and
+    stratiform (1) otherwise. As in steiner_scheme, points already classified as
+    convective are not themselves dilated.
+    """
+    ny, nx = reflectivity.shape
+    max_offset = convective_kernels.shape[2] // 2
+    classification = np.zeros((ny, nx), dtype=np.int32)
+    for j in range(ny):
+        for i in range(nx):
+            if np.isnan(reflectivity[j, i]) or classification[j, i] != 0:
+                continue
+            if not cores[j, i]:
+                classification[j, i] = 1
+                continue
+            kernel = convective_kernels[radius_indices[j, i], j]
+            for m in range(-max_offset, max_offset + 1):
+                width = kernel[m + max_offset]
+                if width < 0:
+                    continue
+                for ii in range(max(i - width, 0), min(i + width + 1, nx)):
+                    if not np.isnan(reflectivity[j + m, ii]):
+                        classification[j + m, ii] = 2
+    return classification
@@ -1,11 +1,10 @@
 """Module for grouping objects into new objects."""
 
-import copy
 import numpy as np
 import xarray as xr
-import networkx
-from networkx.algorithms.components.connected import connected_components
 import thor.detect.preprocess as preprocess
+import thor.object.label as label
+import thor.state as state
 from thor.utils import get_time_interval
 
 
@@ -20,9 +19,10 @@ def group(
 ):
     """Group objects into new objects."""
 
+    object_tracks = tracks[level_index][obj]
     dataset = track_input_records[object_options["dataset"]]["dataset"]
-    if "gridcell_area" not in tracks[level_index][obj].keys():
-        tracks[level_index][obj]["gridcell_area"] = dataset["gridcell_area"]
+    if "gridcell_area" not in object_tracks:
+        object_tracks["gridcell_area"] = dataset["gridcell_area"]
     member_objects = object_options["grouping"]["member_objects"]
     member_levels = object_options["grouping"]["member_levels"]
 
@@ -35,20 +35,14 @@ def group(
     grid = xr.Dataset(grid_dict)
     mask = get_connected_components(tracks, object_options)
 
-    previous_mask = copy.deepcopy(tracks[level_index][obj]["current_mask"])
-    tracks[level_index][obj]["previous_masks"].append(previous_mask)
-    tracks[level_index][obj]["current_mask"] = mask
+    state.rotate(object_tracks, "current_mask", mask)
+    label.update_inventories(object_tracks, mask)
 
-    previous_grid = copy.deepcopy(tracks[level_index][obj]["current_grid"])
-    tracks[level_index][obj]["previous_grids"].append(previous_grid)
-    tracks[level_index][obj]["current_grid"] = grid
+    previous_grid = object_tracks["current_grid"]
+    state.rotate(object_tracks, "current_grid", grid)
 
-    tracks[level_index][obj]["previous_time_interval"] = copy.deepcopy(
-        tracks[level_index][obj]["current_time_interval"]
-    )
-    tracks[level_index][obj]["current_time_interval"] = get_time_interval(
-        grid, previous_grid
-    )
+    object_tracks["previous_time_interval"] = object_tracks["current_time_interval"]
+    object_tracks["current_time_interval"] = get_time_interval(grid, previous_grid)
 
 
 def get_connected_components(tracks, object_options):
@@ -56,82 +50,91 @@ def get_connected_components(tracks, object_options):
 
     member_objects = object_options["grouping"]["member_objects"]
     member_levels = object_options["grouping"]["member_levels"]
+    member_min_areas = object_options["grouping"]["member_min_areas"]
 
     # Relabel objects in mask so that object numbers are unique
     current_max = 0
     masks = []
+    label_areas = []
     for obj, level in zip(member_objects, member_levels):
         mask = tracks[level][obj]["current_mask"]
-        new_mask = mask.copy()
-        new_mask = new_mask.where(mask == 0, mask + current_max)
-        masks.append(new_mask.values)
-        current_max += np.max(mask.values)
-
-    # Create graph for objects that overlap at different vertical levels.
-    overlap_graph = networkx.Graph()
-    overlap_graph.add_nodes_from(set(range(1, current_max)))
-
-    # Create edges between the objects that overlap vertically, assuming member objects
-    # listed in increasing altitude.
-    for i in range(len(masks) - 1):
-        # Determine the objects in frame i.
-        objects = set(np.unique(masks[i])).difference({0})
-        for j in objects:
-            # Determine the objects in frame i + 1 that overlap with object j.
-            overlap = np.logical_and(masks[i] == j, masks[i + 1] > 0)
-            overlap_objects = set(masks[i + 1][overlap].flatten())
-            # If objects overlap, add edge between object j and first
-            # object from overlap set
-            for k in overlap_objects:
-                overlap_graph.add_edges_from([(j, k)])
-
-    # Initialize a new mask ds to represent the grouped object.
+        inventory = tracks[level][obj].get("current_mask_inventory")
+        if inventory is None:
+            inventory = label.LabeledMask(mask)
+        new_mask = np.where(mask.values == 0, 0, mask.values + current_max)
+        masks.append(new_mask)
+        gridcell_area = tracks[level][obj]["gridcell_area"]
+        label_areas.append(label.get_label_areas(new_mask, gridcell_area))
+        current_max += inventory.max_id
+
+    # Get the edges between objects that overlap at different vertical levels,
+    # assuming member objects listed in increasing altitude, and the resulting
+    # connected components. Each label is mapped to the smallest label in its component.
+    edges = get_overlap_edges(masks)
+    roots = union_find(current_max, edges)
+
+    # Require that components span all member objects, and that the total areas of
+    # member objects are above thresholds after grouping
+    accepted = np.ones(current_max + 1, dtype=bool)
+    for j in range(len(masks)):
+        present = np.flatnonzero(label_areas[j] > 0)
+        present = present[present > 0]
+        in_mask = np.bincount(roots[present], minlength=current_max + 1) > 0
+        areas = label_areas[j][present]
+        weights = {"weights": areas, "minlength": current_max + 1}
+        component_areas = np.bincount(roots[present], **weights)
+        accepted &= in_mask & (component_areas >= member_min_areas[j])
+    accepted[0] = False
+
+    # Number the new grouped objects in order of their smallest member label, and write
+    # the grouped masks using a lookup table from member labels to grouped object ids
+    new_ids = np.zeros(current_max + 1, dtype=int)
+    new_ids[accepted] = np.arange(1, np.count_nonzero(accepted) + 1)
+    lookup_table = new_ids[roots]
     mask_da_list = []
-    for obj, level in zip(member_objects, member_levels):
+    for j, (obj, level) in enumerate(zip(member_objects, member_levels)):
         mask_da = xr.full_like(tracks[level][obj]["current_mask"], 0, dtype=int)
+        mask_da.data = lookup_table[masks[j]]
         mask_da_list.append(mask_da)
-
-    # Create new objects based on connected components
-    new_objs = list(connected_components(overlap_graph))
-    # Create a counter, as some of the connected components will be rejected
-    new_obj_counter = 0
-    for i in range(len(new_objs)):
-        # Require that components span all member objects
-        if not component_span(masks, list(new_objs[i])):
-            continue
-        # Require total areas of member objects are above thresholds after grouping
-        if not check_areas(masks, tracks, object_options, list(new_objs[i])):
-            continue
-        # Create new grouped objects
-        new_obj_counter += 1
-        for j in range(len(mask_da_list)):
-            mask_da_list[j] = mask_da_list[j].where(
-                ~np.isin(masks[j], list(new_objs[i])), new_obj_counter
-            )
     grouped_mask = xr.Dataset({da.name: da for da in mask_da_list})
     return grouped_mask
 
 
-def check_areas(masks, tracks, object_options, objs):
+def get_overlap_edges(masks):
     """
-    Check if the areas of the member objects after grouping are above the threshold.
+    Get the unique pairs of labels of objects overlapping in consecutive masks, from a
+    single stacked array of label pairs.
     """
-    member_objects = object_options["grouping"]["member_objects"]
-    member_levels = object_options["grouping"]["member_levels"]
-    member_min_areas = object_options["grouping"]["member_min_areas"]
-    for j in range(len(masks)):
-        gridcell_area = tracks[member_levels[j]][member_objects[j]]["gridcell_area"]
-        mask_j = np.isin(masks[j], objs)
-        if gridcell_area.where(mask_j).sum() < member_min_areas[j]:
-            return False
-    return True
-
+    if len(masks) < 2:
+        return np.zeros((0, 2), dtype=int)
+    lower = np.stack(masks[:-1]).ravel()
+    upper = np.stack(masks[1:]).ravel()
+    overlap = (lower > 0) & (upper > 0)
+    pairs = np.stack([lower[overlap], upper[overlap]], axis=1)
+    return np.unique(pairs, axis=0)
 
-def component_span(masks, new_objs):
-    """Check if connected component spans all member objects."""
 
-    in_mask = []
-    for i in range(len(masks)):
-        in_mask.append(any([j in masks[i] for j in new_objs]))
-
-    return all(in_mask)
+def union_find(number_labels, edges):
+    """
+    Get the connected components of the graph with nodes 0 to number_labels and the
+    given edges, using an array based union-find. Returns an array mapping each node
+    to the smallest node in its component.
+    """
+    parents = np.arange(number_labels + 1)
+    if len(edges) == 0:
+        return parents
+    while True:
+        # Hook the root of each edge end onto the smaller of the two roots
+        roots_1 = parents[edges[:, 0]]
+        roots_2 = parents[edges[:, 1]]
+        smaller_roots = np.minimum(roots_1, roots_2)
+        np.minimum.at(parents, roots_1, smaller_roots)
+        np.minimum.at(parents, roots_2, smaller_roots)
+        # Compress paths so every node points directly to its root
+        while True:
+            grandparents = parents[parents]
+            if np.array_equal(grandparents, parents):
+                break
+            parents = grandparents
+        if np.array_equal(parents[edges[:, 0]], parents[edges[:, 1]]):
+            return parents
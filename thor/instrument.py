@@ -0,0 +1,197 @@
+"""
+Instrumentation of the tracking loop. Stages of the loop, e.g. detection, matching and
+attribute recording, are wrapped in the stage context manager, which records the wall
+time, and optionally the tracemalloc peak memory, of each stage against the current
+time step, hierarchy level and object. Stages may be nested, with each stage recorded
+under its path, e.g. "match/costs/flow", and its measurements including those of its
+nested stages. When instrumentation is off, stages do nothing.
+
+Stages are recorded by the thread that started recording. Work done in worker threads
+or processes, e.g. detection ahead of the tracking loop, is recorded with
+record_worker, which returns the worker's records to be added with merge.
+"""
+
+import os
+import threading
+import time as time_module
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+from thor.log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+modes = [None, "time", "memory"]
+columns = ["time", "level", "object", "stage", "wall_time", "peak_memory"]
+recorder = None
+# Recorders of worker threads, and of the threads of worker processes
+worker = threading.local()
+
+
+def start(mode="time"):
+    """
+    Start recording stages.
+
+    Parameters
+    ----------
+    mode : str, optional
+        Either "time", to record wall times only, or "memory", to also record peak
+        memory usage with tracemalloc. Tracing memory allocations slows the run, so
+        "memory" is best reserved for profiling runs. Default is "time".
+    """
+    global recorder
+    if mode not in modes[1:]:
+        raise ValueError(f"Instrumentation mode must be one of {modes[1:]}.")
+    recorder = create_recorder(mode)
+    recorder["owner"] = (os.getpid(), threading.get_ident())
+    if mode == "memory" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        recorder["stop_tracing"] = True
+
+
+def create_recorder(mode, context=None):
+    """Create a recorder dictionary."""
+    new_recorder = {"mode": mode, "records": [], "stack": []}
+    new_recorder["context"] = {"time": None, "level": None, "object": None}
+    if context is not None:
+        new_recorder["context"].update(context)
+    return new_recorder
+
+
+def get_recorder():
+    """
+    Get the recorder of the current thread, i.e. the worker recorder if the thread is
+    recording a worker, or the main recorder if the thread started recording.
+    """
+    worker_recorder = getattr(worker, "recorder", None)
+    if worker_recorder is not None:
+        return worker_recorder
+    if recorder is not None:
+        if recorder["owner"] == (os.getpid(), threading.get_ident()):
+            return recorder
+    return None
+
+
+def stop():
+    """Stop recording stages, returning the recorded stages as a DataFrame."""
+    global recorder
+    if recorder is None:
+        return None
+    if recorder.get("stop_tracing", False):
+        tracemalloc.stop()
+    records = pd.DataFrame(recorder["records"], columns=columns)
+    recorder = None
+    return records
+
+
+def set_context(**context):
+    """Set the time, level or object subsequent stages are recorded against."""
+    current_recorder = get_recorder()
+    if current_recorder is not None:
+        current_recorder["context"].update(context)
+
+
+@contextmanager
+def stage(name):
+    """
+    Record the wall time in seconds, and if tracing memory, the peak memory in MB
+    allocated above that at the start of the stage.
+    """
+    current_recorder = get_recorder()
+    if current_recorder is None:
+        yield
+        return
+    stack = current_recorder["stack"]
+    trace = current_recorder["mode"] == "memory"
+    path = name if len(stack) == 0 else f"{stack[-1]['path']}/{name}"
+    entry = {"path": path}
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        # Fold the peak so far into the enclosing stage before resetting the peak
+        if len(stack) > 0:
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        entry.update({"memory_start": current, "peak": current})
+    stack.append(entry)
+    entry["start"] = time_module.perf_counter()
+    try:
+        yield
+    finally:
+        wall_time = time_module.perf_counter() - entry["start"]
+        stack.pop()
+        peak_memory = None
+        if trace:
+            peak = max(entry["peak"], tracemalloc.get_traced_memory()[1])
+            peak_memory = (peak - entry["memory_start"]) / 1e6
+            if len(stack) > 0:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        context = current_recorder["context"]
+        record = [context["time"], context["level"], context["object"]]
+        record += [entry["path"], wall_time, peak_memory]
+        current_recorder["records"].append(record)
+
+
+def record_worker(mode, context, name, function, *args):
+    """
+    Call function(*args) in a worker thread or process, recording it as stage name,
+    and any stages within it, against context. As tracemalloc peaks are shared by all
+    the threads of a process, only wall times are recorded in workers.
+
+    Parameters
+    ----------
+    mode : str or None
+        The instrumentation mode of the main recorder. If None, nothing is recorded.
+    context : dict
+        The time, level and object the stages are recorded against.
+
+    Returns
+    -------
+    output : object
+        The output of function.
+    records : list
+        The recorded stages, to be added to the main recorder with merge.
+    """
+    if mode is None:
+        return function(*args), []
+    worker.recorder = create_recorder("time", context)
+    try:
+        with stage(name):
+            output = function(*args)
+        return output, worker.recorder["records"]
+    finally:
+        worker.recorder = None
+
+
+def merge(records):
+    """Add stages recorded by record_worker to the main recorder."""
+    if recorder is not None:
+        recorder["records"] += records
+
+
+def summarise(records):
+    """
+    Summarise the recorded stages, giving the number of calls, and the total and mean
+    wall times, and maximum peak memory, of each stage.
+    """
+    grouped = records.groupby("stage", sort=False)
+    summary = grouped["wall_time"].agg(["count", "sum", "mean"])
+    summary.columns = ["calls", "total_time", "mean_time"]
+    summary["peak_memory"] = grouped["peak_memory"].max()
+    return summary.sort_values("total_time", ascending=False)
+
+
+def write(records, output_directory):
+    """
+    Write the recorded stages, and their summary, to the records directory of the
+    run's output directory, and log the summary.
+    """
+    if records is None:
+        return
+    directory = output_directory / "records"
+    directory.mkdir(parents=True, exist_ok=True)
+    records.to_csv(directory / "instrumentation.csv", index=False)
+    summary = summarise(records)
+    summary.to_csv(directory / "instrumentation_summary.csv")
+    logger.info(f"Instrumentation summary:\n{summary.to_string()}")
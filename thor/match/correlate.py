@@ -8,21 +8,28 @@ https://dx.doi.org/10.1175/1520-0450(1971)010<0118:AATFOC>2.0.CO;2
 """
 
 import numpy as np
-from scipy import ndimage
+from scipy import ndimage, fft
 import thor.object.box as box
 from thor.match.utils import get_grids
 
 
-def get_flow(bounding_box, object_tracks, object_options, grid_options, flow_margin):
-    """Get the optical flow within bounding_box."""
-
-    current_grid, previous_grid = get_grids(object_tracks, object_options)
+def get_flow_box(bounding_box, flow_margin, grid_options, shape):
+    """Expand bounding_box by flow_margin to get the box used for optical flow."""
     flow_margin_row, flow_margin_col = box.get_margins_pixels(
         bounding_box, flow_margin, grid_options
     )
     flow_box = bounding_box.copy()
     flow_box = box.expand_box(flow_box, flow_margin_row, flow_margin_col)
-    flow_box = box.clip_box(flow_box, current_grid.shape)
+    flow_box = box.clip_box(flow_box, shape)
+    return flow_box
+
+
+def get_flow(bounding_box, object_tracks, object_options, grid_options, flow_margin):
+    """Get the optical flow within bounding_box."""
+
+    current_grid, previous_grid = get_grids(object_tracks, object_options)
+    args = [bounding_box, flow_margin, grid_options, current_grid.shape]
+    flow_box = get_flow_box(*args)
 
     box_previous = previous_grid[
         flow_box["row_min"] : flow_box["row_max"] + 1,
@@ -39,6 +46,148 @@ def get_flow(bounding_box, object_tracks, object_options, grid_options, flow_mar
     return calculate_flow(box_previous, box_current), flow_box
 
 
+def initialise_global_flow_cache():
+    """
+    Initialise the global flow cache. A single cache is shared by all objects, so that
+    objects detected on the same grid at the same time step reuse the same domain wide
+    cross correlation. Entries are evicted whenever the time step advances.
+    """
+    return {"time": None, "flows": {}}
+
+
+def get_global_flow_key(bounding_box, object_options, grid, flow_margin):
+    """
+    Get the key identifying a global flow calculation. Grids are identified by the
+    dataset they come from, their name, and their attributes, which record how the
+    grid was processed, e.g. the flattening method and altitudes.
+    """
+    attributes = str(sorted(grid.attrs.items()))
+    box_key = tuple(int(bounding_box[key]) for key in sorted(bounding_box.keys()))
+    return (object_options["dataset"], grid.name, attributes, flow_margin, box_key)
+
+
+def get_global_flow(
+    bounding_box, object_tracks, object_options, grid_options, flow_margin
+):
+    """
+    Get the global flow within bounding_box, reusing the result if an object on the same
+    grid has already calculated it at the current time step.
+    """
+    cache = object_tracks.get("global_flow_cache")
+    if cache is None:
+        args = [bounding_box, object_tracks, object_options, grid_options]
+        return get_flow(*args, flow_margin)
+
+    current_grid, previous_grid = get_grids(object_tracks, object_options)
+    time = (str(current_grid.time.values), str(previous_grid.time.values))
+    if cache["time"] != time:
+        # Time step has advanced, so evict the old entries
+        cache["time"] = time
+        cache["flows"] = {}
+    key = get_global_flow_key(bounding_box, object_options, current_grid, flow_margin)
+    if key not in cache["flows"]:
+        args = [bounding_box, object_tracks, object_options, grid_options]
+        cache["flows"][key] = get_flow(*args, flow_margin)
+    flow, flow_box = cache["flows"][key]
+    return flow.copy(), flow_box.copy()
+
+
+def get_flows(bounding_boxes, object_tracks, object_options, grid_options, flow_margin):
+    """
+    Get the optical flows within each of bounding_boxes using the flow engine specified
+    in the tracking options. The "reference" engine calls get_flow for each box, while
+    the "batched" engine calls get_flows_batched.
+    """
+    flow_engine = object_options["tracking"]["options"]["flow_engine"]
+    if flow_engine == "batched":
+        args = [bounding_boxes, object_tracks, object_options, grid_options]
+        return get_flows_batched(*args, flow_margin)
+    elif flow_engine != "reference":
+        raise ValueError("Flow engine must be 'reference' or 'batched'.")
+    flows, flow_boxes = [], []
+    for bounding_box in bounding_boxes:
+        args = [bounding_box, object_tracks, object_options, grid_options]
+        flow, flow_box = get_flow(*args, flow_margin)
+        flows.append(flow)
+        flow_boxes.append(flow_box)
+    return flows, flow_boxes
+
+
+def get_flows_batched(
+    bounding_boxes, object_tracks, object_options, grid_options, flow_margin
+):
+    """
+    Get the optical flows within each of bounding_boxes with batched FFTs. The grids
+    are converted to numpy arrays once, and the boxes then sliced and stacked by shape,
+    so that each distinct shape requires only one forward and inverse real FFT. Boxes
+    are not padded, as zero padding changes the periodic cross covariance; the flows
+    therefore match those of get_flow.
+    """
+    current_grid, previous_grid = get_grids(object_tracks, object_options)
+    shape = current_grid.shape
+    current_values = np.nan_to_num(np.asarray(current_grid.values))
+    previous_values = np.nan_to_num(np.asarray(previous_grid.values))
+
+    flow_boxes, previous_boxes, current_boxes = [], [], []
+    for bounding_box in bounding_boxes:
+        flow_box = get_flow_box(bounding_box, flow_margin, grid_options, shape)
+        flow_boxes.append(flow_box)
+        rows = slice(flow_box["row_min"], flow_box["row_max"] + 1)
+        cols = slice(flow_box["col_min"], flow_box["col_max"] + 1)
+        previous_boxes.append(previous_values[rows, cols])
+        current_boxes.append(current_values[rows, cols])
+    flows = calculate_flows(previous_boxes, current_boxes)
+    return list(flows), flow_boxes
+
+
+def calculate_flows(grids1, grids2, workers=-1):
+    """
+    Calculate the optical flow vectors for each pair of grids in grids1 and grids2,
+    stacking grids of the same shape so each shape is transformed once. Real input FFTs
+    are performed using all available threads. The cross covariances are smoothed and
+    their maxima located as in calculate_flow, the per grid reference implementation,
+    so the flows match those of calculate_flow.
+    """
+    flows = np.zeros((len(grids1), 2), dtype=int)
+    shapes = [np.shape(grid) for grid in grids1]
+    for shape in set(shapes):
+        indices = [i for i, s in enumerate(shapes) if s == shape]
+        stack1 = np.stack([grids1[i] for i in indices]).astype(float)
+        stack2 = np.stack([grids2[i] for i in indices]).astype(float)
+        cross_covariance = get_cross_covariances(stack1, stack2, workers=workers)
+        # Smooth each cross covariance separately, as in calculate_flow
+        sigma = (1 / 8) * min(shape)
+        smoothed_covariance = ndimage.gaussian_filter(
+            cross_covariance, (0, sigma, sigma)
+        )
+        flat_smoothed = smoothed_covariance.reshape(len(indices), -1)
+        maxima = np.argmax(flat_smoothed, axis=1)
+        rows, cols = np.unravel_index(maxima, shape)
+        # Calculate flow relative to center - see calculate_flow.
+        centre = np.array(shape) // 2
+        flows[indices] = np.stack([rows, cols], axis=1) - centre
+    return flows
+
+
+def get_cross_covariances(stack1, stack2, workers=-1):
+    """
+    Compute the cross covariance matrices for stacks of grids using real input FFTs.
+    For real grids this matches get_cross_covariance, which uses complex FFTs.
+    """
+    axes = (-2, -1)
+    fourier_previous_conj = np.conj(fft.rfft2(stack1, axes=axes, workers=workers))
+    fourier_current = fft.rfft2(stack2, axes=axes, workers=workers)
+    cross_power_spectrum = fourier_current * fourier_previous_conj
+    normalize = np.abs(cross_power_spectrum)
+    normalize[normalize == 0] = 1  # prevent divide by zero error
+    cross_power_spectrum /= normalize
+    shape = stack1.shape[-2:]
+    args = {"s": shape, "axes": axes, "workers": workers}
+    cross_covariance = fft.irfft2(cross_power_spectrum, **args)
+    # Shift the zero frequency to the middle of each matrix; equivalent to shift
+    return fft.fftshift(cross_covariance, axes=axes)
+
+
 def calculate_flow(grid1, grid2, global_flow=False):
     """Calculate optical flow vector using cross covariance."""
     cross_covariance = get_cross_covariance(grid1, grid2)
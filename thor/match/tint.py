@@ -26,12 +26,14 @@ https://dx.doi.org/10.1175/MWR-D-22-0146.1
 
 import numpy as np
 from scipy import optimize
-from thor.match.correlate import get_flow
+from thor.match.correlate import get_global_flow, get_flows
 from thor.match.utils import get_masks
 import thor.object.object as thor_object
+import thor.object.label as label
 import thor.object.box as box
 from thor.log import setup_logger
 import thor.grid as grid
+import thor.instrument as instrument
 
 logger = setup_logger(__name__)
 
@@ -39,8 +41,10 @@ logger = setup_logger(__name__)
 def get_costs_data(object_tracks, object_options, grid_options):
     """Get the costs matrix used to match objects between previous and current masks."""
     current_mask, previous_mask = get_masks(object_tracks, object_options)
-    previous_total = np.max(previous_mask.values)
-    current_total = np.max(current_mask.values)
+    inventories = label.get_inventories(object_tracks, object_options)
+    current_inventory, previous_inventory = inventories
+    previous_total = previous_inventory.max_id
+    current_total = current_inventory.max_id
     local_flow_margin = object_options["tracking"]["options"]["local_flow_margin"]
     global_flow_margin = object_options["tracking"]["options"]["global_flow_margin"]
 
@@ -48,7 +52,7 @@ def get_costs_data(object_tracks, object_options, grid_options):
         unique_global_flow_box = get_unique_global_flow_box(
             global_flow_margin, grid_options
         )
-        unique_global_flow, unique_global_flow_box = get_flow(
+        unique_global_flow, unique_global_flow_box = get_global_flow(
             unique_global_flow_box,
             object_tracks,
             object_options,
@@ -67,15 +71,11 @@ def get_costs_data(object_tracks, object_options, grid_options):
     area_differences_matrix = np.full(matrix_shape, np.nan, dtype=float)
     overlap_areas_matrix = np.full(matrix_shape, np.nan, dtype=float)
 
-    flows = []
-    global_flows = []
     corrected_flows = []
     cases = []
     previous_areas = []
     previous_centers = []
     bounding_boxes = []
-    flow_boxes = []
-    global_flow_boxes = []
     search_boxes = []
     previous_displacements = []
 
@@ -91,29 +91,35 @@ def get_costs_data(object_tracks, object_options, grid_options):
 
     search_margin = object_options["tracking"]["options"]["search_margin"]
 
+    # Get the centers and areas of all objects from the mask inventories, and the
+    # overlap areas of all pairs of previous and current objects in a single pass.
+    previous_rows, previous_cols = previous_inventory.centers
+    previous_object_areas = previous_inventory.areas
+    current_rows, current_cols = current_inventory.centers
+    current_object_areas = current_inventory.areas
+    overlap_areas = thor_object.get_overlap_areas(
+        previous_mask, current_mask, gridcell_area
+    )
+    # Record the (previous_id, current_id) pairs for which to evaluate the cost function
+    pair_previous_ids = []
+    pair_current_ids = []
+
+    # Get the object bounding boxes, and the local and global flows of all objects
     for previous_id in previous_ids:
-        # Get the object bounding box and local flow
-        bounding_box = box.get_bounding_box(previous_id, previous_mask)
-        bounding_boxes.append(bounding_box)
-        flow, flow_box = get_flow(
-            bounding_box, object_tracks, object_options, grid_options, local_flow_margin
-        )
-        flows.append(flow)
-        flow_boxes.append(flow_box)
-        # Get the global flow
+        bounding_boxes.append(previous_inventory.get_bounding_box(previous_id))
+    args = [bounding_boxes, object_tracks, object_options, grid_options]
+    with instrument.stage("flow"):
+        flows, flow_boxes = get_flows(*args, local_flow_margin)
         if object_options["tracking"]["options"]["unique_global_flow"]:
-            global_flow = unique_global_flow
-            global_flow_box = unique_global_flow_box
+            global_flows = [unique_global_flow] * len(previous_ids)
+            global_flow_boxes = [unique_global_flow_box] * len(previous_ids)
         else:
-            global_flow, global_flow_box = get_flow(
-                bounding_box,
-                object_tracks,
-                object_options,
-                grid_options,
-                global_flow_margin,
-            )
-        global_flows.append(global_flow)
-        global_flow_boxes.append(global_flow_box)
+            global_flows, global_flow_boxes = get_flows(*args, global_flow_margin)
+
+    for k, previous_id in enumerate(previous_ids):
+        bounding_box = bounding_boxes[k]
+        flow, flow_box = flows[k], flow_boxes[k]
+        global_flow = global_flows[k]
         # Get the previous object center, displacement and area
         if previous_id in matched_previous_ids:
             previous_displacement = matched_previous_displacements[
@@ -122,12 +128,9 @@ def get_costs_data(object_tracks, object_options, grid_options):
         else:
             previous_displacement = np.array([np.nan, np.nan])
         previous_displacements.append(previous_displacement)
-        previous_row, previous_col, previous_area = thor_object.get_object_center(
-            previous_id, previous_mask, grid_options, gridcell_area
-        )
-        previous_center = [previous_row, previous_col]
+        previous_center = [previous_rows[previous_id], previous_cols[previous_id]]
         previous_centers.append(previous_center)
-        previous_areas.append(previous_area)
+        previous_areas.append(previous_object_areas[previous_id])
         # Get the corrected flow
         corrected_flow, case = correct_local_flow(
             flow_box,  # Use this for flow vector origin
@@ -141,24 +144,35 @@ def get_costs_data(object_tracks, object_options, grid_options):
         )
         corrected_flows.append(corrected_flow)
         cases.append(case)
-        # Get the search box, objects in search box, and evaluate cost function
+        # Get the search box and objects in search box
         int_corrected_flow = np.ceil(corrected_flow).astype(int)
         search_box = box.get_search_box(
             bounding_box, int_corrected_flow, search_margin, grid_options
         )
         search_boxes.append(search_box)
         current_ids = thor_object.find_objects(search_box, current_mask)
-        object_costs_data = get_object_costs_data(
-            current_ids, previous_id, object_tracks, object_options, grid_options
-        )
-        i = previous_id - 1
-        j = current_ids - 1
-        costs_matrix[i, j] = object_costs_data["costs"]
-        distances_matrix[i, j] = object_costs_data["distances"]
-        area_differences_matrix[i, j] = object_costs_data["area_differences"]
-        overlap_areas_matrix[i, j] = object_costs_data["overlap_areas"]
-        current_rows_matrix[i, j] = object_costs_data["current_rows"]
-        current_cols_matrix[i, j] = object_costs_data["current_cols"]
+        pair_previous_ids.append(np.full(len(current_ids), previous_id, dtype=int))
+        pair_current_ids.append(current_ids.astype(int))
+
+    # Evaluate the cost function for all pairs at once and fill the matrices
+    if len(pair_previous_ids) > 0:
+        pair_previous_ids = np.concatenate(pair_previous_ids)
+        pair_current_ids = np.concatenate(pair_current_ids)
+    else:
+        pair_previous_ids = np.array([], dtype=int)
+        pair_current_ids = np.array([], dtype=int)
+    args = [pair_previous_ids, pair_current_ids, overlap_areas]
+    args += [previous_rows, previous_cols, previous_object_areas]
+    args += [current_rows, current_cols, current_object_areas, grid_options]
+    pair_costs_data = get_pair_costs_data(*args)
+    i = pair_previous_ids - 1
+    j = pair_current_ids - 1
+    costs_matrix[i, j] = pair_costs_data["costs"]
+    distances_matrix[i, j] = pair_costs_data["distances"]
+    area_differences_matrix[i, j] = pair_costs_data["area_differences"]
+    overlap_areas_matrix[i, j] = pair_costs_data["overlap_areas"]
+    current_rows_matrix[i, j] = pair_costs_data["current_rows"]
+    current_cols_matrix[i, j] = pair_costs_data["current_cols"]
 
     costs_data = {
         "costs_matrix": costs_matrix,
@@ -182,6 +196,53 @@ def get_costs_data(object_tracks, object_options, grid_options):
     return costs_data
 
 
+def get_pair_costs_data(
+    previous_ids,
+    current_ids,
+    overlap_areas,
+    previous_rows,
+    previous_cols,
+    previous_areas,
+    current_rows,
+    current_cols,
+    current_areas,
+    grid_options,
+):
+    """
+    Evaluate the cost function for each (previous_ids[i], current_ids[i]) pair in array
+    form. The centers and areas arguments are arrays indexed by object id, as given by
+    thor.object.label.LabeledMask.centers and areas, and overlap_areas is the output of
+    thor.object.object.get_overlap_areas. The result matches that obtained by calling
+    get_object_costs_data for each previous object.
+    """
+    pair_previous_rows = previous_rows[previous_ids]
+    pair_previous_cols = previous_cols[previous_ids]
+    pair_current_rows = current_rows[current_ids]
+    pair_current_cols = current_cols[current_ids]
+    if len(previous_ids) > 0:
+        args = [pair_previous_rows, pair_previous_cols]
+        args += [pair_current_rows, pair_current_cols, grid_options]
+        distances = np.asarray(grid.get_distance(*args), dtype=float) / 1e3
+    else:
+        distances = np.array([], dtype=float)
+    area_differences = np.sqrt(
+        np.abs(current_areas[current_ids] - previous_areas[previous_ids])
+    )
+    args = [overlap_areas, previous_ids, current_ids]
+    pair_overlap_areas = np.sqrt(thor_object.get_pair_overlap_areas(*args))
+    costs = distances + area_differences - pair_overlap_areas
+
+    pair_costs_data = {
+        "costs": costs,
+        "distances": distances,
+        "area_differences": area_differences,
+        "overlap_areas": pair_overlap_areas,
+        "current_rows": pair_current_rows,
+        "current_cols": pair_current_cols,
+    }
+    return pair_costs_data
+
+
 def get_object_costs_data(
     current_ids, previous_id, object_tracks, object_options, grid_options
 ):
@@ -189,7 +250,8 @@ def get_object_costs_data(
     Caculate the cost function for all objects found within the search box, associated with
     the specific object previous_id. Note that this cost function is subtly different
     to that described by Raut et al. (2021), noting we have ignored the term associated with
-    distances from the object to the center of the search box."""
+    distances from the object to the center of the search box. This is the per object
+    reference implementation of get_pair_costs_data."""
 
     costs = []
     distances = []
@@ -200,6 +262,12 @@ def get_object_costs_data(
 
     current_mask, previous_mask = get_masks(object_tracks, object_options)
     gridcell_area = object_tracks["gridcell_area"]
+    # Overlaps can only occur within the previous object's region of interest
+    previous_inventory = label.get_inventories(object_tracks, object_options)[1]
+    roi = previous_inventory.get_roi(previous_id)
+    previous_obj_mask = previous_mask.values[roi] == previous_id
+    areas = np.broadcast_to(np.asarray(gridcell_area), previous_mask.shape)[roi]
+    current_mask_roi = current_mask.values[roi]
 
     previous_row, previous_col, previous_area = thor_object.get_object_center(
         previous_id, previous_mask, grid_options, gridcell_area
@@ -219,10 +287,8 @@ def get_object_costs_data(
         distances.append(distance)
         area_difference = np.sqrt(np.abs(current_area - previous_area))
         area_differences.append(area_difference)
-        overlap_cond = np.logical_and(
-            current_mask == current_id, previous_mask == previous_id
-        )
-        overlap_area = np.sqrt(gridcell_area.where(overlap_cond).sum())
+        overlap_cond = np.logical_and(current_mask_roi == current_id, previous_obj_mask)
+        overlap_area = np.sqrt(areas[overlap_cond].sum())
         overlap_areas.append(overlap_area)
         cost = distance + area_difference - overlap_area
         costs.append(cost)
@@ -247,7 +313,8 @@ def get_matches(object_tracks, object_options, grid_options):
     cost."""
 
     max_cost = object_options["tracking"]["options"]["max_cost"]
-    costs_data = get_costs_data(object_tracks, object_options, grid_options)
+    with instrument.stage("costs"):
+        costs_data = get_costs_data(object_tracks, object_options, grid_options)
     costs_matrix = costs_data["costs_matrix"]
     current_rows_matrix = costs_data["current_rows_matrix"]
     current_cols_matrix = costs_data["current_cols_matrix"]
@@ -255,7 +322,8 @@ def get_matches(object_tracks, object_options, grid_options):
     area_differences_matrix = costs_data["area_differences_matrix"]
     overlap_areas_matrix = costs_data["overlap_areas_matrix"]
     try:
-        matches = optimize.linear_sum_assignment(costs_matrix)
+        with instrument.stage("assignment"):
+            matches = optimize.linear_sum_assignment(costs_matrix)
     except ValueError:
         logger.debug("Could not solve matching problem.")
     parents = []
@@ -35,6 +35,19 @@ def get_bounding_box(obj, mask):
     return bounding_box
 
 
+def expand_slices(slices, margin, shape):
+    """
+    Expand the bounding slices of an object by margin pixels, clipping to shape. Used to
+    crop per object calculations to a region of interest around the object.
+    """
+    expanded_slices = []
+    for bounding_slice, length in zip(slices, shape):
+        start = max(bounding_slice.start - margin, 0)
+        stop = min(bounding_slice.stop + margin, length)
+        expanded_slices.append(slice(start, stop))
+    return tuple(expanded_slices)
+
+
 def expand_box(box, row_margin, col_margin):
     """Expand bounding box by margins."""
     box["row_min"] = box["row_min"] - row_margin
@@ -0,0 +1,304 @@
+"""
+Labelled mask inventories. A LabeledMask wraps a labelled xarray mask, and lazily
+calculates the ids, pixel counts, areas, centers, bounding boxes and pixel indices of
+all objects in the mask, so the mask need only be scanned once.
+"""
+
+import numbers
+import numpy as np
+import xarray as xr
+from scipy import ndimage
+from thor.log import setup_logger
+import thor.object.box as box
+
+logger = setup_logger(__name__)
+
+
+class LabeledMask:
+    """
+    Wrapper around a labelled mask caching its region inventory. Properties are
+    calculated on first access. Array properties such as counts, areas and centers are
+    indexed by object id, with index 0 corresponding to the background.
+    """
+
+    def __init__(self, mask, gridcell_area=None):
+        self.mask = mask
+        self.gridcell_area = gridcell_area
+        self._values = None
+        self._cache = {}
+
+    @property
+    def values(self):
+        """Get the mask values as a numpy array."""
+        if self._values is None:
+            self._values = np.asarray(self.mask)
+        return self._values
+
+    @property
+    def max_id(self):
+        """Get the largest object id in the mask."""
+        if "max_id" not in self._cache:
+            values = self.values
+            self._cache["max_id"] = int(values.max()) if values.size > 0 else 0
+        return self._cache["max_id"]
+
+    @property
+    def counts(self):
+        """Get the number of pixels comprising each object."""
+        if "counts" not in self._cache:
+            labels = self.values.ravel()
+            counts = np.bincount(labels, minlength=self.max_id + 1)
+            self._cache["counts"] = counts
+        return self._cache["counts"]
+
+    @property
+    def ids(self):
+        """Get the sorted ids of objects present in the mask."""
+        if "ids" not in self._cache:
+            ids = np.flatnonzero(self.counts)
+            self._cache["ids"] = ids[ids != 0]
+        return self._cache["ids"]
+
+    def _calculate_centers(self):
+        """Calculate gridcell area weighted centers and areas in a single pass."""
+        if self.gridcell_area is None:
+            raise ValueError("gridcell_area required to calculate centers and areas.")
+        areas = np.broadcast_to(np.asarray(self.gridcell_area), self.values.shape)
+        args = [self.values, areas, self.max_id + 1]
+        total_areas, row_sums, col_sums = get_weighted_sums(*args)
+        # Avoid dividing by zero for labels absent from the mask
+        denominator = np.where(total_areas > 0, total_areas, 1)
+        centroids = (row_sums / denominator, col_sums / denominator)
+        center_rows = np.round(centroids[0]).astype(int)
+        center_cols = np.round(centroids[1]).astype(int)
+        center_rows[center_rows < 0] = 0
+        self._cache["centroids"] = centroids
+        self._cache["centers"] = (center_rows, center_cols)
+        self._cache["areas"] = total_areas
+
+    @property
+    def areas(self):
+        """Get the area of each object."""
+        if "areas" not in self._cache:
+            self._calculate_centers()
+        return self._cache["areas"]
+
+    @property
+    def centers(self):
+        """Get the gridcell area weighted center rows and columns of each object."""
+        if "centers" not in self._cache:
+            self._calculate_centers()
+        return self._cache["centers"]
+
+    @property
+    def centroids(self):
+        """Get the unrounded gridcell area weighted centroids of each object."""
+        if "centroids" not in self._cache:
+            self._calculate_centers()
+        return self._cache["centroids"]
+
+    def get_cached(self, key, calculate):
+        """
+        Get a derived quantity stored with the inventory, calculating it as
+        calculate(self) on first access.
+        """
+        if key not in self._cache:
+            self._cache[key] = calculate(self)
+        return self._cache[key]
+
+    @property
+    def slices(self):
+        """Get the bounding slices of each object. Entry i corresponds to id i + 1."""
+        if "slices" not in self._cache:
+            values = self.values
+            if self.max_id > 0:
+                slices = ndimage.find_objects(values, max_label=self.max_id)
+            else:
+                slices = []
+            self._cache["slices"] = slices
+        return self._cache["slices"]
+
+    def get_bounding_box(self, obj):
+        """Get the bounding box of object obj, as in box.get_bounding_box."""
+        row_slice, col_slice = self.slices[obj - 1]
+        bounding_box = {}
+        bounding_box["row_min"] = row_slice.start
+        bounding_box["row_max"] = row_slice.stop - 1
+        bounding_box["col_min"] = col_slice.start
+        bounding_box["col_max"] = col_slice.stop - 1
+        return bounding_box
+
+    def get_roi(self, obj, margin=0):
+        """
+        Get the region of interest of object obj, i.e. its bounding slices expanded by
+        margin pixels and clipped to the mask. Returns None if obj is not in the mask.
+        """
+        if obj < 1 or obj > self.max_id or self.slices[obj - 1] is None:
+            return None
+        return box.expand_slices(self.slices[obj - 1], margin, self.values.shape)
+
+    def _calculate_indices(self):
+        """Calculate the pixel indices of all objects using a single sort."""
+        labels = self.values.ravel()
+        order = np.argsort(labels, kind="stable")
+        boundaries = np.cumsum(self.counts)[:-1]
+        self._cache["indices"] = np.split(order, boundaries)
+
+    def get_indices(self, obj):
+        """Get the (row, col) indices of object obj, as in np.where(mask == obj)."""
+        if "indices" not in self._cache:
+            self._calculate_indices()
+        if obj > self.max_id:
+            empty = np.array([], dtype=int)
+            return empty, empty
+        flat_indices = self._cache["indices"][obj]
+        return np.divmod(flat_indices, self.values.shape[1])
+
+
+def get_weighted_sums(labels, weights, minlength=0):
+    """
+    Get the total weight, and the weighted sums of the row and column indices, of each
+    label in a 2D labelled array, using weighted bincounts. Dividing the sums by the
+    total weight gives the weighted centroid of each label. The returned arrays are
+    indexed by label.
+    """
+    labels = np.asarray(labels)
+    rows, cols = np.divmod(np.arange(labels.size), labels.shape[1])
+    labels, weights = labels.ravel(), np.asarray(weights).ravel()
+    totals = np.bincount(labels, weights=weights, minlength=minlength)
+    row_sums = np.bincount(labels, weights=rows * weights, minlength=minlength)
+    col_sums = np.bincount(labels, weights=cols * weights, minlength=minlength)
+    return totals, row_sums, col_sums
+
+
+def get_label_areas(labels, gridcell_area, minlength=0):
+    """
+    Get the area of each label using a single weighted bincount. The returned array is
+    indexed by label. gridcell_area may be a 2D array or a positive number.
+    """
+    labels = np.asarray(labels).ravel()
+    if np.ndim(gridcell_area) == 2:
+        weights = np.asarray(gridcell_area).ravel()
+        return np.bincount(labels, weights=weights, minlength=minlength)
+    elif isinstance(gridcell_area, numbers.Real) and gridcell_area > 0:
+        return np.bincount(labels, minlength=minlength) * gridcell_area
+    else:
+        raise ValueError("gridcell_area must be a positive number or a 2D array.")
+
+
+def get_area_filter(labels, min_area, gridcell_area):
+    """
+    Get a lookup table mapping the labels of objects with area less than min_area to 0,
+    and the remaining labels to consecutive ids in increasing order.
+    """
+    areas = get_label_areas(labels, gridcell_area)
+    keep = areas >= min_area
+    keep[0] = False
+    lookup_table = np.zeros(len(areas), dtype=np.asarray(labels).dtype)
+    lookup_table[keep] = np.arange(1, np.count_nonzero(keep) + 1)
+    return lookup_table
+
+
+def label_objects(binary_grid, min_area=None, gridcell_area=None):
+    """
+    Label the objects in binary_grid, and clear those with area less than min_area. As
+    ndimage.label numbers objects in raster order, remapping the remaining labels to
+    consecutive ids gives the same result as relabelling the cleared mask.
+    """
+    labels = ndimage.label(binary_grid)[0]
+    if min_area is None:
+        return labels
+    lookup_table = get_area_filter(labels, min_area, gridcell_area)
+    return lookup_table[labels]
+
+
+def get_lookup_table(old_ids, new_ids, max_label=0, dtype=None):
+    """
+    Get a dense lookup table mapping each label in old_ids to the corresponding label in
+    new_ids, and every other label up to max_label to itself.
+    """
+    old_ids = np.asarray(old_ids, dtype=np.int64)
+    new_ids = np.asarray(new_ids)
+    if dtype is None:
+        dtype = np.result_type(new_ids.dtype, np.int64)
+    size = max(int(max_label), int(old_ids.max()) if old_ids.size > 0 else 0) + 1
+    lookup_table = np.arange(size, dtype=dtype)
+    lookup_table[old_ids] = new_ids
+    return lookup_table
+
+
+def relabel(mask, old_ids, new_ids):
+    """
+    Relabel mask, replacing each label in old_ids with the corresponding label in
+    new_ids, with a single gather from a dense lookup table. Labels not in old_ids are
+    unchanged. Masks may be numpy arrays, DataArrays, or Datasets of masks, in which
+    case each mask variable is relabelled. Non integer masks, e.g. masks with missing
+    values read from file, keep their missing values.
+    """
+    if isinstance(mask, xr.Dataset):
+        relabelled = mask.copy(deep=False)
+        for variable in list(mask.data_vars):
+            relabelled[variable] = relabel(mask[variable], old_ids, new_ids)
+        return relabelled
+    if isinstance(mask, xr.DataArray):
+        return mask.copy(data=relabel(mask.values, old_ids, new_ids))
+    values = np.asarray(mask)
+    if values.size == 0:
+        return values.copy()
+    if np.issubdtype(values.dtype, np.integer):
+        lookup_table = get_lookup_table(old_ids, new_ids, values.max())
+        return lookup_table[values]
+    relabelled = values.copy()
+    valid = np.isfinite(values)
+    labels = values[valid].astype(np.int64)
+    if labels.size > 0:
+        lookup_table = get_lookup_table(old_ids, new_ids, labels.max(), values.dtype)
+        relabelled[valid] = lookup_table[labels]
+    return relabelled
+
+
+def get_inventory(mask, gridcell_area=None):
+    """
+    Get the inventory of a mask. Grouped object masks are datasets, in which case a
+    dictionary of inventories keyed by mask variable name is returned.
+    """
+    if mask is None:
+        return None
+    if isinstance(mask, xr.Dataset):
+        inventory = {}
+        for variable in list(mask.data_vars):
+            inventory[variable] = LabeledMask(mask[variable], gridcell_area)
+        return inventory
+    return LabeledMask(mask, gridcell_area)
+
+
+def update_inventories(object_tracks, mask):
+    """Create the inventory of the new current mask, and shift the previous ones."""
+    gridcell_area = object_tracks.get("gridcell_area")
+    previous_inventory = object_tracks["current_mask_inventory"]
+    object_tracks["previous_mask_inventories"].append(previous_inventory)
+    object_tracks["current_mask_inventory"] = get_inventory(mask, gridcell_area)
+
+
+def get_inventories(object_tracks, object_options, num_previous=1):
+    """
+    Get the current and previous mask inventories for matching. If the inventories have
+    not been recorded, create them from the masks.
+    """
+    if "current_mask_inventory" not in object_tracks.keys():
+        # Fall back to creating the inventories directly from the masks
+        gridcell_area = object_tracks.get("gridcell_area")
+        previous_masks = object_tracks["previous_masks"]
+        masks = [object_tracks["current_mask"]]
+        masks += [previous_masks[-i] for i in range(1, num_previous + 1)]
+        inventories = [get_inventory(mask, gridcell_area) for mask in masks]
+    else:
+        inventories = [object_tracks["current_mask_inventory"]]
+        previous_inventories = object_tracks["previous_mask_inventories"]
+        inventories += [previous_inventories[-i] for i in range(1, num_previous + 1)]
+    if "grouping" in object_options.keys():
+        matched_object = object_options["tracking"]["options"]["matched_object"]
+        for i in range(len(inventories)):
+            if inventories[i] is not None:
+                inventories[i] = inventories[i][f"{matched_object}_mask"]
+    return inventories
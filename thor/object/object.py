@@ -1,11 +1,11 @@
 """Functions for analyzing objects."""
 
-import copy
 import numpy as np
 import xarray as xr
 from thor.log import setup_logger
-from thor.match.utils import get_masks
+import thor.object.label as label
 import thor.grid as thor_grid
+import thor.state as state
 
 logger = setup_logger(__name__)
 
@@ -55,6 +55,35 @@ def get_object_center(obj, mask, grid_options, gridcell_area=None, grid=None):
     return center_row, center_col, areas.sum()
 
 
+def get_overlap_areas(mask_1, mask_2, gridcell_area):
+    """
+    Get the area of overlap between every pair of objects in mask_1 and mask_2 from a
+    single bincount over the (mask_1 label, mask_2 label) pairs. Returns the sorted
+    pair codes, i.e. label_1 * (max(mask_2) + 1) + label_2, and the associated areas.
+    Use get_pair_overlap_areas to look up the overlap for specific pairs.
+    """
+    labels_1 = np.asarray(mask_1).ravel()
+    labels_2 = np.asarray(mask_2).ravel()
+    areas = np.broadcast_to(np.asarray(gridcell_area), np.shape(mask_1)).ravel()
+    base = int(labels_2.max()) + 1 if labels_2.size > 0 else 1
+    overlap = (labels_1 > 0) & (labels_2 > 0)
+    codes = labels_1[overlap].astype(np.int64) * base + labels_2[overlap]
+    pair_codes, inverse = np.unique(codes, return_inverse=True)
+    pair_areas = np.bincount(inverse, weights=areas[overlap], minlength=len(pair_codes))
+    return pair_codes, pair_areas, base
+
+
+def get_pair_overlap_areas(overlap_areas, labels_1, labels_2):
+    """Look up the overlap areas for the label pairs (labels_1[i], labels_2[i])."""
+    pair_codes, pair_areas, base = overlap_areas
+    codes = np.asarray(labels_1, dtype=np.int64) * base + np.asarray(labels_2)
+    if len(pair_codes) == 0:
+        return np.zeros(len(codes))
+    indices = np.clip(np.searchsorted(pair_codes, codes), 0, len(pair_codes) - 1)
+    found = pair_codes[indices] == codes
+    return np.where(found, pair_areas[indices], 0)
+
+
 def find_objects(box, mask):
     """Identifies objects found in the search region."""
     search_area = mask.values[
@@ -83,15 +112,49 @@ def empty_object_record():
         "previous_weighted_centers": [],  # These are gridcell area and field weighted centers
         "matched_current_weighted_centers": [],  # These are gridcell area and field weighted centers
         "costs": [],  # Cost function in units of km
+        "universal_id_map": np.zeros(1, dtype=int),
     }
     return object_record
 
 
+def get_universal_id_map(matched_current_ids, universal_ids):
+    """
+    Get the array mapping each matched current id to its universal id, i.e. the array
+    indexed by current id. Unmatched ids, including 0, map to 0. Where a current id is
+    matched more than once, its first universal id is used.
+    """
+    matched_current_ids = np.asarray(matched_current_ids, dtype=int)
+    universal_ids = np.asarray(universal_ids, dtype=int)
+    size = matched_current_ids.max() + 1 if len(matched_current_ids) > 0 else 1
+    universal_id_map = np.zeros(size, dtype=int)
+    matched = matched_current_ids > 0
+    # Assign in reverse so the first universal id of repeated current ids is kept
+    universal_id_map[matched_current_ids[matched][::-1]] = universal_ids[matched][::-1]
+    return universal_id_map
+
+
+def lookup_universal_ids(object_record, ids):
+    """
+    Look up the universal ids of ids in the current mask of object_record, returning 0
+    for unmatched ids. Records without a universal id map, e.g. those checkpointed by
+    earlier versions, have their map created from their matched current ids.
+    """
+    universal_id_map = object_record.get("universal_id_map")
+    if universal_id_map is None:
+        args = [object_record["matched_current_ids"], object_record["universal_ids"]]
+        universal_id_map = get_universal_id_map(*args)
+    ids = np.asarray(ids, dtype=int)
+    in_map = ids < len(universal_id_map)
+    universal_ids = np.zeros(len(ids), dtype=int)
+    universal_ids[in_map] = universal_id_map[ids[in_map]]
+    return universal_ids
+
+
 def initialize_object_record(match_data, object_tracks, object_options):
     """Initialize record of object properties in previous and current masks."""
 
-    previous_mask = get_masks(object_tracks, object_options)[1]
-    total_previous_objects = np.max(previous_mask)
+    previous_inventory = label.get_inventories(object_tracks, object_options)[1]
+    total_previous_objects = previous_inventory.max_id
     previous_ids = np.arange(1, total_previous_objects + 1)
 
     universal_ids = np.arange(
@@ -99,40 +162,39 @@ def initialize_object_record(match_data, object_tracks, object_options):
         object_tracks["object_count"] + total_previous_objects + 1,
     )
     object_tracks["object_count"] += total_previous_objects
-    object_record = match_data.copy()
-    object_record["previous_ids"] = previous_ids
-    object_record["universal_ids"] = universal_ids
-    object_tracks["object_record"] = object_record
+    set_object_record(match_data, object_tracks, previous_ids, universal_ids)
 
 
 def update_object_record(match_data, object_tracks, object_options):
-    """Update record of object properties in previous and current masks."""
-
-    previous_object_record = copy.deepcopy(object_tracks["object_record"])
-    previous_mask = get_masks(object_tracks, object_options)[1]
-
-    total_previous_objects = np.max(previous_mask.values)
+    """
+    Update record of object properties in previous and current masks. Objects in the
+    previous mask which were matched in the previous iteration keep their universal
+    ids, looked up from the universal id map of the previous object record. The
+    remaining objects are assigned new universal ids in order of their ids.
+    """
+
+    previous_inventory = label.get_inventories(object_tracks, object_options)[1]
+    total_previous_objects = previous_inventory.max_id
     previous_ids = np.arange(1, total_previous_objects + 1)
-    universal_ids = np.array([], dtype=int)
 
-    for previous_id in np.arange(1, total_previous_objects + 1):
-        # Check if object was matched in previous iteration
-        if previous_id in previous_object_record["matched_current_ids"]:
-            index = np.argwhere(
-                previous_object_record["matched_current_ids"] == previous_id
-            )
-            index = index[0, 0]
-            # Append the previously created universal id corresponding to previous_id
-            universal_ids = np.append(
-                universal_ids, previous_object_record["universal_ids"][index]
-            )
-        else:
-            uid = object_tracks["object_count"] + 1
-            object_tracks["object_count"] += 1
-            universal_ids = np.append(universal_ids, uid)
-            # Check if new object split from old?
+    universal_ids = lookup_universal_ids(object_tracks["object_record"], previous_ids)
+    new = universal_ids == 0
+    new_count = np.count_nonzero(new)
+    object_count = object_tracks["object_count"]
+    universal_ids[new] = np.arange(object_count + 1, object_count + new_count + 1)
+    object_tracks["object_count"] += new_count
+    set_object_record(match_data, object_tracks, previous_ids, universal_ids)
+
 
+def set_object_record(match_data, object_tracks, previous_ids, universal_ids):
+    """
+    Create the new object record from the match data, moving the current object record
+    into the buffer of previous object records.
+    """
     object_record = match_data.copy()
     object_record["universal_ids"] = universal_ids
     object_record["previous_ids"] = previous_ids
-    object_tracks["object_record"] = object_record
+    args = [object_record["matched_current_ids"], universal_ids]
+    object_record["universal_id_map"] = get_universal_id_map(*args)
+    args = [object_tracks, "object_record", object_record]
+    state.rotate(*args, previous_key="previous_object_records")
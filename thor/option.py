@@ -80,6 +80,8 @@ class TintOptions(BaseOptions):
     max_velocity_mag: int = 60
     # Maximum allowable shift difference.
     max_velocity_diff: int = 60
+    # Optical flow engine, either "reference" or "batched".
+    flow_engine: str = "reference"
 
 
 class MintOptions(TintOptions):
@@ -105,6 +107,7 @@ def tint_options(
     max_velocity_mag=60,  # m/s
     max_velocity_diff=60,  # m/s
     global_shift_altitude=1500,
+    flow_engine="reference",
 ):
     """
     Set options for the TINT tracking algorithm.
@@ -122,6 +125,10 @@ def tint_options(
         Maximum magnitude of shift difference.
     global_shift_altitude : int, optional
         Altitude in m for calculating global shift.
+    flow_engine : str, optional
+        Engine used to calculate optical flow. Either "reference", which calculates
+        the flow for each object separately, or "batched", which stacks the flow boxes
+        of all objects and uses batched real input FFTs.
     altitudes : list, optional
         Altitudes over which to detect objects. Range defined by two element list [a,b],
         with included altitudes then a <= z < b. If None, use all altitudes.
@@ -141,6 +148,7 @@ def tint_options(
         "max_velocity_mag": max_velocity_mag,
         "max_velocity_diff": max_velocity_diff,
         "global_shift_altitude": global_shift_altitude,
+        "flow_engine": flow_engine,
     }
     return options
 
@@ -153,6 +161,7 @@ def mint_options(
     max_velocity_mag=60,
     max_velocity_diff=60,  # m/s
     max_velocity_diff_alt=25,  # m/s
+    flow_engine="reference",
 ):
     """
     Set options for the MINT tracking algorithm.
@@ -173,6 +182,9 @@ def mint_options(
         Alternative maximum magnitude of shift difference. Defaults to 25.
     global_shift_altitude : int, optional
         Altitude in m for calculating global shift. Defaults to 2000.
+    flow_engine : str, optional
+        Engine used to calculate optical flow, "reference" or "batched". Defaults to
+        "reference".
 
     Returns
     -------
@@ -188,6 +200,7 @@ def mint_options(
             unique_global_flow=unique_global_flow,
             max_velocity_mag=max_velocity_mag,
             max_velocity_diff=max_velocity_diff,
+            flow_engine=flow_engine,
         ),
         "max_velocity_diff_alt": max_velocity_diff_alt,
     }
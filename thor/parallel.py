@@ -14,6 +14,7 @@ import thor.write as write
 import thor.analyze as analyze
 import thor.data as data
 import thor.grid as grid
+import thor.object.label as label
 import thor.option as option
 import thor.track as track
 
@@ -272,11 +273,9 @@ def stitch_run(output_parent, intervals, cleanup=True):
 
 def apply_mapping(mapping, mask):
     """Apply mapping to mask."""
-    new_mask = mask.copy()
-    for key in mapping.keys():
-        for var in mask.data_vars:
-            new_mask[var].values[mask[var].values == key] = mapping[key]
-    return new_mask
+    old_ids = np.array(list(mapping.keys()), dtype=int)
+    new_ids = np.array(list(mapping.values()), dtype=int)
+    return label.relabel(mask, old_ids, new_ids)
 
 
 def get_mapping(id_dicts, obj, interval):
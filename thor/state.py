@@ -0,0 +1,198 @@
+"""
+Ring buffers of previous states, e.g. the grids, masks and domain boundaries of
+previous time steps. Each time step the current state is moved into the buffer of
+previous states by reference rather than copied, with the buffer's fixed length
+discarding the oldest state. As the buffers share arrays with the current state,
+states are frozen when they become previous: modifying a previous state requires
+explicitly copying it first, rather than every state being defensively copied.
+
+The states of each object and input dataset are held in ObjectTracks and InputRecord
+records, which store their entries in fixed slots rather than a per instance dict,
+while still supporting the dictionary interface used throughout thor.
+"""
+
+from collections import deque
+from collections.abc import KeysView, MutableMapping
+import numpy as np
+import xarray as xr
+from thor.log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def initialise_history(length):
+    """Initialise a buffer of length previous states, all initially None."""
+    return deque([None] * length, length)
+
+
+def freeze(state):
+    """
+    Make the numpy arrays backing state read only, so in place modifications of shared
+    previous states raise an error rather than silently changing other references.
+    States which are not numpy backed, e.g. dask arrays, are left unchanged.
+    """
+    if isinstance(state, xr.Dataset):
+        for variable in state.data_vars.values():
+            freeze(variable)
+    elif isinstance(state, xr.DataArray):
+        freeze(state.data)
+    elif isinstance(state, np.ndarray):
+        state.flags.writeable = False
+    return state
+
+
+def rotate(record, key, value, previous_key=None):
+    """
+    Move the current state record[key] into the buffer of previous states, then
+    replace it with value. No copies are made.
+
+    Parameters
+    ----------
+    record : dict
+        The object_tracks or input_record dictionary holding the states.
+    key : str
+        Key of the current state, e.g. "current_grid".
+    value : object
+        The new current state.
+    previous_key : str, optional
+        Key of the buffer of previous states. Defaults to key with "current_"
+        replaced by "previous_", and pluralised, e.g. "previous_grids".
+    """
+    if previous_key is None:
+        previous_key = key.replace("current_", "previous_", 1) + "s"
+    record[previous_key].append(freeze(record[key]))
+    record[key] = value
+
+
+class RecordKeys(KeysView):
+    """Live view of the keys of a record, with membership tested by the record."""
+
+    __slots__ = ()
+
+    def __contains__(self, key):
+        return self._mapping.__contains__(key)
+
+
+class Record(MutableMapping):
+    """
+    Dictionary compatible record storing its entries in slots. Subclasses list their
+    entries in fields, and entries set that are not fields are kept in an overflow
+    dict, so records accept the same keys as the dictionaries they replace. Entries
+    can be accessed as items, e.g. record["current_mask"], or as attributes, e.g.
+    record.current_mask, the latter avoiding the cost of the mapping interface. The
+    methods used in hot paths, e.g. get and membership tests, are implemented directly
+    rather than inherited from the slower MutableMapping mixins. Functions in the
+    tracking loop use item access, so also accept plain dictionaries.
+    """
+
+    __slots__ = ("_extra", "_keys")
+    fields = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        self._extra = {}
+        self._keys = RecordKeys(self)
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.fields:
+            setattr(self, key, value)
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.fields:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in self.fields:
+            return hasattr(self, key)
+        return key in self._extra
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key
+        yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)})"
+
+    def __getstate__(self):
+        # Copy and pickle the entries only, so copies get their own keys view
+        return dict(self)
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def get(self, key, default=None):
+        if key in self.fields:
+            return getattr(self, key, default)
+        return self._extra.get(key, default)
+
+    def keys(self):
+        # The view is live, so can be created once per record
+        return self._keys
+
+    def pop(self, key, *default):
+        if key not in self.fields:
+            return self._extra.pop(key, *default)
+        try:
+            value = getattr(self, key)
+        except AttributeError:
+            if len(default) > 0:
+                return default[0]
+            raise KeyError(key) from None
+        delattr(self, key)
+        return value
+
+
+object_tracks_fields = ["name", "object_count", "tracks", "last_write_time"]
+object_tracks_fields += ["gridcell_area", "pending_detection", "mask_list"]
+object_tracks_fields += ["current_time", "previous_times", "current_time_interval"]
+object_tracks_fields += ["previous_time_interval", "current_grid", "previous_grids"]
+object_tracks_fields += ["current_mask", "previous_masks", "current_mask_inventory"]
+object_tracks_fields += ["previous_mask_inventories", "current_matched_mask"]
+object_tracks_fields += ["previous_matched_masks", "previous_matched_inventory"]
+object_tracks_fields += ["object_record", "previous_object_records"]
+object_tracks_fields += ["global_flow_cache"]
+object_tracks_fields += ["current_attributes", "attributes"]
+
+
+class ObjectTracks(Record):
+    """Tracking state of an object, e.g. its grids, masks, matches and attributes."""
+
+    __slots__ = tuple(object_tracks_fields)
+    fields = frozenset(object_tracks_fields)
+
+
+input_record_fields = ["name", "current_file_index", "dataset", "last_write_time"]
+input_record_fields += ["filepath_list", "time_list", "write_interval", "prefetcher"]
+input_record_fields += ["detections"]
+input_record_fields += ["sampler", "objects", "current_grid", "previous_grids"]
+input_record_fields += ["current_domain_mask", "previous_domain_masks"]
+input_record_fields += ["current_boundary_mask", "previous_boundary_masks"]
+input_record_fields += ["current_boundary_coordinates"]
+input_record_fields += ["previous_boundary_coordinates"]
+
+
+class InputRecord(Record):
+    """State of an input dataset, e.g. the current dataset, grid and domain masks."""
+
+    __slots__ = tuple(input_record_fields)
+    fields = frozenset(input_record_fields)
@@ -3,3 +3,12 @@ from . import test_gridrad
 from . import test_synthetic
 from . import test_era5
 from . import test_parallel
+from . import test_match
+from . import test_detect
+from . import test_group
+from . import test_attribute
+from . import test_state
+from . import test_instrument
+from . import test_benchmark
+from . import test_checkpoint
+from . import test_prefetch
@@ -0,0 +1,241 @@
+"""Test the attribute functions."""
+
+import pytest
+import numpy as np
+import xarray as xr
+from scipy import ndimage
+import thor.grid as grid
+import thor.object.label as label
+import thor.attribute.properties as properties
+import thor.attribute.ellipse as ellipse
+import thor.attribute.profile as profile
+import thor.attribute.sampling as sampling
+import thor.attribute.utils as utils
+import thor.attribute.core as core
+import thor.attribute.registry as registry
+
+
+def create_grid(spacing=2.5e3):
+    """Create a small cartesian grid and its gridcell areas."""
+    y = np.arange(-50e3, 50e3 + spacing, spacing).tolist()
+    x = np.arange(-60e3, 60e3 + spacing, spacing).tolist()
+    grid_options = grid.create_options(
+        name="cartesian",
+        x=x,
+        y=y,
+        central_latitude=-10,
+        central_longitude=132,
+        cartesian_spacing=[spacing, spacing],
+    )
+    X, Y = np.meshgrid(x, y)
+    lons, lats = grid.cartesian_to_geographic_lcc(grid_options, X, Y)
+    grid_options["latitude"], grid_options["longitude"] = lats, lons
+    coords = {"y": y, "x": x}
+    gridcell_area = grid.get_cell_areas(grid_options)
+    gridcell_area = xr.DataArray(gridcell_area, dims=("y", "x"), coords=coords)
+    return grid_options, gridcell_area, coords
+
+
+def test_region_properties():
+    """Test the region properties against per object calculations."""
+    grid_options, gridcell_area, coords = create_grid()
+    rng = np.random.default_rng(0)
+    mask = ndimage.label(rng.random(grid_options["shape"]) > 0.6)[0]
+    mask = xr.DataArray(mask, dims=("y", "x"), coords=coords)
+    inventory = label.LabeledMask(mask, gridcell_area)
+    region_properties = properties.get_properties(inventory)
+    assert properties.get_properties(inventory) is region_properties
+    field = np.random.default_rng(0).random(mask.shape)
+    args = [inventory, field, "reflectivity"]
+    weighted_rows, weighted_cols = properties.get_weighted_centroids(*args)
+    assert properties.get_weighted_centroids(*args)[0] is weighted_rows
+    # Centroids weighted by other fields are stored separately
+    args = [inventory, 1 - field, "other"]
+    other_rows = properties.get_weighted_centroids(*args)[0]
+    assert not np.allclose(other_rows[inventory.ids], weighted_rows[inventory.ids])
+    ids = np.append(inventory.ids, inventory.max_id + 1)
+    areas = properties.get_areas(inventory, ids)
+    lats, lons = properties.get_coordinates(inventory, ids, grid_options)
+    assert areas[-1] == 0 and np.isnan(lats[-1]) and np.isnan(lons[-1])
+    boundary_mask = np.ones(mask.shape, dtype=bool)
+    boundary_mask[1:-1, 1:-1] = False
+    boundary_areas = properties.get_boundary_areas(inventory, boundary_mask)
+    for i, obj in enumerate(inventory.ids):
+        rows, cols = np.where(mask.values == obj)
+        weights = gridcell_area.values[rows, cols]
+        assert region_properties["count"][obj] == len(rows)
+        assert np.isclose(areas[i], weights.sum())
+        on_boundary = boundary_mask[rows, cols]
+        assert np.isclose(boundary_areas[obj], weights[on_boundary].sum())
+        row = np.sum(rows * weights) / weights.sum()
+        assert np.isclose(region_properties["centroid"][0][obj], row)
+        center_row, center_col = [c[obj] for c in region_properties["center"]]
+        assert lats[i] == grid_options["latitude"][center_row, center_col]
+        weights = weights * field[rows, cols]
+        assert np.isclose(weighted_rows[obj], np.sum(rows * weights) / weights.sum())
+        assert np.isclose(weighted_cols[obj], np.sum(cols * weights) / weights.sum())
+
+
+def test_moment_ellipses():
+    """Test the moment ellipses recover known ellipses, and agree with cv2."""
+    grid_options, gridcell_area, coords = create_grid(spacing=1e3)
+    rows, cols = np.indices(grid_options["shape"])
+    mask = np.zeros(grid_options["shape"], dtype=int)
+    ellipses = [(30, 30, 20, 8, 0.3), (70, 60, 15, 10, 2.5), (40, 95, 18, 5, 1.4)]
+    for i, (row, col, major, minor, orientation) in enumerate(ellipses):
+        x, y = cols - col, rows - row
+        u = x * np.cos(orientation) + y * np.sin(orientation)
+        v = -x * np.sin(orientation) + y * np.cos(orientation)
+        mask[(u / major) ** 2 + (v / minor) ** 2 <= 1] = i + 1
+    mask = xr.DataArray(mask, dims=("y", "x"), coords=coords)
+    inventory = label.LabeledMask(mask, gridcell_area)
+    moments = np.array(ellipse.moment_ellipses(inventory, [1, 2, 3, 4], grid_options))
+    cv2_ellipses = np.array(ellipse.cv2_ellipses(inventory, [1, 2, 3], grid_options))
+    assert np.all(np.isnan([moment[-1] for moment in moments]))
+    for i, (row, col, major, minor, orientation) in enumerate(ellipses):
+        # Axes are full lengths, and gridcells are 1 km across
+        assert np.isclose(moments[2][i], 2 * major, rtol=0.03)
+        assert np.isclose(moments[3][i], 2 * minor, rtol=0.05)
+        assert np.isclose(moments[4][i], orientation, atol=0.05)
+        assert np.isclose(moments[0][i], grid_options["latitude"][row, col])
+        assert np.allclose(moments[2:4, i], cv2_ellipses[2:4, i], rtol=0.08)
+        assert np.isclose(moments[4][i], cv2_ellipses[4][i], atol=0.05)
+
+
+def test_interpolate_columns():
+    """Test the batched profile interpolation against np.interp."""
+    rng = np.random.default_rng(0)
+    # Descending altitudes, as for pressure levels in increasing order
+    x = np.sort(rng.uniform(0, 20e3, size=(20, 15)), axis=1)[:, ::-1]
+    y = rng.random((20, 15))
+    new_x = np.linspace(-500, 21e3, 40)
+    new_y = profile.interpolate_columns(x, y, new_x)
+    for i in range(len(x)):
+        expected = np.interp(new_x, x[i, ::-1], y[i, ::-1], left=np.nan, right=np.nan)
+        assert np.allclose(new_y[i], expected, equal_nan=True)
+
+
+def test_sampling():
+    """Test the tag dataset sampler against xarray interpolation."""
+    rng = np.random.default_rng(0)
+    times = np.array(["2020-01-01T00", "2020-01-01T01"], dtype="datetime64[ns]")
+    coords = {"time": times, "pressure": [500.0, 850.0, 1000.0]}
+    coords.update({"latitude": np.arange(-5, -20.1, -0.25)})
+    coords.update({"longitude": np.arange(125, 140.1, 0.25)})
+    shape = [len(values) for values in coords.values()]
+    dims = ("time", "pressure", "latitude", "longitude")
+    dataset = xr.Dataset({"u": (dims, rng.random(shape))}, coords=coords)
+    dataset["cape"] = dataset["u"].isel(pressure=0, drop=True) * 1000
+    input_record = {"dataset": dataset}
+    sampler = sampling.get_sampler(input_record)
+    assert sampling.get_sampler(input_record) is sampler
+    lats = np.append(rng.uniform(-19, -6, 20), [-4, -20])
+    lons = np.append(rng.uniform(126, 139, 20), [130, 140])
+    time = np.datetime64("2020-01-01T00:20")
+    samples = sampling.sample(sampler, ["u", "cape"], time, lats, lons)
+    points = {"latitude": xr.DataArray(lats, dims="points")}
+    points.update({"longitude": xr.DataArray(lons, dims="points"), "time": time})
+    expected = dataset.interp(**points).transpose("points", ...)
+    for name in ["u", "cape"]:
+        assert np.allclose(samples[name], expected[name].values, equal_nan=True)
+    assert np.isnan(samples["cape"][-2]) and not np.isnan(samples["cape"][-1])
+    input_record["dataset"] = dataset.copy()
+    assert sampling.get_sampler(input_record) is not sampler
+
+
+def test_attribute_columns():
+    """Test the typed attribute columns grow, reset and convert to DataFrames."""
+    object_options = {"detection": {}, "attributes": {"core": core.default()}}
+    attribute_options = object_options["attributes"]["core"]
+    columns = utils.initialize_attributes(object_options, columnar=True)["core"]
+    lists = utils.initialize_attributes(object_options)["core"]
+    rng = np.random.default_rng(0)
+    for i in range(300):
+        time = np.datetime64("2020-01-01T00:00") + np.timedelta64(10 * i, "m")
+        values = {"time": [time] * 5, "universal_id": list(range(5 * i, 5 * i + 5))}
+        for name in lists.keys() - values.keys():
+            values[name] = list(rng.random(5))
+        for name in lists.keys():
+            utils.append_column(columns[name], values[name])
+            lists[name] += values[name]
+    assert columns["latitude"]["data"].dtype == np.float64
+    assert columns["universal_id"]["data"].dtype == np.int64
+    df = utils.attributes_dataframe(columns, attribute_options)
+    assert df.equals(utils.attributes_dataframe(lists, attribute_options))
+    capacity = len(columns["time"]["data"])
+    utils.reset_attributes(columns)
+    assert columns["time"]["size"] == 0 and len(columns["time"]["data"]) == capacity
+
+
+def test_weighted_coordinates():
+    """Test recording the coordinates of field weighted centroids of objects."""
+    grid_options, gridcell_area, coords = create_grid()
+    rows, cols = np.indices(grid_options["shape"])
+    mask = ((rows - 20) ** 2 + (cols - 30) ** 2 < 50).astype(int)
+    mask += 2 * ((rows - 10) ** 2 + (cols - 10) ** 2 < 20)
+    mask = xr.DataArray(mask, dims=("y", "x"), coords=coords)
+    # Weight object 1 towards its right edge, and give object 2 no weight
+    field = np.where(mask == 1, cols - 22.0, np.nan)
+    field = xr.DataArray(field, dims=("y", "x"), coords=coords, name="reflectivity")
+
+    names = ["time", "id", "weighted_latitude", "weighted_longitude"]
+    attribute_options = core.default(names, tracked=False)
+    object_options = {"detection": {}, "attributes": {"core": attribute_options}}
+    object_tracks = {"previous_masks": [mask], "previous_grids": [field]}
+    object_tracks["gridcell_area"] = gridcell_area
+    object_tracks["previous_times"] = [np.datetime64("2020-01-01T00:00")]
+    attributes = utils.initialize_attributes(object_options)["core"]
+    core.record(attributes, object_tracks, attribute_options, grid_options)
+
+    assert attributes["id"] == [1, 2]
+    row_indices, col_indices = np.where(mask.values == 1)
+    weights = gridcell_area.values[row_indices, col_indices]
+    weights = weights * field.values[row_indices, col_indices]
+    row = int(np.round(np.sum(row_indices * weights) / weights.sum()))
+    col = int(np.round(np.sum(col_indices * weights) / weights.sum()))
+    assert col > np.round(np.mean(col_indices))
+    assert attributes["weighted_latitude"][0] == grid_options["latitude"][row, col]
+    assert attributes["weighted_longitude"][0] == grid_options["longitude"][row, col]
+    assert np.isnan(attributes["weighted_latitude"][1])
+    assert np.isnan(attributes["weighted_longitude"][1])
+
+
+def test_registry(monkeypatch):
+    """Test registering and scheduling custom attribute types."""
+    # Register the custom types in a copy of the registry, restored after the test
+    monkeypatch.setattr(registry, "registry", dict(registry.registry))
+    grid_options, gridcell_area, coords = create_grid()
+    rows, cols = np.indices(grid_options["shape"])
+    mask = ((rows - 20) ** 2 + (cols - 30) ** 2 < 50).astype(int)
+    mask += 2 * ((rows - 10) ** 2 + (cols - 10) ** 2 < 20)
+    mask = xr.DataArray(mask, dims=("y", "x"), coords=coords)
+
+    def record_pixels(attributes, object_tracks, attribute_options, properties):
+        """Record the pixel counts of objects, using the core ids."""
+        ids = object_tracks["current_attributes"]["core"]["id"]
+        attributes["time"] += object_tracks["current_attributes"]["core"]["time"]
+        attributes["id"] += ids
+        attributes["pixels"] += list(properties["count"][ids])
+
+    inputs = ["attributes", "object_tracks", "attribute_options", "properties"]
+    registry.register("pixels", record_pixels, inputs, depends=["core"])
+    pixel_options = {"time": core.time(), "id": core.identity(tracked=False)}
+    pixel_options["pixels"] = utils.get_attribute_dict(
+        "pixels", None, int, None, "Number of pixels.", None
+    )
+    attribute_options = {"pixels": pixel_options, "core": core.default(tracked=False)}
+    object_options = {"detection": {}, "attributes": attribute_options}
+    assert registry.get_schedule(attribute_options.keys()) == ["core", "pixels"]
+
+    time = np.datetime64("2020-01-01T00:00")
+    object_tracks = {"previous_masks": [mask], "gridcell_area": gridcell_area}
+    object_tracks["previous_times"] = [time]
+    object_tracks["current_attributes"] = utils.initialize_attributes(object_options)
+    registry.record_object(None, object_tracks, object_options, grid_options)
+    attributes = object_tracks["current_attributes"]
+    assert attributes["pixels"]["id"] == [1, 2]
+    assert attributes["pixels"]["pixels"] == [np.sum(mask == 1), np.sum(mask == 2)]
+    registry.register("cycle", record_pixels, inputs, depends=["pixels"])
+    registry.registry["pixels"]["depends"] = ["cycle"]
+    with pytest.raises(ValueError):
+        registry.get_schedule(["pixels", "cycle"])
@@ -0,0 +1,18 @@
+"""Test the benchmark suite."""
+
+import thor.benchmark as benchmark
+
+
+def test_compare():
+    """Test benchmark cases are swept, and regressions flagged, as expected."""
+    cases = benchmark.get_cases({"objects": [1, 4], "levels": [1, 2]})
+    # The base case has 4 objects and 1 level, so is only run once
+    assert len(cases) == 3 and cases.count(benchmark.base_case) == 1
+    key = benchmark.get_case_key(benchmark.base_case)
+    stages = {"match": {"total_time": 1.0}, "match/costs": {"total_time": 0.001}}
+    baseline = {"cases": {key: {"wall_time": 2.0, "stages": stages}}}
+    stages = {"match": {"total_time": 1.1}, "match/costs": {"total_time": 0.005}}
+    results = {"cases": {key: {"wall_time": 3.0, "stages": stages}}}
+    regressions = benchmark.compare(results, baseline, tolerance=0.2)
+    assert len(regressions) == 1 and regressions[0]["stage"] == "total"
+    assert regressions[0]["ratio"] == 1.5
@@ -0,0 +1,109 @@
+"""Test resumed runs, and runs detecting objects ahead, reproduce serial runs."""
+
+import glob
+import shutil
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import xarray as xr
+import thor.benchmark as benchmark
+import thor.instrument as instrument
+import thor.data.synthetic as synthetic
+import thor.option as option
+import thor.track as track
+import thor.write as write
+
+
+class Interrupt(Exception):
+    """Raised to interrupt a run once it has been checkpointed."""
+
+
+def run_mcs(times, output_directory, **kwargs):
+    """Track synthetic MCSs, i.e. grouped objects, at times."""
+    grid_options = benchmark.get_grid_options(120)
+    start = str(times[0])
+    objects = benchmark.get_objects(4, start, grid_options)
+    data_args = {"start": start, "end": str(times[-1]), "starting_objects": objects}
+    data_options = option.consolidate_options(
+        [synthetic.synthetic_data_options(**data_args)]
+    )
+    case = {"levels": 2, "detection": "steiner", "attributes": "core"}
+    track_options = benchmark.get_track_options(case)
+    args = [times, data_options, grid_options, track_options]
+    track.simultaneous_track(*args, output_directory=output_directory, **kwargs)
+
+
+def get_directories(runs):
+    """Get empty output directories for the given runs."""
+    base_local = Path.home() / "THOR_output"
+    directories = {}
+    for run in runs:
+        directories[run] = base_local / f"runs/checkpoint_{run}"
+        if directories[run].exists():
+            shutil.rmtree(directories[run])
+    return directories
+
+
+def assert_same_output(directory, other_directory):
+    """Assert two runs wrote identical masks and attributes."""
+    filepaths = sorted(glob.glob(str(directory / "masks/*.nc")))
+    assert len(filepaths) > 0
+    for filepath in filepaths:
+        other_filepath = other_directory / Path(filepath).relative_to(directory)
+        with xr.open_dataset(filepath) as mask:
+            with xr.open_dataset(other_filepath) as other_mask:
+                xr.testing.assert_identical(mask, other_mask)
+    pattern = str(directory / "attributes/**/*.csv")
+    filepaths = sorted(glob.glob(pattern, recursive=True))
+    assert len(filepaths) > 0
+    for filepath in filepaths:
+        other_filepath = other_directory / Path(filepath).relative_to(directory)
+        # Interval files are aggregated in arbitrary order, so sort before comparing
+        dfs = [pd.read_csv(path) for path in [filepath, other_filepath]]
+        dfs = [df.sort_values(list(df.columns)).reset_index(drop=True) for df in dfs]
+        pd.testing.assert_frame_equal(*dfs)
+
+
+def test_resume(monkeypatch):
+    """Test an interrupted then resumed run reproduces an uninterrupted run."""
+    start = np.datetime64("2005-11-13T00:00:00")
+    times = start + np.timedelta64(10, "m") * np.arange(16)
+    directories = get_directories(["uninterrupted", "resumed"])
+    run_mcs(times, directories["uninterrupted"])
+
+    # Interrupt the run immediately after its first checkpoint
+    save = write.checkpoint.save
+
+    def save_then_interrupt(*args, **kwargs):
+        save(*args, **kwargs)
+        raise Interrupt()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(write.checkpoint, "save", save_then_interrupt)
+        try:
+            kwargs = {"checkpoint": True, "instrument_mode": "memory"}
+            run_mcs(times, directories["resumed"], **kwargs)
+        except Interrupt:
+            pass
+    assert write.checkpoint.get_filepath(directories["resumed"]).exists()
+    # The interrupted run still stops recording and tracing memory
+    assert instrument.recorder is None and not tracemalloc.is_tracing()
+    run_mcs(times, directories["resumed"], checkpoint=True, resume=True)
+    assert not write.checkpoint.get_filepath(directories["resumed"]).exists()
+    assert_same_output(directories["uninterrupted"], directories["resumed"])
+
+
+def test_detection_workers():
+    """Test detecting objects in worker threads reproduces serial detection."""
+    start = np.datetime64("2005-11-13T00:00:00")
+    times = start + np.timedelta64(10, "m") * np.arange(8)
+    directories = get_directories(["serial", "detection_workers"])
+    run_mcs(times, directories["serial"])
+    kwargs = {"detection_workers": 2, "instrument_mode": "time"}
+    run_mcs(times, directories["detection_workers"], **kwargs)
+    assert_same_output(directories["serial"], directories["detection_workers"])
+    # Stages recorded in the workers are merged into the run's records
+    filepath = directories["detection_workers"] / "records/instrumentation.csv"
+    stages = pd.read_csv(filepath)["stage"]
+    assert np.any(stages == "detect_worker/detection")
@@ -0,0 +1,144 @@
+"""Test the detection functions."""
+
+import numpy as np
+import xarray as xr
+from scipy import ndimage
+import thor.detect.steiner as steiner
+import thor.detect.detect as detect
+import thor.object.label as label
+import thor.state as state
+
+
+def create_reflectivity(shape, seed=0):
+    """Create a reflectivity field from random Gaussian cells."""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.indices(shape)
+    reflectivity = np.zeros(shape)
+    for center in rng.uniform(0, 1, size=(30, 2)) * np.array(shape):
+        width = rng.uniform(2, 6)
+        distance = (rows - center[0]) ** 2 + (cols - center[1]) ** 2
+        reflectivity += 50 * np.exp(-distance / (2 * width**2))
+    reflectivity += rng.normal(0, 2, shape)
+    reflectivity[reflectivity < 5] = np.nan
+    return reflectivity
+
+
+def test_steiner():
+    """Test the fast Steiner engine against the reference implementation."""
+    reflectivity = create_reflectivity((60, 70))
+    latitude = np.arange(-14, -14 + 60 * 0.025, 0.025)[:60]
+    longitude = np.arange(129, 129 + 70 * 0.025, 0.025)[:70]
+    X, Y = np.meshgrid(longitude, latitude)
+    args = [reflectivity, X, Y]
+    expected = steiner.steiner_scheme(*args, coordinates="geographic")
+    classification = steiner.steiner_scheme_fast(*args, coordinates="geographic")
+    assert np.all(classification == expected)
+
+    X, Y = np.meshgrid(np.arange(70) * 2.5e3, np.arange(60) * 2.5e3)
+    args = [reflectivity, X, Y]
+    expected = steiner.steiner_scheme(*args, coordinates="cartesian")
+    classification = steiner.steiner_scheme_fast(*args, coordinates="cartesian")
+    assert np.all(classification == expected)
+    assert np.any(classification == 2)
+
+
+def test_steiner_narrow():
+    """Test the Steiner engines agree on grids narrower than the background radius."""
+    rng = np.random.default_rng(0)
+    # Vary reflectivity across columns, so the background depends on all columns
+    reflectivity = rng.uniform(0, 40, (1, 6)) + rng.normal(0, 2, (40, 6))
+    latitude = np.arange(-14, -14 + 40 * 0.025, 0.025)[:40]
+    longitude = np.arange(129, 129 + 6 * 0.025, 0.025)[:6]
+    geographic = np.meshgrid(longitude, latitude)
+    cartesian = np.meshgrid(np.arange(6) * 2.5e3, np.arange(40) * 2.5e3)
+    for coordinates, (X, Y) in zip(
+        ["geographic", "cartesian"], [geographic, cartesian]
+    ):
+        args = [reflectivity, X, Y]
+        expected = steiner.steiner_scheme(*args, coordinates=coordinates)
+        classification = steiner.steiner_scheme_fast(*args, coordinates=coordinates)
+        assert np.all(classification == expected)
+        assert np.any(classification == 1) and np.any(classification == 2)
+
+
+def test_clear_small_area_objects():
+    """Test small object removal against a per object calculation."""
+    binary_grid = create_reflectivity((60, 70)) > 20
+    gridcell_area = np.random.default_rng(0).uniform(4, 8, binary_grid.shape)
+    mask = xr.DataArray(ndimage.label(binary_grid)[0], dims=("y", "x"))
+    min_area = 60
+    expected = mask.values.copy()
+    for obj in range(1, expected.max() + 1):
+        if gridcell_area[mask.values == obj].sum() < min_area:
+            expected[mask.values == obj] = 0
+    expected = ndimage.label(expected)[0]
+    cleared = detect.clear_small_area_objects(mask, min_area, gridcell_area)
+    assert np.all(cleared.values == expected)
+    labels = label.label_objects(binary_grid, min_area, gridcell_area)
+    assert np.all(labels == expected)
+    assert 0 < expected.max() < ndimage.label(binary_grid)[0].max()
+
+
+def create_dataset():
+    """Create a converted dataset, and options for an object detected in it."""
+    start = np.datetime64("2005-11-13T00:00:00")
+    times = start + np.timedelta64(10, "m") * np.arange(3)
+    reflectivity = [create_reflectivity((60, 70), seed=i) for i in range(6)]
+    reflectivity = np.reshape(reflectivity, (3, 2, 60, 70))
+    coords = {"time": times, "altitude": [2e3, 3e3]}
+    coords.update({"y": np.arange(60) * 2.5e3, "x": np.arange(70) * 2.5e3})
+    dataset = xr.Dataset(coords=coords)
+    dataset["reflectivity"] = (("time", "altitude", "y", "x"), reflectivity)
+    dataset["gridcell_area"] = (("y", "x"), np.full((60, 70), 6.25))
+
+    detection = {"method": "threshold", "threshold": 30, "min_area": 20}
+    detection.update({"flatten_method": "vertical_max", "altitudes": [2e3, 3e3]})
+    cell = {"name": "cell", "method": "detect", "dataset": "synthetic"}
+    cell["detection"] = detection
+    return dataset, cell
+
+
+def grid_from_dataset(dataset, variable, time):
+    """Get the grid at time from a converted dataset."""
+    return dataset[variable].sel(time=time)
+
+
+def test_detect_ahead():
+    """Test detecting ahead in a converted dataset matches detecting each grid."""
+    dataset, cell = create_dataset()
+    times = dataset.time.values
+    other = {**cell, "name": "other", "dataset": "other"}
+    track_options = [{"cell": cell, "other": other}]
+
+    args = [dataset, {}, "synthetic", "reflectivity", grid_from_dataset]
+    detections, records = detect.detect_ahead(*args, track_options, "time")
+    assert len(detections) == len(times) and len(records) == 4 * len(times)
+    for time in times:
+        grid = grid_from_dataset(dataset, "reflectivity", time)
+        expected = detect.get_mask(grid, cell, dataset["gridcell_area"])
+        processed_grid, mask = detections[detect.get_detection_key(time, "cell")]
+        xr.testing.assert_identical(processed_grid, expected[0])
+        xr.testing.assert_identical(mask, expected[1])
+        assert mask.values.max() > 0
+
+
+def test_detect_dicts():
+    """Test detect accepts object tracks and input records given as plain dicts."""
+    dataset, cell = create_dataset()
+    object_tracks = {"current_time_interval": None}
+    for name in ["grid", "mask", "mask_inventory"]:
+        object_tracks[f"current_{name}"] = None
+    for name in ["grids", "masks", "mask_inventories"]:
+        object_tracks[f"previous_{name}"] = state.initialise_history(2)
+    tracks = [{"cell": object_tracks}]
+    input_record = {"dataset": dataset}
+    for time in dataset.time.values:
+        object_tracks["current_time"] = time
+        input_record["current_grid"] = grid_from_dataset(dataset, "reflectivity", time)
+        args = [{"synthetic": input_record}, tracks, 0, "cell", {}, cell, {}]
+        detect.detect(*args)
+        args = [input_record["current_grid"], cell, dataset["gridcell_area"]]
+        expected = detect.get_mask(*args)[1]
+        xr.testing.assert_identical(object_tracks["current_mask"], expected)
+    assert object_tracks["current_time_interval"] == 600
+    assert object_tracks["current_mask_inventory"].max_id > 0
@@ -0,0 +1,16 @@
+"""Test the grouping functions."""
+
+import numpy as np
+import thor.group.group as group
+
+
+def test_union_find():
+    """Test the union-find components and overlap edges."""
+    lower = np.array([[1, 1, 0, 2], [0, 0, 0, 2], [3, 0, 0, 0]])
+    upper = np.array([[4, 0, 0, 5], [0, 0, 0, 5], [6, 6, 0, 0]])
+    edges = group.get_overlap_edges([lower, upper])
+    assert np.all(edges == np.array([[1, 4], [2, 5], [3, 6]]))
+    # Chain of edges requiring several hooking iterations
+    edges = np.array([[5, 6], [4, 5], [2, 7], [6, 7], [3, 8]])
+    roots = group.union_find(8, edges)
+    assert np.all(roots == np.array([0, 1, 2, 3, 2, 2, 2, 2, 3]))
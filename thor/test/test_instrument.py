@@ -0,0 +1,63 @@
+"""Test the instrumentation of the tracking loop."""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import thor.instrument as instrument
+
+
+def test_stages():
+    """Test nested stages record their paths, wall times and peak memory."""
+    with instrument.stage("match"):
+        pass
+    assert instrument.stop() is None
+    instrument.start("memory")
+    instrument.set_context(time=np.datetime64("2020-01-01T00:00"), level=0)
+    instrument.set_context(object="cell")
+    with instrument.stage("match"):
+        with instrument.stage("costs"):
+            array = np.ones(2 * 10**6)
+            del array
+        with instrument.stage("assignment"):
+            pass
+    records = instrument.stop()
+    stages = ["match/costs", "match/assignment", "match"]
+    assert records["stage"].tolist() == stages
+    assert np.all(records["object"] == "cell") and np.all(records["level"] == 0)
+    peak_memory = records.set_index("stage")["peak_memory"]
+    assert peak_memory["match/costs"] >= 16 and peak_memory["match"] >= 16
+    assert peak_memory["match/assignment"] < 1
+    summary = instrument.summarise(records)
+    assert (
+        summary.loc["match", "total_time"] >= summary.loc["match/costs", "total_time"]
+    )
+
+
+def test_workers():
+    """Test stages in workers are recorded only through record_worker and merge."""
+
+    def work():
+        with instrument.stage("flatten"):
+            pass
+
+    instrument.start("memory")
+    instrument.set_context(object="cell")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # Stages in other threads are not recorded in the main recorder
+        executor.submit(work).result()
+        context = {"time": np.datetime64("2020-01-01T00:10"), "level": 1}
+        args = ["memory", context, "detect_worker", work]
+        futures = [executor.submit(instrument.record_worker, *args) for i in range(2)]
+        for future in futures:
+            output, records = future.result()
+            assert output is None
+            instrument.merge(records)
+    with instrument.stage("detect"):
+        work()
+    records = instrument.stop()
+    stages = 2 * ["detect_worker/flatten", "detect_worker"]
+    assert records["stage"].tolist() == stages + ["detect/flatten", "detect"]
+    workers = records.iloc[:4]
+    assert np.all(workers["level"] == 1) and workers["object"].isna().all()
+    assert workers["peak_memory"].isna().all()
+    assert np.all(records.iloc[4:]["object"] == "cell")
+    assert instrument.record_worker(None, context, "detect_worker", work) == (None, [])
@@ -0,0 +1,207 @@
+"""Test the matching functions."""
+
+import numpy as np
+import xarray as xr
+from scipy import ndimage
+import thor.grid as grid
+import thor.match.tint as tint
+import thor.match.correlate as correlate
+import thor.object.object as thor_object
+import thor.object.label as label
+import thor.object.box as box
+import thor.state as state
+
+
+def create_masks():
+    """Create a pair of labelled masks on a small cartesian grid."""
+    y = np.arange(-100e3, 100e3 + 2.5e3, 2.5e3).tolist()
+    x = np.arange(-100e3, 100e3 + 2.5e3, 2.5e3).tolist()
+    grid_options = grid.create_options(
+        name="cartesian", x=x, y=y, central_latitude=-10, central_longitude=132
+    )
+    rng = np.random.default_rng(0)
+    rows, cols = np.indices(grid_options["shape"])
+    fields = []
+    for shift in [0, 3]:
+        field = np.zeros(grid_options["shape"])
+        for center in rng.uniform(10, 70, size=(12, 2)):
+            distance = (rows - center[0] - shift) ** 2 + (cols - center[1] - shift) ** 2
+            field += np.exp(-distance / 20)
+        fields.append(field)
+    coords = {"y": y, "x": x}
+    gridcell_area = grid.get_cell_areas(grid_options)
+    gridcell_area = xr.DataArray(gridcell_area, dims=("y", "x"), coords=coords)
+    masks = []
+    for field in fields:
+        mask = ndimage.label(field > 0.5)[0]
+        masks.append(xr.DataArray(mask, dims=("y", "x"), coords=coords))
+    return masks[0], masks[1], gridcell_area, grid_options
+
+
+def test_pair_costs():
+    """Test the batched cost function against the per object reference."""
+    previous_mask, current_mask, gridcell_area, grid_options = create_masks()
+    object_tracks = {"current_mask": current_mask, "gridcell_area": gridcell_area}
+    object_tracks["previous_masks"] = [previous_mask]
+    object_options = {"name": "cell"}
+
+    centers = []
+    for mask in [previous_mask, current_mask]:
+        inventory = label.LabeledMask(mask, gridcell_area)
+        centers.append([*inventory.centers, inventory.areas])
+    previous_centers, current_centers = centers
+    args = [previous_mask, current_mask, gridcell_area]
+    overlap_areas = thor_object.get_overlap_areas(*args)
+    current_ids = np.arange(1, np.max(current_mask.values) + 1)
+
+    for previous_id in range(1, np.max(previous_mask.values) + 1):
+        args = [current_ids, previous_id, object_tracks, object_options, grid_options]
+        expected = tint.get_object_costs_data(*args)
+        previous_ids = np.full(len(current_ids), previous_id)
+        args = [previous_ids, current_ids, overlap_areas, *previous_centers]
+        args += [*current_centers, grid_options]
+        pair_costs_data = tint.get_pair_costs_data(*args)
+        for key in pair_costs_data.keys():
+            assert np.allclose(pair_costs_data[key], expected[key])
+
+
+def test_batched_flow():
+    """Test the batched flow engine against the reference implementation."""
+    rng = np.random.default_rng(0)
+    grids1, grids2, shifts = [], [], []
+    # Include odd and elongated shapes, and repeated shapes which are stacked
+    shapes = [tuple(shape) for shape in rng.integers(20, 100, size=(40, 2))]
+    shapes += [(60, 70), (60, 70), (82, 26), (28, 85)]
+    for shape in shapes:
+        rows, cols = np.indices(shape)
+        center = rng.uniform(0.3, 0.7, size=2) * np.array(shape)
+        distance = (rows - center[0]) ** 2 + (cols - center[1]) ** 2
+        grid1 = 50 * np.exp(-distance / rng.uniform(10, 60))
+        shift = rng.integers(-4, 5, size=2)
+        grids1.append(grid1)
+        grids2.append(np.roll(grid1, tuple(shift), axis=(0, 1)))
+        shifts.append(shift)
+
+    # Real input FFTs should reproduce the complex FFT cross covariance
+    stack1, stack2 = rng.random((2, 3, 60, 70))
+    cross_covariances = correlate.get_cross_covariances(stack1, stack2)
+    for i in range(len(stack1)):
+        expected = correlate.get_cross_covariance(stack1[i], stack2[i])
+        assert np.allclose(cross_covariances[i], expected)
+
+    flows = correlate.calculate_flows(grids1, grids2)
+    for i in range(len(grids1)):
+        expected = correlate.calculate_flow(grids1[i], grids2[i])
+        assert np.all(flows[i] == expected)
+        assert np.all(flows[i] == shifts[i])
+
+
+def test_global_flow_cache():
+    """Test the global flow cache is reused within, and evicted between, time steps."""
+    previous_mask, current_mask, gridcell_area, grid_options = create_masks()
+    coords = current_mask.coords
+    grids = []
+    for time in ["2020-01-01T00:00", "2020-01-01T00:10", "2020-01-01T00:20"]:
+        grid_values = np.random.default_rng(0).random(current_mask.shape)
+        grid_da = xr.DataArray(grid_values, dims=("y", "x"), coords=coords)
+        grids.append(grid_da.assign_coords(time=np.datetime64(time)))
+    cache = correlate.initialise_global_flow_cache()
+    object_tracks = {"current_grid": grids[1], "previous_grids": [grids[0]]}
+    object_tracks["global_flow_cache"] = cache
+    object_options = {"name": "cell", "dataset": "synthetic"}
+    bounding_box = {"row_min": 20, "row_max": 60, "col_min": 20, "col_max": 60}
+    args = [bounding_box, object_tracks, object_options, grid_options, 10]
+    flow, flow_box = correlate.get_global_flow(*args)
+    expected_flow, expected_box = correlate.get_flow(*args)
+    assert np.all(flow == expected_flow) and flow_box == expected_box
+    assert len(cache["flows"]) == 1
+    correlate.get_global_flow(*args)
+    assert len(cache["flows"]) == 1
+    object_tracks["current_grid"] = grids[2]
+    object_tracks["previous_grids"] = [grids[1]]
+    correlate.get_global_flow(*args)
+    assert len(cache["flows"]) == 1 and "00:20" in cache["time"][0]
+
+
+def test_labeled_mask():
+    """Test the mask inventory against the per object functions."""
+    mask, _, gridcell_area, grid_options = create_masks()
+    inventory = label.LabeledMask(mask, gridcell_area)
+    expected_ids = np.unique(mask.values)
+    assert np.all(inventory.ids == expected_ids[expected_ids != 0])
+    assert inventory.max_id == np.max(mask.values)
+    center_rows, center_cols = inventory.centers
+    for obj in inventory.ids:
+        args = [obj, mask, grid_options, gridcell_area]
+        row, col, area = thor_object.get_object_center(*args)
+        assert row == center_rows[obj] and col == center_cols[obj]
+        assert np.isclose(area, inventory.areas[obj])
+        assert inventory.get_bounding_box(obj) == box.get_bounding_box(obj, mask)
+        rows, cols = np.where(mask.values == obj)
+        inventory_rows, inventory_cols = inventory.get_indices(obj)
+        assert np.all(rows == inventory_rows) and np.all(cols == inventory_cols)
+        assert inventory.counts[obj] == len(rows)
+
+
+def test_relabel():
+    """Test lookup table relabelling against relabelling each label in turn."""
+    mask = create_masks()[0]
+    ids = np.unique(mask.values)
+    ids = ids[ids != 0]
+    rng = np.random.default_rng(0)
+    old_ids = rng.permutation(ids)[: len(ids) // 2]
+    new_ids = rng.permutation(np.arange(100, 100 + len(old_ids)))
+    expected = mask.values.copy()
+    for old_id, new_id in zip(old_ids, new_ids):
+        expected[mask.values == old_id] = new_id
+    relabelled = label.relabel(mask, old_ids, new_ids)
+    assert np.all(relabelled.values == expected)
+    assert relabelled.dims == mask.dims and np.all(mask.values <= ids.max())
+
+    # Missing values in masks read from file are preserved
+    float_mask = mask.astype(float).where(mask.y > 0)
+    dataset = xr.Dataset({"cell": float_mask, "anvil": mask})
+    relabelled = label.relabel(dataset, old_ids, new_ids)
+    assert np.array_equal(np.isnan(relabelled["cell"]), np.isnan(float_mask))
+    valid = ~np.isnan(float_mask.values)
+    assert np.all(relabelled["cell"].values[valid] == expected[valid])
+    assert np.all(relabelled["anvil"].values == expected)
+
+
+def test_update_object_record():
+    """Test universal id assignment against checking each previous id in turn."""
+    rng = np.random.default_rng(0)
+    object_tracks = {"object_count": 0}
+    object_tracks["object_record"] = thor_object.empty_object_record()
+    object_tracks["previous_object_records"] = state.initialise_history(2)
+    mask, _, gridcell_area, _ = create_masks()
+    inventory = label.LabeledMask(mask, gridcell_area)
+    total = inventory.max_id
+    object_tracks["current_mask_inventory"] = inventory
+    object_tracks["previous_mask_inventories"] = state.initialise_history(2)
+    for step in range(4):
+        object_tracks["previous_mask_inventories"].append(inventory)
+        previous_record = object_tracks["object_record"]
+        object_count = object_tracks["object_count"]
+        # Unmatched objects have matched current id 0
+        matched_current_ids = rng.integers(0, total + 1, size=total)
+        match_data = {"matched_current_ids": matched_current_ids}
+        if step == 0:
+            args = [match_data, object_tracks, {}]
+            thor_object.initialize_object_record(*args)
+            object_count += total
+        else:
+            thor_object.update_object_record(match_data, object_tracks, {})
+            expected = []
+            for previous_id in range(1, total + 1):
+                matched_ids = list(previous_record["matched_current_ids"])
+                if previous_id in matched_ids:
+                    index = matched_ids.index(previous_id)
+                    expected.append(previous_record["universal_ids"][index])
+                else:
+                    object_count += 1
+                    expected.append(object_count)
+            universal_ids = object_tracks["object_record"]["universal_ids"]
+            assert np.all(universal_ids == expected)
+        assert object_tracks["previous_object_records"][-1] is previous_record
+    assert object_tracks["object_count"] == object_count
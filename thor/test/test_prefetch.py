@@ -0,0 +1,87 @@
+"""Test background prefetching of input files."""
+
+import numpy as np
+import pytest
+import xarray as xr
+import thor.data.prefetch as prefetch
+import thor.instrument as instrument
+
+times = np.datetime64("2005-11-13T00:00:00") + np.timedelta64(10, "m") * np.arange(6)
+
+
+def convert(time, filepath, conversions, grid_options):
+    """Mock conversion of a file containing a single time."""
+    index = int(filepath.split("_")[1])
+    if time is not None and time != times[index]:
+        raise ValueError(f"{time} not in {filepath}")
+    conversions.append(index)
+    grid_options["shape"] = [index, index]
+    return xr.Dataset(coords={"time": [times[index]]}), index
+
+
+def test_prefetch():
+    """Test prefetched files are queued in order, and stale files discarded."""
+    dataset_options = {"filepaths": [f"file_{i}" for i in range(len(times))]}
+    dataset_options["prefetch_options"] = prefetch.prefetch_options(depth=2)
+    input_record = {"prefetcher": prefetch.initialise_prefetcher(dataset_options)}
+    queue = input_record["prefetcher"]["queue"]
+    grid_options = {"shape": None}
+    conversions = []
+
+    def get_converted(index, time=None):
+        input_record["current_file_index"] = index
+        time = times[index] if time is None else time
+        args = [time, input_record, dataset_options, grid_options, convert]
+        return prefetch.get_converted(*args, [conversions])
+
+    try:
+        assert get_converted(0)[1] == 0 and [entry[0] for entry in queue] == [1, 2]
+        # Background conversions update copies of the grid options
+        [entry[1].result() for entry in queue]
+        assert grid_options["shape"] == [0, 0]
+        # Prefetched conversions update the grid options once retrieved
+        assert get_converted(1)[1] == 1 and grid_options["shape"] == [1, 1]
+        assert [entry[0] for entry in queue] == [2, 3]
+        # Skipping a file discards its conversion
+        assert get_converted(3)[1] == 3 and [entry[0] for entry in queue] == [4, 5]
+        assert conversions == sorted(conversions)
+        # Prefetched files are converted without a time, so are checked on retrieval
+        with pytest.raises(ValueError):
+            get_converted(4, time=times[0])
+    finally:
+        prefetch.shutdown({"test": input_record})
+    assert len(queue) == 0
+
+
+def detect(dataset, grid_options):
+    """Mock detection of the objects in a converted file."""
+    time = dataset.time.values[0]
+    record = [time, 0, "cell", "detect_worker", 0.0, None]
+    return {(time, "cell"): grid_options["shape"]}, [record]
+
+
+def test_prefetch_detect():
+    """Test detections made by the prefetcher are stored and their stages merged."""
+    dataset_options = {"filepaths": [f"file_{i}" for i in range(len(times))]}
+    dataset_options["prefetch_options"] = prefetch.prefetch_options(2, workers=2)
+    prefetcher = prefetch.initialise_prefetcher(dataset_options)
+    prefetcher["detect"] = detect
+    input_record = {"prefetcher": prefetcher}
+    grid_options = {"shape": None}
+
+    instrument.start("time")
+    try:
+        for index in range(3):
+            input_record["current_file_index"] = index
+            args = [times[index], input_record, dataset_options, grid_options]
+            prefetch.get_converted(*args, convert, [[]])
+            detections = input_record["detections"]
+            if index == 0:
+                # The first file is converted synchronously, so is not detected ahead
+                assert detections is None
+            else:
+                assert detections == {(times[index], "cell"): [index, index]}
+    finally:
+        prefetch.shutdown({"test": input_record})
+        records = instrument.stop()
+    assert records["stage"].tolist().count("detect_worker") == 2
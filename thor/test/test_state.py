@@ -0,0 +1,51 @@
+"""Test the previous state buffers."""
+
+import copy
+import pickle
+import pytest
+import numpy as np
+import xarray as xr
+import thor.state as state
+
+
+def test_rotate():
+    """Test states are rotated by reference and frozen once previous."""
+    masks = [xr.DataArray(np.full((3, 4), i), dims=("y", "x")) for i in range(4)]
+    record = {"current_mask": None, "previous_masks": state.initialise_history(2)}
+    for mask in masks:
+        state.rotate(record, "current_mask", mask)
+    assert record["current_mask"] is masks[-1]
+    assert all(a is b for a, b in zip(record["previous_masks"], masks[1:3]))
+    assert record["current_mask"].values.flags.writeable
+    with pytest.raises(ValueError):
+        record["previous_masks"][-1].values[0, 0] = 1
+    # Previous states must be copied before being modified
+    mask = record["previous_masks"][-1].copy()
+    mask.values[0, 0] = 1
+    assert masks[2].values[0, 0] == 2
+    grid = xr.Dataset({"a": masks[0].copy(), "b": masks[1].copy()})
+    state.freeze(grid)
+    assert not any(grid[v].values.flags.writeable for v in grid.data_vars)
+
+
+def test_records():
+    """Test the slotted records behave like the dictionaries they replace."""
+    object_tracks = state.ObjectTracks(name="cell", object_count=0)
+    object_tracks["custom"] = [1]
+    assert "gridcell_area" not in object_tracks.keys()
+    assert object_tracks.get("gridcell_area") is None
+    assert object_tracks.pop("pending_detection", None) is None
+    object_tracks["gridcell_area"] = 2.5
+    assert object_tracks.gridcell_area == 2.5
+    assert list(object_tracks) == ["name", "object_count", "gridcell_area", "custom"]
+    assert not hasattr(object_tracks, "__dict__")
+    restored = pickle.loads(pickle.dumps(object_tracks))
+    assert isinstance(restored, state.ObjectTracks) and restored == object_tracks
+    del object_tracks["gridcell_area"]
+    with pytest.raises(KeyError):
+        object_tracks["gridcell_area"]
+    assert object_tracks.pop("custom") == [1] and "custom" not in object_tracks.keys()
+    copied = copy.copy(restored)
+    copied["name"] = "anvil"
+    assert restored["name"] == "cell" and "anvil" in copied.values()
+    assert copied.keys() == {"name", "object_count", "gridcell_area", "custom"}
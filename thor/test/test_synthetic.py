@@ -138,3 +138,49 @@ def test_synthetic():
         visualize_options,
         output_directory=output_directory,
     )
+
+
+def test_synthetic_scene():
+    """Test footprint rasterisation and the evolution of synthetic objects."""
+    start = "2005-11-13T00:00:00"
+    time = "2005-11-13T00:10:00"
+    lat = np.arange(-14.0, -10.0 + 0.025 / 2, 0.025).round(3).tolist()
+    lon = np.arange(129.0, 133.0 + 0.025 / 2, 0.025).round(3).tolist()
+    grid_options = grid.create_options(name="geographic", latitude=lat, longitude=lon)
+    grid.check_options(grid_options)
+
+    rng = np.random.default_rng(0)
+    objects = []
+    for i in range(8):
+        properties = {"center_latitude": rng.uniform(-14, -10)}
+        properties.update({"center_longitude": rng.uniform(129, 133)})
+        properties.update({"direction": rng.uniform(0, 2 * np.pi), "speed": 10})
+        properties.update({"eccentricity": rng.uniform(0.3, 1.5)})
+        properties.update({"orientation": rng.uniform(0, np.pi)})
+        objects.append(synthetic.create_object(start, **properties))
+
+    # Rasterising within each object's footprint should match rasterising everywhere
+    input_record = {}
+    dataset_options = synthetic.synthetic_data_options(starting_objects=objects)
+    synthetic.update_dataset(time, input_record, None, dataset_options, grid_options)
+    full_ds = synthetic.create_dataset(time, grid_options)
+    for obj in input_record["objects"]:
+        full_ds = synthetic.add_reflectivity(full_ds, **obj)
+    reflectivity = input_record["dataset"]["reflectivity"].values
+    assert np.array_equal(reflectivity, full_ds["reflectivity"].values, equal_nan=True)
+    assert objects[0]["time"] == start
+
+    # Objects all split, then nearby objects merge
+    evolution_options = synthetic.create_evolution_options(split_probability=1)
+    split_objects = synthetic.evolve_objects(time, objects, evolution_options)
+    assert len(split_objects) == 2 * len(objects)
+    evolution_options = synthetic.create_evolution_options(merge_distance=1e3)
+    merged_objects = synthetic.evolve_objects(time, objects, evolution_options)
+    assert len(merged_objects) == len(objects) // 2
+    area = sum(obj["horizontal_radius"] ** 2 for obj in objects)
+    merged_area = sum(obj["horizontal_radius"] ** 2 for obj in merged_objects)
+    assert np.isclose(area, merged_area)
+
+    # Objects are removed at the end of their lifetime
+    mortal_object = synthetic.create_object(start, -12, 131, 0, 10, lifetime=300)
+    assert synthetic.advect_objects(time, [mortal_object]) == []
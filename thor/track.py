@@ -1,15 +1,19 @@
 """Track storm objects in a dataset."""
 
-from collections import deque
-import copy
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
 from thor.log import setup_logger
 import thor.option as option
 import thor.data.dispatch as dispatch
+import thor.data.prefetch as prefetch
 import thor.detect.detect as detect
 import thor.group.group as group
 import thor.visualize as visualize
 import thor.match.match as match
+import thor.match.correlate as correlate
+import thor.state as state
+import thor.instrument as instrument
 from thor.config import get_outputs_directory
 from thor.utils import now_str, hash_dictionary, format_time
 import thor.write as write
@@ -39,7 +43,7 @@ def initialise_boilerplate_input_record(name, dataset_options):
     Initialise the tag input record dictionary.
     """
 
-    input_record = {}
+    input_record = state.InputRecord()
     input_record["name"] = name
     input_record["current_file_index"] = -1
     input_record["dataset"] = None
@@ -60,18 +64,20 @@ def initialise_track_input_record(name, dataset_options):
     input_record = initialise_boilerplate_input_record(name, dataset_options)
     input_record["current_grid"] = None
     deque_length = dataset_options["deque_length"]
-    input_record["previous_grids"] = deque([None] * deque_length, deque_length)
+    input_record["previous_grids"] = state.initialise_history(deque_length)
 
     # Initialize deques of domain masks and boundary coordinates. For datasets like
     # gridrad the domain mask is different for objects identified at different levels.
     input_record["current_domain_mask"] = None
-    input_record["previous_domain_masks"] = deque([None] * deque_length, deque_length)
+    input_record["previous_domain_masks"] = state.initialise_history(deque_length)
     input_record["current_boundary_mask"] = None
-    input_record["previous_boundary_masks"] = deque([None] * deque_length, deque_length)
+    input_record["previous_boundary_masks"] = state.initialise_history(deque_length)
     input_record["current_boundary_coordinates"] = None
-    input_record["previous_boundary_coordinates"] = deque(
-        [None] * deque_length, deque_length
+    input_record["previous_boundary_coordinates"] = state.initialise_history(
+        deque_length
     )
+    # Optionally convert upcoming files in the background
+    input_record["prefetcher"] = prefetch.initialise_prefetcher(dataset_options)
 
     return input_record
 
@@ -82,31 +88,39 @@ initialise_input_record_dispatcher = {
 }
 
 
-def initialise_object_tracks(object_options):
+def initialise_object_tracks(object_options, global_flow_cache=None):
     """
     Initialise the object tracks dictionary.
 
     parent_ds holds the xarray metadata associated with the current file.
     current_ds holds the loaded xarray dataset from which grids are extracted.
     current_grid holds the current grid on which objects at a given time are detected.
+    current_mask_inventory holds the cached ids, areas, centers and bounding boxes of
+    the objects in current_mask.
+    global_flow_cache is shared by all objects, so global flows calculated on the same
+    grid at the same time step are only calculated once.
 
     """
-    object_tracks = {}
+    object_tracks = state.ObjectTracks()
     object_tracks["name"] = object_options["name"]
     object_tracks["object_count"] = 0
     object_tracks["tracks"] = []
     object_tracks["current_grid"] = None
     object_tracks["current_time_interval"] = None
     deque_length = object_options["deque_length"]
-    object_tracks["previous_time_interval"] = deque([None] * deque_length, deque_length)
+    object_tracks["previous_time_interval"] = state.initialise_history(deque_length)
     object_tracks["current_time"] = None
-    object_tracks["previous_times"] = deque([None] * deque_length, deque_length)
-    object_tracks["previous_grids"] = deque([None] * deque_length, deque_length)
+    object_tracks["previous_times"] = state.initialise_history(deque_length)
+    object_tracks["previous_grids"] = state.initialise_history(deque_length)
     object_tracks["current_mask"] = None
-    object_tracks["previous_masks"] = deque([None] * deque_length, deque_length)
+    object_tracks["previous_masks"] = state.initialise_history(deque_length)
+    # Inventories of the objects in the current and previous masks
+    object_tracks["current_mask_inventory"] = None
+    object_tracks["previous_mask_inventories"] = state.initialise_history(deque_length)
 
     if object_options["tracking"]["method"] is not None:
-        match.initialise_match_records(object_tracks, object_options)
+        args = [object_tracks, object_options, global_flow_cache]
+        match.initialise_match_records(*args)
     if object_options["mask_options"]["save"]:
         object_tracks["mask_list"] = []
 
@@ -117,8 +131,9 @@ def initialise_object_tracks(object_options):
         # step.
         current_attributes = attribute.utils.initialize_attributes(object_options)
         object_tracks["current_attributes"] = current_attributes
-        attributes = attribute.utils.initialize_attributes(object_options)
-        object_tracks["attributes"] = attributes
+        # The attributes dict accumulates attributes in typed columns until written
+        initialize = attribute.utils.initialize_attributes
+        object_tracks["attributes"] = initialize(object_options, columnar=True)
 
     object_tracks["last_write_time"] = None
 
@@ -142,13 +157,15 @@ def initialise_tracks(track_options, data_options):
     """
 
     tracks = []
+    global_flow_cache = correlate.initialise_global_flow_cache()
     for level_options in track_options:
         level_tracks = {obj: {} for obj in level_options.keys()}
         for obj in level_options.keys():
             dataset = level_options[obj]["dataset"]
             if dataset is not None and dataset not in data_options.keys():
                 raise ValueError(f"{dataset} dataset not in data_options.")
-            obj_tracks = initialise_object_tracks(level_options[obj])
+            args = [level_options[obj], global_flow_cache]
+            obj_tracks = initialise_object_tracks(*args)
             level_tracks[obj] = obj_tracks
         tracks.append(level_tracks)
     return tracks
@@ -167,6 +184,33 @@ def consolidate_options(data_options, grid_options, track_options, visualize_opt
     return consolidated_options
 
 
+def initialise_detect_ahead(
+    track_input_records, track_options, data_options, workers, instrument_mode=None
+):
+    """
+    Detect objects in upcoming files as they are converted by the prefetchers of the
+    track datasets, so detection runs ahead of the tracking loop. Datasets converted
+    from files without prefetch options are given a prefetcher of workers processes.
+    Only the flattened grids and masks are returned by the workers, rather than the
+    full grids being pickled to them.
+    """
+    for name, input_record in track_input_records.items():
+        dataset_options = data_options[name]
+        if name not in dispatch.prefetch_datasets:
+            continue
+        if "filepaths" not in dataset_options.keys():
+            continue
+        if input_record.get("prefetcher") is None:
+            options = prefetch.prefetch_options(workers, "process", workers)
+            options = {"prefetch_options": options}
+            input_record["prefetcher"] = prefetch.initialise_prefetcher(options)
+        kwargs = {"dataset_name": name, "field": dataset_options["fields"][0]}
+        kwargs["grid_from_dataset"] = dispatch.grid_from_dataset_dispatcher[name]
+        kwargs["track_options"] = track_options
+        kwargs["instrument_mode"] = instrument_mode
+        input_record["prefetcher"]["detect"] = partial(detect.detect_ahead, **kwargs)
+
+
 def simultaneous_track(
     times,
     data_options,
@@ -174,6 +218,10 @@ def simultaneous_track(
     track_options,
     visualize_options=None,
     output_directory=None,
+    detection_workers=None,
+    checkpoint=False,
+    resume=False,
+    instrument_mode=None,
 ):
     """
     Track objects across the hierachy simultaneously.
@@ -188,6 +236,25 @@ def simultaneous_track(
         Dictionary containing the grid options.
     track_options : dict
         Dictionary containing the track options.
+    detection_workers : int, optional
+        If provided, detect objects ahead of the tracking loop. For datasets converted
+        from files, e.g. gridrad and cpol, objects are detected in each upcoming file
+        by the process that converts it; see initialise_detect_ahead. Objects in other
+        datasets are detected in a pool of this many threads, submitted as soon as the
+        input records for a time step are updated. The results are consumed in order
+        by the sequential matching of each level. Default is None, i.e. objects are
+        detected serially.
+    checkpoint : bool, optional
+        If True, checkpoint the tracking state to output_directory after each time
+        step in which objects are written to file. Default is False.
+    resume : bool, optional
+        If True, resume the run checkpointed in output_directory, continuing from the
+        first of times after the checkpointed time. Default is False.
+    instrument_mode : str, optional
+        If "time", record the wall time of each stage of the tracking loop, for each
+        time step, level and object. If "memory", also record the peak memory of each
+        stage using tracemalloc. The records, and a summary, are written to the
+        records directory of output_directory. Default is None, i.e. no records.
 
     Returns
     -------
@@ -201,50 +268,93 @@ def simultaneous_track(
     logger.info("Beginning simultaneous tracking.")
     option.check_options(track_options)
     dispatch.check_data_options(data_options)
-    tracks = initialise_tracks(track_options, data_options)
-    input_records = initialise_input_records(data_options)
+    previous_time = None
+    if resume:
+        if output_directory is None:
+            raise ValueError("output_directory required to resume a run.")
+        saved = write.checkpoint.load(output_directory)
+        tracks, input_records = saved["tracks"], saved["input_records"]
+        for name, input_record in input_records["track"].items():
+            prefetcher = prefetch.initialise_prefetcher(data_options[name])
+            input_record["prefetcher"] = prefetcher
+        previous_time = saved["time"]
+        times = [time for time in times if time > previous_time]
+        logger.info(f"Resuming from {format_time(previous_time, filename_safe=False)}.")
+    else:
+        tracks = initialise_tracks(track_options, data_options)
+        input_records = initialise_input_records(data_options)
 
     consolidated_options = consolidate_options(
         track_options, data_options, grid_options, visualize_options
     )
 
-    previous_time = None
-    for time in times:
-
-        if output_directory is None:
-            consolidated_options["start_time"] = str(time)
-            hash_str = hash_dictionary(consolidated_options)
-            output_directory = (
-                get_outputs_directory() / f"runs/{now_str()}_{hash_str[:8]}"
-            )
-
-        logger.info(f"Processing {format_time(time, filename_safe=False)}.")
-        args = [time, input_records["track"], track_options, data_options, grid_options]
-        args += [output_directory]
-        dispatch.update_track_input_records(*args)
-        args = [previous_time, input_records["tag"], track_options, data_options]
-        args += [grid_options]
-        dispatch.update_tag_input_records(*args)
-        # loop over levels
-        for level_index in range(len(track_options)):
-            logger.info("Processing hierarchy level %s.", level_index)
-            track_level_args = [time, level_index, tracks, input_records]
-            track_level_args += [data_options, grid_options, track_options]
-            track_level_args += [visualize_options, output_directory]
-            track_level(*track_level_args)
-
-        previous_time = time
-
-    # Write final data to file
-    write.mask.write_final(tracks, track_options, output_directory)
-    write.attribute.write_final(tracks, track_options, output_directory)
-    write.filepath.write_final(input_records["track"], output_directory)
-    # Aggregate files previously written to file
-    write.mask.aggregate(track_options, output_directory)
-    write.attribute.aggregate(track_options, output_directory)
-    write.filepath.aggregate(input_records["track"], output_directory)
-    # Animate the relevant figures
-    visualize.visualize.animate_all(visualize_options, output_directory)
+    if instrument_mode is not None:
+        instrument.start(instrument_mode)
+
+    detection_executor = None
+    try:
+        if detection_workers is not None:
+            args = [input_records["track"], track_options, data_options]
+            initialise_detect_ahead(*args, detection_workers, instrument_mode)
+            detection_executor = ThreadPoolExecutor(max_workers=detection_workers)
+
+        for time in times:
+
+            if output_directory is None:
+                consolidated_options["start_time"] = str(time)
+                hash_str = hash_dictionary(consolidated_options)
+                output_directory = (
+                    get_outputs_directory() / f"runs/{now_str()}_{hash_str[:8]}"
+                )
+
+            logger.info(f"Processing {format_time(time, filename_safe=False)}.")
+            instrument.set_context(time=time, level=None, object=None)
+            with instrument.stage("ingest"):
+                args = [time, input_records["track"], track_options, data_options]
+                args += [grid_options, output_directory]
+                dispatch.update_track_input_records(*args)
+                if detection_executor is not None:
+                    args = [time, detection_executor, input_records["track"], tracks]
+                    args += [track_options, instrument_mode]
+                    detect.submit_detections(*args)
+                args = [previous_time, input_records["tag"], track_options]
+                args += [data_options, grid_options]
+                dispatch.update_tag_input_records(*args)
+            write_times = write.checkpoint.get_write_times(tracks, input_records)
+            # loop over levels
+            for level_index in range(len(track_options)):
+                logger.info("Processing hierarchy level %s.", level_index)
+                track_level_args = [time, level_index, tracks, input_records]
+                track_level_args += [data_options, grid_options, track_options]
+                track_level_args += [visualize_options, output_directory]
+                track_level(*track_level_args)
+
+            previous_time = time
+            # Checkpoint once the data written this time step is on disk
+            new_write_times = write.checkpoint.get_write_times(tracks, input_records)
+            if checkpoint and new_write_times != write_times:
+                write.checkpoint.save(time, tracks, input_records, output_directory)
+
+        # Write final data to file
+        write.mask.write_final(tracks, track_options, output_directory)
+        write.attribute.write_final(tracks, track_options, output_directory)
+        write.filepath.write_final(input_records["track"], output_directory)
+        # Aggregate files previously written to file
+        write.mask.aggregate(track_options, output_directory)
+        write.attribute.aggregate(track_options, output_directory)
+        write.filepath.aggregate(input_records["track"], output_directory)
+        # Animate the relevant figures
+        visualize.visualize.animate_all(visualize_options, output_directory)
+        instrument.write(instrument.stop(), output_directory)
+        if checkpoint:
+            write.checkpoint.remove(output_directory)
+    finally:
+        # Release the worker pools, and stop recording and any memory tracing, even if
+        # a time step fails
+        prefetch.shutdown(input_records["track"])
+        if detection_executor is not None:
+            detection_executor.shutdown(wait=True, cancel_futures=True)
+        instrument.stop()
 
 
 def track_level(
@@ -274,6 +384,7 @@ def track_level(
         track_object_args += [visualize_options, output_directory]
         return track_object_args
 
+    instrument.set_context(level=level_index)
     for obj in level_tracks.keys():
         track_object_args = get_track_object_args(obj, level_options)
         track_object(*track_object_args)
@@ -301,31 +412,36 @@ def track_object(
 
     # Update current and previous time
     if object_tracks["current_time"] is not None:
-        current_time = copy.deepcopy(object_tracks["current_time"])
-        object_tracks["previous_times"].append(current_time)
+        object_tracks["previous_times"].append(object_tracks["current_time"])
     object_tracks["current_time"] = time
 
+    instrument.set_context(object=obj)
     # Write existing data to file if necessary
     if write.utils.write_interval_reached(time, object_tracks, object_options):
-        write.mask.write(object_tracks, object_options, output_directory)
-        write.attribute.write(object_tracks, object_options, output_directory)
+        with instrument.stage("write"):
+            write.mask.write(object_tracks, object_options, output_directory)
+            write.attribute.write(object_tracks, object_options, output_directory)
 
     # Detect objects at time
     get_objects = get_objects_dispatcher.get(object_options["method"])
     get_objects_args = [track_input_records, tracks, level_index, obj, dataset_options]
     get_objects_args += [object_options, grid_options]
-    get_objects(*get_objects_args)
+    with instrument.stage(object_options["method"]):
+        get_objects(*get_objects_args)
 
-    match.match(object_tracks, object_options, grid_options)
+    with instrument.stage("match"):
+        match.match(object_tracks, object_options, grid_options)
 
     # Visualize the operation of the algorithm
     visualize_args = [track_input_records, tracks, level_index, obj, track_options]
     visualize_args += [grid_options, visualize_options, output_directory]
-    visualize.runtime.visualize(*visualize_args)
+    with instrument.stage("visualize"):
+        visualize.runtime.visualize(*visualize_args)
     # Update the lists used to periodically write data to file
     if object_tracks["previous_times"][-1] is not None:
         args = [time, input_records, object_tracks, object_options, grid_options]
-        attribute.attribute.record(*args)
+        with instrument.stage("attribute"):
+            attribute.attribute.record(*args)
     write.mask.update(object_tracks, object_options)
 
 
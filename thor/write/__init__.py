@@ -2,3 +2,4 @@ from . import mask
 from . import attribute
 from . import utils
 from . import filepath
+from . import checkpoint
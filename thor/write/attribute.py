@@ -120,8 +120,8 @@ def write(object_tracks, object_options, output_directory):
         raise ValueError(message)
 
     write_func(object_tracks, object_options, output_directory)
-    # Reset attributes lists after writing
-    object_tracks["attributes"] = utils.initialize_attributes(object_options)
+    # Reset attributes columns after writing, keeping their allocated capacity
+    utils.reset_attributes(object_tracks["attributes"])
 
 
 def write_final(tracks, track_options, output_directory):
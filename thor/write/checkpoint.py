@@ -0,0 +1,79 @@
+"""
+Functions for checkpointing the tracking state. Checkpoints are written after each time
+step in which objects were written to file, so the written outputs and the
+checkpointed state describe the same point in the run. Resuming from a checkpoint then
+reproduces the ids and outputs of an uninterrupted run.
+"""
+
+import os
+import gzip
+import pickle
+from pathlib import Path
+from thor.log import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def get_filepath(output_directory):
+    """Get the checkpoint filepath of a run."""
+    return Path(output_directory) / "checkpoint.pkl.gz"
+
+
+def get_write_times(tracks, input_records):
+    """Get the last write times of all objects and track datasets."""
+    write_times = []
+    for level_tracks in tracks:
+        write_times += [level_tracks[obj]["last_write_time"] for obj in level_tracks]
+    track_input_records = input_records["track"]
+    write_times += [
+        track_input_records[name].get("last_write_time") for name in track_input_records
+    ]
+    return write_times
+
+
+def save(time, tracks, input_records, output_directory):
+    """
+    Save the tracking state after processing time. The state is pickled and compressed,
+    then moved into place, so an interrupted save leaves the previous checkpoint intact.
+    """
+    saved_records = {}
+    for use in input_records.keys():
+        saved_records[use] = {}
+        for name, input_record in input_records[use].items():
+            # Shallow copy the record so the prefetcher, and the detections it ran
+            # ahead, can be dropped from the copy; detection is rerun on resuming
+            input_record = type(input_record)(input_record)
+            if "prefetcher" in input_record.keys():
+                input_record["prefetcher"] = None
+            if "detections" in input_record.keys():
+                input_record["detections"] = None
+            saved_records[use][name] = input_record
+    checkpoint = {"time": time, "tracks": tracks, "input_records": saved_records}
+
+    filepath = get_filepath(output_directory)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    temporary_filepath = filepath.with_suffix(".tmp")
+    logger.info(f"Checkpointing tracking state at {time} to {filepath}.")
+    with gzip.open(temporary_filepath, "wb", compresslevel=1) as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_filepath, filepath)
+
+
+def load(output_directory):
+    """
+    Load the tracking state checkpointed in output_directory. The returned dictionary
+    contains the "time" of the last processed time step, and the "tracks" and
+    "input_records" after that time step. Prefetchers are not checkpointed, so must be
+    restarted.
+    """
+    filepath = get_filepath(output_directory)
+    if not filepath.exists():
+        raise FileNotFoundError(f"No checkpoint found at {filepath}.")
+    logger.info(f"Loading tracking state from {filepath}.")
+    with gzip.open(filepath, "rb") as file:
+        return pickle.load(file)
+
+
+def remove(output_directory):
+    """Remove the checkpoint of a completed run."""
+    get_filepath(output_directory).unlink(missing_ok=True)